@@ -1,14 +1,31 @@
 #!/usr/bin/env python3
 
+import argparse
+import ast
+import ctypes
+import hashlib
+import http.client
 import re
+import select
 import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import uuid
 from glob import glob
 import os
 import stat
 import json
+import py_compile
 import urllib.request
 import urllib.error as urllib_error
+import zipapp
+from concurrent.futures import ThreadPoolExecutor
+from importlib.machinery import EXTENSION_SUFFIXES, PathFinder
+from urllib.parse import urlsplit
 
 def parse_scriptlet_url(include_path: str):
 	"""
@@ -28,6 +45,10 @@ def parse_scriptlet_url(include_path: str):
 					source = line[len(lookup)+1:].strip()
 					break
 
+	if source.startswith('url:'):
+		# Any HTTP(S) mirror laid out like the scriptlets directory, eg: url:https://mirror.example/scriptlets
+		return source[4:].rstrip('/') + '/' + include_path
+
 	source_data = source.split(':')
 
 	if source_data[0] == 'github':
@@ -88,6 +109,508 @@ def maybe_download_scriptlet(filename, url):
 		return False
 
 
+def get_scriptlet_includes(file: str) -> list:
+	"""
+	Get the scriptlets a file includes directly, without parsing it
+
+	Matches the include lines Script.parse() handles; '# script:' files are local and never downloaded.
+
+	:param file:
+	:return:
+	"""
+	includes = []
+	is_python = file.endswith('.py')
+	with open(file, 'r') as f:
+		for line in f:
+			if line.startswith('# scriptlet:'):
+				includes.append(line[12:].strip())
+			elif line.startswith('from scriptlets.') and is_python and ' import' in line:
+				line = line[16:].strip()
+				includes.append(line[:line.index(' import')].replace('.', '/') + '.py')
+			elif line.startswith('# import:') and is_python:
+				includes.append(line[9:].strip())
+	return includes
+
+
+def get_script_includes(file: str) -> list:
+	"""
+	Get the '# script:' files a file includes directly, (relative to scripts/)
+
+	:param file:
+	:return:
+	"""
+	includes = []
+	with open(file, 'r') as f:
+		for line in f:
+			if line.startswith('# script:'):
+				includes.append(line[9:].strip())
+	return includes
+
+
+def get_dependencies(file: str) -> list:
+	"""
+	Get every file a script is built from; the script itself, its scriptlets, (recursively), and its '# script:' files
+
+	'# script:' files are inserted as-is so their own contents are never followed.
+
+	:param file:
+	:return:
+	"""
+	dependencies = []
+	pending = [(file, True)]
+	while len(pending) > 0:
+		path, follow = pending.pop(0)
+		if path in dependencies:
+			continue
+		dependencies.append(path)
+		if follow and os.path.exists(path):
+			pending += [(os.path.join('scriptlets', i), True) for i in get_scriptlet_includes(path)]
+			pending += [(os.path.join('scripts', i), False) for i in get_script_includes(path)]
+	return dependencies
+
+
+def write_if_changed(file: str, content: str) -> bool:
+	"""
+	Write a file only if its content differs, (leaves the modification time alone otherwise)
+
+	:param file:
+	:param content:
+	:return: True if the file was written
+	"""
+	if os.path.exists(file):
+		with open(file, 'r', encoding='utf-8') as f:
+			if f.read() == content:
+				return False
+	with open(file, 'w', encoding='utf-8') as f:
+		f.write(content)
+	return True
+
+
+class BuildCache:
+	"""
+	Content hashes of the inputs to every output from the last build, used by --incremental
+
+	Each script is keyed by the hash of its source plus all its dependencies, (see get_dependencies),
+	and stores its parsed metadata so the project docs can be generated without parsing it again.
+	Changes to compile.py itself invalidate the whole cache.
+	"""
+	def __init__(self, path: str):
+		self.path = path
+		self._hashes = {}
+		self.version = self.hash_file(os.path.abspath(__file__))
+		self.scripts = {}
+		"""
+		{source file: {'key': ..., 'outputs': [...], 'script': Script.ascache()}}
+		"""
+		self.docs = None
+		"""
+		Key of the inputs of README.md, community_scripts.json, and warlock.yaml
+		"""
+
+		if os.path.exists(self.path):
+			with open(self.path, 'r') as f:
+				data = json.load(f)
+			if data.get('version') == self.version:
+				self.scripts = data.get('scripts', {})
+				self.docs = data.get('docs')
+
+	def hash_file(self, file: str) -> str:
+		"""
+		Get the SHA-256 of a file, (memoized; scriptlets are shared by many scripts)
+
+		:param file:
+		:return: hex digest, or 'missing' if the file does not exist
+		"""
+		if file not in self._hashes:
+			if os.path.exists(file):
+				with open(file, 'rb') as f:
+					self._hashes[file] = hashlib.sha256(f.read()).hexdigest()
+			else:
+				self._hashes[file] = 'missing'
+		return self._hashes[file]
+
+	def get_key(self, file: str, options: str = '') -> str:
+		"""
+		Get the key of a script's inputs
+
+		:param file:
+		:param options: Any build options which change the outputs
+		:return:
+		"""
+		h = hashlib.sha256(options.encode())
+		for dependency in get_dependencies(file):
+			h.update(('%s:%s\n' % (dependency, self.hash_file(dependency))).encode())
+		return h.hexdigest()
+
+	def is_current(self, file: str, key: str) -> bool:
+		"""
+		Check if a script's outputs were built from the same inputs and are all still there
+
+		:param file:
+		:param key:
+		:return:
+		"""
+		entry = self.scripts.get(file)
+		return (
+			entry is not None and
+			entry['key'] == key and
+			all([os.path.exists(output) for output in entry['outputs']])
+		)
+
+	def refresh(self):
+		"""
+		Forget the memoized file hashes, (for --watch, after files have changed)
+		:return:
+		"""
+		self._hashes = {}
+
+	def set(self, file: str, key: str, outputs: list, script: 'Script'):
+		# Round-trip through JSON so the stored metadata is a copy, (the docs sort lists in place)
+		self.scripts[file] = {
+			'key': key,
+			'outputs': outputs,
+			'script': json.loads(json.dumps(script.ascache())),
+		}
+
+	def remove_stale(self, files: list):
+		"""
+		Delete the outputs of scripts whose source no longer exists
+
+		:param files: Current source files
+		:return:
+		"""
+		for file in [f for f in self.scripts if f not in files]:
+			for output in self.scripts[file]['outputs']:
+				if os.path.exists(output):
+					print('Removing stale %s' % output)
+					os.remove(output)
+			del self.scripts[file]
+
+	def save(self):
+		with open(self.path, 'w') as f:
+			json.dump({'version': self.version, 'scripts': self.scripts, 'docs': self.docs}, f)
+
+
+class FileWatcher:
+	"""
+	Report files changed below a set of directories, using inotify, (Linux only)
+
+	New subdirectories are watched as they are created.
+	"""
+	IN_CLOSE_WRITE = 0x00000008
+	IN_MOVED_FROM = 0x00000040
+	IN_MOVED_TO = 0x00000080
+	IN_CREATE = 0x00000100
+	IN_DELETE = 0x00000200
+	IN_IGNORED = 0x00008000
+	IN_ISDIR = 0x40000000
+
+	def __init__(self, directories: list):
+		self._libc = ctypes.CDLL(None, use_errno=True)
+		if not hasattr(self._libc, 'inotify_init1'):
+			raise OSError('inotify is not available on this system')
+		self.fd = self._libc.inotify_init1(os.O_CLOEXEC)
+		if self.fd < 0:
+			raise OSError(ctypes.get_errno(), 'Unable to initialize inotify')
+		self.watches = {}
+		"""
+		{watch descriptor: directory}
+		"""
+		for directory in directories:
+			self.add_tree(directory)
+
+	def add_tree(self, directory: str):
+		"""
+		Watch a directory and all its subdirectories
+		:param directory:
+		:return:
+		"""
+		mask = (
+			self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO |
+			self.IN_CREATE | self.IN_DELETE
+		)
+		for root, dirs, files in os.walk(directory):
+			wd = self._libc.inotify_add_watch(self.fd, root.encode(), mask)
+			if wd < 0:
+				raise OSError(ctypes.get_errno(), 'Unable to watch %s' % root)
+			self.watches[wd] = root
+
+	def read(self, timeout: float = None) -> set:
+		"""
+		Wait for changes and return the paths of the files changed, (written, moved, or deleted)
+
+		:param timeout: Seconds to wait, or None to wait forever
+		:return: Empty set if nothing changed before the timeout
+		"""
+		changed = set()
+		ready, _, _ = select.select([self.fd], [], [], timeout)
+		if not ready:
+			return changed
+
+		data = os.read(self.fd, 65536)
+		offset = 0
+		while offset < len(data):
+			# struct inotify_event: int wd, uint32 mask, uint32 cookie, uint32 len, char name[len]
+			wd, mask, cookie, length = struct.unpack_from('iIII', data, offset)
+			name = data[offset + 16:offset + 16 + length].rstrip(b'\0').decode()
+			offset += 16 + length
+
+			if mask & self.IN_IGNORED:
+				self.watches.pop(wd, None)
+				continue
+			if wd not in self.watches:
+				continue
+			path = os.path.join(self.watches[wd], name)
+			if mask & self.IN_ISDIR:
+				if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+					self.add_tree(path)
+			elif not mask & self.IN_CREATE:
+				# Creating a file is followed by a write, which is what gets reported
+				changed.add(path)
+		return changed
+
+	def close(self):
+		os.close(self.fd)
+
+
+class ScriptletFetcher:
+	"""
+	Download or revalidate scriptlets concurrently over pooled keep-alive connections
+
+	The include graph is resolved one level at a time, (a scriptlet must be on disk before its own
+	includes are known), and every scriptlet in a level is fetched at once.
+	Script._parse_include skips the network for anything already fetched here.
+	"""
+	def __init__(self, workers: int = 8, timeout: int = 5):
+		self.workers = workers
+		self.timeout = timeout
+		self.fetched = set()
+		"""
+		Scriptlet files which have been checked against their source during this build
+		"""
+		self._pool = {}
+		"""
+		Idle connections, keyed by (scheme, host)
+		"""
+		self._lock = threading.Lock()
+
+	def resolve(self, files: list):
+		"""
+		Fetch every scriptlet included by the given files, and everything those scriptlets include
+
+		:param files:
+		:return: All scriptlets included, (directly or not)
+		"""
+		seen = set()
+		pending = [include for file in files for include in get_scriptlet_includes(file)]
+		while len(pending) > 0:
+			level = [include for include in dict.fromkeys(pending) if include not in seen]
+			seen.update(level)
+			self.fetch(level)
+
+			pending = []
+			for include in level:
+				file = os.path.join('scriptlets', include)
+				if os.path.exists(file):
+					pending += get_scriptlet_includes(file)
+		return seen
+
+	def fetch_missing(self, include: str):
+		"""
+		Fetch a scriptlet found while parsing which resolve() did not see
+		:param include:
+		:return:
+		"""
+		maybe_download_scriptlet(os.path.join('scriptlets', include), parse_scriptlet_url(include))
+
+	def fetch(self, includes: list):
+		"""
+		Download or revalidate a list of scriptlets concurrently
+
+		:param includes:
+		:return:
+		"""
+		jobs = []
+		for include in includes:
+			url = parse_scriptlet_url(include)
+			if url is not None:
+				jobs.append((os.path.join('scriptlets', include), url))
+
+		with ThreadPoolExecutor(max_workers=self.workers) as executor:
+			results = executor.map(lambda job: self._fetch_one(*job), jobs)
+			for (filename, url), result in zip(jobs, results):
+				if result:
+					self.fetched.add(filename)
+
+	def _acquire(self, scheme: str, host: str, fresh: bool = False) -> http.client.HTTPConnection:
+		"""
+		Take an idle keep-alive connection to a host from the pool, or open a new one
+
+		:param scheme:
+		:param host:
+		:param fresh: Always open a new connection
+		:return:
+		"""
+		with self._lock:
+			idle = self._pool.get((scheme, host), [])
+			if len(idle) > 0 and not fresh:
+				return idle.pop()
+		if scheme == 'https':
+			return http.client.HTTPSConnection(host, timeout=self.timeout)
+		else:
+			return http.client.HTTPConnection(host, timeout=self.timeout)
+
+	def _release(self, scheme: str, host: str, conn: http.client.HTTPConnection):
+		"""
+		Return a connection to the pool so the next request to this host can reuse it
+
+		:param scheme:
+		:param host:
+		:param conn:
+		:return:
+		"""
+		with self._lock:
+			self._pool.setdefault((scheme, host), []).append(conn)
+
+	def _fetch_one(self, filename: str, url: str) -> bool:
+		"""
+		Same as maybe_download_scriptlet, but over a pooled connection
+
+		:param filename:
+		:param url:
+		:return:
+		"""
+		etag_path = os.path.join(os.path.dirname(filename), '.etag.' + os.path.basename(filename))
+		headers = {}
+		if os.path.exists(etag_path) and os.path.exists(filename):
+			with open(etag_path, 'r') as f:
+				headers['If-None-Match'] = f.read().strip()
+
+		os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+		parts = urlsplit(url)
+		path = parts.path + ('?' + parts.query if parts.query else '')
+		for attempt in range(2):
+			# The server may have closed an idle keep-alive connection; retry once on a new one.
+			conn = self._acquire(parts.scheme, parts.netloc, fresh=(attempt > 0))
+			try:
+				conn.request('GET', path, headers=headers)
+				response = conn.getresponse()
+				body = response.read()
+				self._release(parts.scheme, parts.netloc, conn)
+				break
+			except (http.client.HTTPException, OSError):
+				conn.close()
+				if attempt > 0:
+					print('Could not download %s' % filename)
+					return False
+
+		if response.status == 304:
+			return True
+		if response.status != 200:
+			print('Could not download %s' % filename)
+			return False
+
+		with open(filename, 'wb') as f:
+			f.write(body)
+		# Store the ETag for future caching
+		with open(etag_path, 'w') as f:
+			f.write(response.getheader('ETag', ''))
+		print('Downloaded %s scriptlet' % filename)
+		return True
+
+
+class ScriptletLock(ScriptletFetcher):
+	"""
+	Install scriptlets from the vendored copies pinned in compile.lock instead of downloading them
+
+	compile.lock maps each scriptlet to the URL it was downloaded from and the SHA-256 of its content,
+	and the content itself is kept under vendor/scriptlets/, (both written by --lock and meant to be committed).
+	Builds with a lockfile never touch the network and stop on any scriptlet which is missing or does not match.
+	"""
+	def __init__(self, path: str = 'compile.lock', vendor: str = 'vendor/scriptlets'):
+		super().__init__()
+		self.path = path
+		self.vendor = vendor
+		self.scriptlets = {}
+		"""
+		{include: {'source': URL, 'sha256': hex digest}}
+		"""
+		if os.path.exists(self.path):
+			with open(self.path, 'r') as f:
+				self.scriptlets = json.load(f)
+
+	@staticmethod
+	def hash_file(file: str) -> str:
+		with open(file, 'rb') as f:
+			return hashlib.sha256(f.read()).hexdigest()
+
+	def fetch(self, includes: list):
+		"""
+		Install the pinned copy of each scriptlet into scriptlets/
+		:param includes:
+		:return:
+		"""
+		for include in includes:
+			self.fetch_missing(include)
+
+	def fetch_missing(self, include: str):
+		if include not in self.scriptlets:
+			print('ERROR - scriptlet %s is not in %s, run compile.py --lock to add it' % (include, self.path))
+			sys.exit(1)
+
+		pinned = self.scriptlets[include]
+		vendored = os.path.join(self.vendor, include)
+		if not os.path.exists(vendored):
+			print('ERROR - scriptlet %s is missing from %s, run compile.py --lock to restore it' % (include, self.vendor))
+			sys.exit(1)
+
+		digest = self.hash_file(vendored)
+		if digest != pinned['sha256']:
+			print('ERROR - scriptlet %s does not match %s' % (vendored, self.path))
+			print('  expected sha256 %s, found %s' % (pinned['sha256'], digest))
+			sys.exit(1)
+
+		if pinned['source'] != parse_scriptlet_url(include):
+			print('WARNING - %s was locked from %s, run compile.py --lock to follow compile.sources' % (include, pinned['source']))
+
+		file = os.path.join('scriptlets', include)
+		if not os.path.exists(file) or self.hash_file(file) != digest:
+			os.makedirs(os.path.dirname(file), exist_ok=True)
+			shutil.copy(vendored, file)
+		self.fetched.add(file)
+
+	def write(self, includes: set):
+		"""
+		Pin the current content of the given scriptlets, (already downloaded into scriptlets/), and vendor them
+		:param includes:
+		:return:
+		"""
+		self.scriptlets = {}
+		for include in sorted(includes):
+			file = os.path.join('scriptlets', include)
+			if not os.path.exists(file):
+				print('ERROR - scriptlet %s could not be downloaded, not writing %s' % (include, self.path))
+				sys.exit(1)
+
+			vendored = os.path.join(self.vendor, include)
+			os.makedirs(os.path.dirname(vendored), exist_ok=True)
+			shutil.copy(file, vendored)
+			self.scriptlets[include] = {
+				'source': parse_scriptlet_url(include),
+				'sha256': self.hash_file(file),
+			}
+
+		# Drop vendored copies of scriptlets no longer used
+		for vendored in glob(os.path.join(self.vendor, '**', '*'), recursive=True):
+			if os.path.isfile(vendored) and os.path.relpath(vendored, self.vendor).replace(os.sep, '/') not in self.scriptlets:
+				os.remove(vendored)
+
+		with open(self.path, 'w') as f:
+			f.write(json.dumps(self.scriptlets, indent=4) + '\n')
+		print('Locked %s scriptlets in %s' % (len(self.scriptlets), self.path))
+
+
 class Scriptlet:
 	def __init__(self, name: str, type: str):
 		self.name = name
@@ -106,56 +629,10 @@ class Scriptlet:
 			content = f.read()
 
 		if self.type == 'python':
-			# Python: Find def <name>(...) and docstrings, handle indented docstrings and left-align
-			func_pattern = re.compile(r'^\s*def\s+(\w+)\s*\(.*?\):', re.MULTILINE)
-			# Match triple-quoted docstrings, possibly indented
-			doc_pattern = re.compile(r'^\s*def\s+(\w+)\s*\(.*?\):\s*(?:\n\s*)?("""|\'\'\')([\s\S]*?)(\2)', re.MULTILINE)
-			for match in func_pattern.finditer(content):
-				name = match.group(1)
-				# Find docstring after function definition
-				doc_match = doc_pattern.search(content, match.start())
-				body = ''
-				if doc_match and doc_match.group(1) == name:
-					body_raw = doc_match.group(3)
-					lines = body_raw.splitlines()
-					# Remove first line if empty
-					if lines and lines[0].strip() == '':
-						lines = lines[1:]
-					# Find minimum indentation (ignore empty lines)
-					min_indent = None
-					for line in lines:
-						stripped = line.lstrip()
-						if stripped:
-							indent = len(line) - len(stripped)
-							if min_indent is None or indent < min_indent:
-								min_indent = indent
-					# Remove min_indent from all lines
-					if min_indent is not None and min_indent > 0:
-						lines = [line[min_indent:] if len(line) >= min_indent else line for line in lines]
-					body = '\n'.join([line.rstrip() for line in lines])
-				func = ScriptletFunction()
-				func.name = name
-				func.body = body
-				self.functions.append(func)
+			self._parse_python(content)
 
 		elif self.type == 'shell':
-			# Bash: Find function <name> or <name>() {, capture contiguous preceding # comments (no blank lines)
-			func_pattern = re.compile(r'(?:^|\n)((?:#.*\n)+)?(?:function\s+)?(\w+)\s*\(\)\s*\{', re.MULTILINE)
-			for match in func_pattern.finditer(content):
-				name = match.group(2)
-				comments = match.group(1) or ''
-				# Only include contiguous comment block (no blank lines)
-				comment_lines = []
-				for line in comments.splitlines():
-					if line.strip().startswith('#'):
-						comment_lines.append(line.strip('#').strip())
-					elif line.strip() == '':
-						break  # Stop at first blank line
-				body = '\n'.join(comment_lines)
-				func = ScriptletFunction()
-				func.name = name
-				func.body = body
-				self.functions.append(func)
+			self._parse_shell(content)
 
 		elif self.type == 'powershell':
 			# PowerShell: Find function <name>, capture preceding <# ... #> or # comments
@@ -171,11 +648,78 @@ class Scriptlet:
 				func.body = body
 				self.functions.append(func)
 
+	def _parse_python(self, content: str):
+		"""
+		Python: Read the functions, (and methods of classes), with their signatures and docstrings from the syntax tree
+
+		Nested functions are implementation details and are not documented.
+
+		:param content:
+		:return:
+		"""
+		try:
+			tree = ast.parse(content, filename=self.name)
+		except SyntaxError as e:
+			print('WARNING - unable to parse scriptlet %s: %s' % (self.name, e))
+			return
+
+		for node in tree.body:
+			if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+				self._add_python_function(node, node.name)
+			elif isinstance(node, ast.ClassDef):
+				for child in node.body:
+					if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+						self._add_python_function(child, '%s.%s' % (node.name, child.name))
+
+	def _add_python_function(self, node, name: str):
+		func = ScriptletFunction()
+		func.name = name
+		func.signature = '(%s)' % ast.unparse(node.args)
+		if node.returns is not None:
+			func.signature += ' -> %s' % ast.unparse(node.returns)
+		func.body = '\n'.join([line.rstrip() for line in (ast.get_docstring(node) or '').splitlines()])
+		self.functions.append(func)
+
+	def _parse_shell(self, content: str):
+		"""
+		Bash: Find 'function <name>', '<name>()', or both, with the contiguous '#' comments directly above it
+
+		Single pass over the lines; the opening brace may be on the following line.
+
+		:param content:
+		:return:
+		"""
+		func_pattern = re.compile(r'^(?:function\s+(\w+)\s*(?:\(\s*\))?|(\w+)\s*\(\s*\))\s*(\{)?')
+		comment_lines = []
+		pending = None
+		for line in content.splitlines():
+			if pending is not None:
+				# Definition without a brace on the previous line; only a function if the brace comes next
+				if line.strip().startswith('{'):
+					self.functions.append(pending)
+				pending = None
+
+			if line.startswith('#'):
+				comment_lines.append(line.strip('#').strip())
+				continue
+
+			match = func_pattern.match(line)
+			if match and (match.group(3) or line[match.end():].strip() == ''):
+				func = ScriptletFunction()
+				func.name = match.group(1) or match.group(2)
+				func.body = '\n'.join(comment_lines)
+				if match.group(3):
+					self.functions.append(func)
+				else:
+					pending = func
+			comment_lines = []
+
 
 class ScriptletFunction:
 	def __init__(self):
 		self.name = None
 		self.body = ''
+		self.signature = ''
 
 
 class Script:
@@ -198,6 +742,10 @@ class Script:
 		self.supports_detailed = []
 		self.scriptlets = []
 		self.imports = []
+		self.import_includes = []
+		"""
+		Imports pulled in from '# import:' scriptlets, (path setup such as the .venv include), left out of zipapps
+		"""
 		self.args = []
 		self.env = []
 		self.syntax = []
@@ -281,6 +829,8 @@ class Script:
 					include = line[9:].strip()
 					line = self._parse_include(self.file, line_number, include)
 					self._parse_import(line)
+					if line.strip() not in self.import_includes:
+						self.import_includes.append(line.strip())
 					write = False
 				elif line.strip() == '# compile:usage':
 					in_header = False
@@ -428,6 +978,150 @@ class Script:
 		# Ensure new file is executable
 		os.chmod(dest_file, 0o775)
 
+	def write_zipapp(self, host_modules: list = None):
+		"""
+		Write the generated Python script as a self-contained zipapp, (dist/<name>.pyz)
+
+		The archive contains the script as __main__ along with every third-party module it imports,
+		(found in the .venv or the current environment), and their package data, each with precompiled
+		bytecode so nothing needs to be compiled on start.  The sources are included too, so the archive
+		still runs on a different Python version, just without the head start.
+		'# import:' scriptlets are left out as the vendored modules replace the .venv path setup.
+
+		Compiled extensions cannot be loaded from inside a zip, so they are never bundled.
+		Modules which need one must be installed on the target host and listed in host_modules,
+		(eg: psutil from python3-psutil); the finished archive is started once to check that nothing
+		else depends on a compiled extension, and the build fails if it does not start.
+		:param host_modules: Top-level modules provided by the target host instead of the archive
+		:return:
+		"""
+		dest_file = 'dist/' + self.file[4:-3] + '.pyz'
+		main_source = self.content_header + '\n'.join([i for i in self.imports if i not in self.import_includes]) + self.content_body
+
+		with tempfile.TemporaryDirectory() as build_dir:
+			with open(os.path.join(build_dir, '__main__.py'), 'w') as f:
+				f.write(main_source)
+
+			vendored, extensions = self._find_vendor_modules(main_source, host_modules or [])
+			for archive_name, file in vendored.items():
+				target = os.path.join(build_dir, archive_name)
+				os.makedirs(os.path.dirname(target), exist_ok=True)
+				shutil.copy(file, target)
+
+			# zipimport loads "module.pyc" from next to "module.py", (not from __pycache__),
+			# and unchecked hash-based pycs skip the source timestamp check.
+			for root, dirs, files in os.walk(build_dir):
+				for file in files:
+					if file.endswith('.py'):
+						source = os.path.join(root, file)
+						try:
+							py_compile.compile(
+								source,
+								cfile=source + 'c',
+								dfile=os.path.join(dest_file, os.path.relpath(source, build_dir)),
+								doraise=True,
+								invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH
+							)
+						except py_compile.PyCompileError as e:
+							print('WARNING - unable to precompile %s: %s' % (file, e.msg))
+
+			zipapp.create_archive(build_dir, dest_file, interpreter='/usr/bin/env python3', compressed=True)
+
+		print('Created zipapp %s with %s vendored modules' % (dest_file, len([n for n in vendored if n.endswith('.py')])))
+		if len(extensions) > 0:
+			print('  left out compiled extensions of %s' % ', '.join(sorted(extensions)))
+
+		# Start both the plain script and the archive for real, (best of a few runs to skip disk cache misses)
+		timings = {}
+		for target in ('dist/' + self.file[4:], dest_file):
+			best = None
+			for i in range(3):
+				start = time.perf_counter()
+				proc = subprocess.run(
+					[sys.executable, target, '--help'],
+					stdin=subprocess.DEVNULL,
+					stdout=subprocess.DEVNULL,
+					stderr=subprocess.PIPE
+				)
+				elapsed = (time.perf_counter() - start) * 1000
+				if proc.returncode != 0:
+					break
+				best = elapsed if best is None else min(best, elapsed)
+			if proc.returncode != 0 and target == dest_file:
+				print('ERROR - %s --help failed, (exit code %s):' % (dest_file, proc.returncode))
+				print('\n'.join(proc.stderr.decode('utf-8', errors='replace').strip().splitlines()[-5:]))
+				if len(extensions) > 0:
+					print('Install modules with compiled extensions on the host and pass them to --zipapp-host')
+				os.remove(dest_file)
+				sys.exit(1)
+			timings[target] = best
+
+		print('  %s --help: %s, %s --help: %.0f ms' % (
+			'dist/' + self.file[4:],
+			'failed' if timings['dist/' + self.file[4:]] is None else '%.0f ms' % timings['dist/' + self.file[4:]],
+			dest_file,
+			timings[dest_file]
+		))
+
+	def _find_vendor_modules(self, source: str, host_modules: list) -> tuple:
+		"""
+		Find the third-party modules imported by a Python source, and all modules they import in turn
+
+		:param source:
+		:param host_modules: Top-level modules to leave out, (provided by the target host)
+		:return: {path within the archive: source file}, and the set of modules with compiled extensions left out
+		"""
+		venv_paths = glob('.venv/lib/python*/site-packages')
+		search_path = venv_paths + [p for p in sys.path if p and 'site-packages' in p]
+		vendored = {}
+		extensions = set()
+		seen = set(host_modules)
+		pending = [source]
+		while len(pending) > 0:
+			try:
+				tree = ast.parse(pending.pop())
+			except SyntaxError:
+				continue
+			names = set()
+			for node in ast.walk(tree):
+				if isinstance(node, ast.Import):
+					names.update([alias.name.split('.')[0] for alias in node.names])
+				elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+					names.add(node.module.split('.')[0])
+
+			for name in names - seen:
+				seen.add(name)
+				if name in sys.stdlib_module_names or name == '__future__':
+					continue
+				spec = PathFinder.find_spec(name, search_path)
+				if spec is None:
+					print('WARNING - module %s not found, it will not be included in the zipapp' % name)
+					continue
+				if spec.submodule_search_locations:
+					package_dir = list(spec.submodule_search_locations)[0]
+					base_dir = os.path.dirname(package_dir)
+					files = [
+						f for f in glob(os.path.join(package_dir, '**', '*'), recursive=True)
+						if os.path.isfile(f) and '__pycache__' not in f and not f.endswith('.pyc')
+					]
+				elif spec.origin and spec.origin.endswith('.py'):
+					base_dir = os.path.dirname(spec.origin)
+					files = [spec.origin]
+				else:
+					extensions.add(name)
+					continue
+
+				for file in files:
+					if file.endswith(tuple(EXTENSION_SUFFIXES)) or file.endswith(('.so', '.pyd')):
+						extensions.add(name)
+						continue
+					# Package data, (eg: certifi's cacert.pem), is bundled as is
+					vendored[os.path.relpath(file, base_dir)] = file
+					if file.endswith('.py'):
+						with open(file, 'r', encoding='utf-8') as f:
+							pending.append(f.read())
+		return vendored, extensions
+
 	def _parse_import(self, line: str):
 		"""
 		Parse Python-style 'import' statements to the parent script
@@ -495,12 +1189,14 @@ class Script:
 		if include not in self.scriptlets:
 			self.scriptlets.append(include)
 			file = os.path.join('scriptlets', include)
-			maybe_download_scriptlet(file, parse_scriptlet_url(include))
+			if file not in scriptlet_fetcher.fetched:
+				scriptlet_fetcher.fetch_missing(include)
 
 			if os.path.exists(file):
 				script = Script(file, self.type)
 				script.scriptlets = self.scriptlets
 				script.imports = self.imports
+				script.import_includes = self.import_includes
 				# Parse the source
 				script.parse()
 				# Scripts must end with an empty newline.
@@ -847,6 +1543,41 @@ class Script:
 			'draft': self.draft
 		}
 
+	def ascache(self):
+		"""
+		Get the parsed metadata needed to generate the project docs, (see BuildCache)
+		:return:
+		"""
+		return {
+			'title': self.title,
+			'warlock_title': self.warlock_title,
+			'warlock_image': self.warlock_image,
+			'warlock_icon': self.warlock_icon,
+			'warlock_thumbnail': self.warlock_thumbnail,
+			'readme': self.readme,
+			'author': self.author,
+			'guid': self.guid,
+			'category': self.category,
+			'draft': self.draft,
+			'trmm_timeout': self.trmm_timeout,
+			'supports': self.supports,
+			'supports_detailed': self.supports_detailed,
+			'args': self.args,
+			'env': self.env,
+			'syntax': self.syntax,
+			'description': self.description,
+			'is_python_module': self.is_python_module,
+		}
+
+	def load_cache(self, data: dict):
+		"""
+		Restore the metadata saved by ascache() instead of parsing the script
+		:param data:
+		:return:
+		"""
+		for key, value in data.items():
+			setattr(self, key, value)
+
 	def as_trmm_meta(self):
 		# TRMM treats all *nix distros as just "linux"
 		all_platforms = (
@@ -880,12 +1611,27 @@ class Script:
 		}
 
 
+parser = argparse.ArgumentParser('compile.py')
+parser.add_argument('--zipapp', action='store_true', help='Also write each Python script as a self-contained .pyz with precompiled bytecode')
+parser.add_argument('--zipapp-host', action='append', default=[], metavar='MODULE', help='Module the target host provides, (required for modules with compiled extensions such as psutil), not bundled in the .pyz')
+parser.add_argument('--jobs', type=int, default=8, help='Number of scriptlets to download at once')
+parser.add_argument('--incremental', action='store_true', help='Keep dist/ and only rebuild outputs whose inputs changed since the last build')
+parser.add_argument('--watch', action='store_true', help='After building, keep rebuilding the outputs affected by any change to src/, scripts/, or scriptlets/, (implies --incremental)')
+parser.add_argument('--lock', action='store_true', help='Download the latest scriptlets and pin them in compile.lock and vendor/scriptlets/')
+args = parser.parse_args()
+
+if os.path.exists('compile.lock') and not args.lock:
+	# Build only from the pinned, vendored scriptlets
+	scriptlet_fetcher = ScriptletLock()
+else:
+	scriptlet_fetcher = ScriptletFetcher(args.jobs)
+build_cache = BuildCache('.compile-cache.json') if args.incremental or args.watch else None
+
 # Clean the dist directory
-if os.path.exists('dist'):
+if os.path.exists('dist') and build_cache is None:
 	shutil.rmtree('dist')
 
 scripts = []
-scriptlets = []
 
 #s = Script('src/github/linux_install_github_runner.sh', 'shell')
 #s.parse()
@@ -893,6 +1639,13 @@ scriptlets = []
 #pprint(s.asdict())
 #exit(1)
 
+src_files = glob('src/**/*.sh', recursive=True) + glob('src/**/*.py', recursive=True) + glob('src/**/*.ps1', recursive=True)
+
+# Download or revalidate all included scriptlets up front, (parsing below reads them from disk)
+included_scriptlets = scriptlet_fetcher.resolve(src_files)
+if args.lock:
+	ScriptletLock().write(included_scriptlets)
+
 # Determine source repository URL
 source_type = 'UNKNOWN'
 source_repo = 'UNKNOWN/TODO'
@@ -907,135 +1660,180 @@ if os.path.exists('.git/config'):
 					source_repo = repo_url.strip()[repo_url.index('github.com') + 11:-4]
 				break
 
-for file in glob('scriptlets/**/*.sh', recursive=True):
-	scriptlet = Scriptlet(file, 'shell')
-	scriptlet.parse()
-	scriptlets.append(scriptlet)
 
-for file in glob('scriptlets/**/*.py', recursive=True):
-	scriptlet = Scriptlet(file, 'python')
-	scriptlet.parse()
-	scriptlets.append(scriptlet)
+def new_script(file: str) -> Script:
+	"""
+	Create the Script for a source file, based on its extension
+	:param file:
+	:return:
+	"""
+	types = {'.sh': 'shell', '.py': 'python', '.ps1': 'powershell'}
+	script = Script(file, types[os.path.splitext(file)[1]])
+	if script.type == 'shell':
+		script.repo = repo_url
+	return script
 
-for file in glob('scriptlets/**/*.ps1', recursive=True):
-	scriptlet = Scriptlet(file, 'powershell')
-	scriptlet.parse()
-	scriptlets.append(scriptlet)
 
-# Parse and compile any script files
-for file in glob('src/**/*.sh', recursive=True):
-	script = Script(file, 'shell')
-	script.repo = repo_url
-	# Parse the source
-	script.parse()
-	script.write()
-	# Add to stack to update project docs
-	scripts.append(script)
+def compile_script(script: Script, zipapp: bool = False):
+	"""
+	Parse and write a script, or with --incremental, load its metadata from the build cache if none of its inputs changed
+	:param script:
+	:param zipapp:
+	:return:
+	"""
+	key = None
+	if build_cache is not None:
+		key = build_cache.get_key(script.file, '%s:%s:%s' % (script.repo, zipapp and script.type == 'python', sorted(args.zipapp_host)))
+		if build_cache.is_current(script.file, key):
+			script.load_cache(build_cache.scripts[script.file]['script'])
+			return
 
-for file in glob('src/**/*.py', recursive=True):
-	script = Script(file, 'python')
 	# Parse the source
 	script.parse()
 	script.write()
-	# Add to stack to update project docs
-	scripts.append(script)
+	outputs = ['dist/' + script.file[4:]]
+	if zipapp and script.type == 'python' and not script.is_python_module:
+		script.write_zipapp(args.zipapp_host)
+		outputs.append('dist/' + script.file[4:-3] + '.pyz')
 
-for file in glob('src/**/*.ps1', recursive=True):
-	script = Script(file, 'powershell')
-	# Parse the source
-	script.parse()
-	script.write()
-	# Add to stack to update project docs
-	scripts.append(script)
+	if build_cache is not None:
+		build_cache.set(script.file, key, outputs, script)
 
-# Locate and copy any README files
-for file in glob('src/**/README.md', recursive=True):
-	print('Copying README %s' % file)
+
+def copy_readme(file: str):
+	"""
+	Copy a README from src/ to dist/, (if it changed)
+	:param file:
+	:return:
+	"""
 	dest_file = 'dist/' + file[4:]
 	if not os.path.exists(os.path.dirname(dest_file)):
 		os.makedirs(os.path.dirname(dest_file))
 
-	shutil.copy(file, dest_file)
-
-# Generate list of scripts for the README, sorted by category and then title
-scripts.sort(key=lambda x: '-'.join([x.category if x.category else 'ZZZ', x.title if x.title else x.file]))
-scripts_table = []
-scripts_table.append('| Category / Script | Supports |')
-scripts_table.append('|-------------------|----------|')
-for script in scripts:
-	if script.draft:
-		continue
-	if script.is_python_module:
-		continue
-	title = script.title if script.title else script.file
-	readme = script.readme if script.readme else None
-	if readme is not None:
+	with open(file, 'r', encoding='utf-8') as f:
+		if write_if_changed(dest_file, f.read()):
+			print('Copying README %s' % file)
+
+
+def get_docs_key(scripts: list) -> str:
+	"""
+	Get the key of the inputs of the project docs; the metadata of every script plus the scriptlets themselves
+	:param scripts:
+	:return:
+	"""
+	h = hashlib.sha256(json.dumps([[s.file, s.type, s.ascache()] for s in scripts]).encode())
+	h.update(('%s:%s' % (source_type, source_repo)).encode())
+	docs_inputs = ['.supplemental/README-template.md'] + sorted(
+		glob('scriptlets/**/*.sh', recursive=True) +
+		glob('scriptlets/**/*.py', recursive=True) +
+		glob('scriptlets/**/*.ps1', recursive=True)
+	)
+	for file in docs_inputs:
+		h.update(('%s:%s\n' % (file, build_cache.hash_file(file))).encode())
+	return h.hexdigest()
+
+
+def generate_docs(scripts: list):
+	"""
+	Generate README.md, dist/community_scripts.json, and dist/warlock.yaml
+	:param scripts:
+	:return:
+	"""
+	scriptlets = []
+
+	# Parse the scriptlets to document the functions they provide
+	for file in glob('scriptlets/**/*.sh', recursive=True):
+		scriptlet = Scriptlet(file, 'shell')
+		scriptlet.parse()
+		scriptlets.append(scriptlet)
+
+	for file in glob('scriptlets/**/*.py', recursive=True):
+		scriptlet = Scriptlet(file, 'python')
+		scriptlet.parse()
+		scriptlets.append(scriptlet)
+
+	for file in glob('scriptlets/**/*.ps1', recursive=True):
+		scriptlet = Scriptlet(file, 'powershell')
+		scriptlet.parse()
+		scriptlets.append(scriptlet)
+
+	# Generate list of scripts for the README, sorted by category and then title
+	scripts.sort(key=lambda x: '-'.join([x.category if x.category else 'ZZZ', x.title if x.title else x.file]))
+	scripts_table = []
+	scripts_table.append('| Category / Script | Supports |')
+	scripts_table.append('|-------------------|----------|')
+	for script in scripts:
+		if script.draft:
+			continue
+		if script.is_python_module:
+			continue
+		title = script.title if script.title else script.file
+		readme = script.readme if script.readme else None
+		if readme is not None:
+			# Fix windows-style directory separators
+			readme = readme.replace('\\', '/')
+			# Swap src/ with dist/ for the href target, (folks usually want to see the compiled version, not the source)
+			readme = readme.replace('src/', 'dist/')
+			# Markdown-ify it
+			readme = '[![README](.supplemental/images/icons/readme.svg "README")](%s)' % readme
+		else:
+			readme = ''
+
+		href = script.file
 		# Fix windows-style directory separators
-		readme = readme.replace('\\', '/')
+		href = href.replace('\\', '/')
 		# Swap src/ with dist/ for the href target, (folks usually want to see the compiled version, not the source)
-		readme = readme.replace('src/', 'dist/')
-		# Markdown-ify it
-		readme = '[![README](.supplemental/images/icons/readme.svg "README")](%s)' % readme
-	else:
-		readme = ''
+		href = href.replace('src/', 'dist/')
+
+		if script.type == 'shell':
+			type = '![Bash/Shell](.supplemental/images/icons/bash.svg "Bash/Shell")'
+		elif script.type == 'powershell':
+			type = '![PowerShell](.supplemental/images/icons/powershell.svg "PowerShell")'
+		elif script.type == 'python':
+			type = '![Python](.supplemental/images/icons/python.svg "Python")'
+		else:
+			type = script.type[0].upper() + script.type[1:]
+
+		category = script.category if script.category else 'Uncategorized'
+		os_support = []
+		supported = script.supports_detailed
+		supported.sort(key = lambda x: x[0])
+		for support in supported:
+			os_support.append('![%s](.supplemental/images/icons/%s.svg "%s")' % (support[0], support[0], support[1]))
+		scripts_table.append('| %s [%s / %s](%s) %s | %s |' % (type, category, title, href, readme, ' '.join(os_support)))
+
+	# Iterate through scriptlets to generate documentation about the included scriptlet functions available
+	scriptlets_text = ''
+	for scriptlet in scriptlets:
+		scriptlets_text += '### [%s](%s)\n\n' % (scriptlet.name[11:], scriptlet.name)
+		scriptlets_text += 'To include this scriptlet:\n\n'
+
+		if scriptlet.type == 'shell':
+			scriptlets_text += '```bash\n# scriptlet:%s\n```\n\n' % scriptlet.name[11:]
+		elif scriptlet.type == 'powershell':
+			scriptlets_text += '```powershell\n# scriptlet:%s\n```\n\n' % scriptlet.name[11:]
+		elif scriptlet.type == 'python':
+			scriptlets_text += '```python\n# from scriptlets.%s import *\n```\n\n' % scriptlet.name[11:-3].replace('/', '.')
+		#if scriptlet.description:
+		#	scriptlets_text += '%s\n\n' % scriptlet.description
+		if len(scriptlet.functions) > 0:
+			for function in scriptlet.functions:
+				scriptlets_text += '#### function %s%s:\n\n%s\n\n' % (function.name, function.signature, function.body.strip())
+			scriptlets_text += '\n'
+
+	if os.path.exists('.supplemental/README-template.md'):
+		replacements = {
+			'%%SCRIPTS_TABLE%%': '\n'.join(scripts_table),
+			'%%SCRIPTLETS%%': scriptlets_text
+		}
+		with open('.supplemental/README-template.md', 'r') as f:
+			template = f.read()
+			for key, value in replacements.items():
+				template = template.replace(key, value)
 
-	href = script.file
-	# Fix windows-style directory separators
-	href = href.replace('\\', '/')
-	# Swap src/ with dist/ for the href target, (folks usually want to see the compiled version, not the source)
-	href = href.replace('src/', 'dist/')
+		write_if_changed('README.md', template)
 
-	if script.type == 'shell':
-		type = '![Bash/Shell](.supplemental/images/icons/bash.svg "Bash/Shell")'
-	elif script.type == 'powershell':
-		type = '![PowerShell](.supplemental/images/icons/powershell.svg "PowerShell")'
-	elif script.type == 'python':
-		type = '![Python](.supplemental/images/icons/python.svg "Python")'
-	else:
-		type = script.type[0].upper() + script.type[1:]
-
-	category = script.category if script.category else 'Uncategorized'
-	os_support = []
-	supported = script.supports_detailed
-	supported.sort(key = lambda x: x[0])
-	for support in supported:
-		os_support.append('![%s](.supplemental/images/icons/%s.svg "%s")' % (support[0], support[0], support[1]))
-	scripts_table.append('| %s [%s / %s](%s) %s | %s |' % (type, category, title, href, readme, ' '.join(os_support)))
-
-# Iterate through scriptlets to generate documentation about the included scriptlet functions available
-scriptlets_text = ''
-for scriptlet in scriptlets:
-	scriptlets_text += '### [%s](%s)\n\n' % (scriptlet.name[11:], scriptlet.name)
-	scriptlets_text += 'To include this scriptlet:\n\n'
-
-	if scriptlet.type == 'shell':
-		scriptlets_text += '```bash\n# scriptlet:%s\n```\n\n' % scriptlet.name[11:]
-	elif scriptlet.type == 'powershell':
-		scriptlets_text += '```powershell\n# scriptlet:%s\n```\n\n' % scriptlet.name[11:]
-	elif scriptlet.type == 'python':
-		scriptlets_text += '```python\n# from scriptlets.%s import *\n```\n\n' % scriptlet.name[11:-3].replace('/', '.')
-	#if scriptlet.description:
-	#	scriptlets_text += '%s\n\n' % scriptlet.description
-	if len(scriptlet.functions) > 0:
-		for function in scriptlet.functions:
-			scriptlets_text += '#### function %s:\n\n%s\n\n' % (function.name, function.body.strip())
-		scriptlets_text += '\n'
-
-if os.path.exists('.supplemental/README-template.md'):
-	replacements = {
-		'%%SCRIPTS_TABLE%%': '\n'.join(scripts_table),
-		'%%SCRIPTLETS%%': scriptlets_text
-	}
-	with open('.supplemental/README-template.md', 'r') as f:
-		template = f.read()
-		for key, value in replacements.items():
-			template = template.replace(key, value)
-
-	with open('README.md', 'w') as f:
-		f.write(template)
-
-# Generate TRMM metafile
-with open('dist/community_scripts.json', 'w') as f:
+	# Generate TRMM metafile
 	meta = []
 	for script in scripts:
 		if script.draft:
@@ -1045,27 +1843,142 @@ with open('dist/community_scripts.json', 'w') as f:
 		data = script.as_trmm_meta()
 		data['filename'] = script.file[4:]
 		meta.append(data)
-	f.write(json.dumps(meta, indent=4))
+	write_if_changed('dist/community_scripts.json', json.dumps(meta, indent=4))
 
-# Generate Warlock metafile
-with open('dist/warlock.yaml', 'w') as f:
+	# Generate Warlock metafile
+	warlock = ''
 	for script in scripts:
 		if script.warlock_title is not None:
-			f.write('- guid: %s\n' % script.guid)
-			f.write('  title: %s\n' % script.warlock_title)
-			f.write('  source: %s\n' % source_type)
-			f.write('  repo: %s\n' % source_repo)
-			f.write('  installer: dist/%s\n' % script.file[4:])
-			f.write('  author: %s\n' % script.get_full_author())
-			f.write('  category: %s\n' % (script.category if script.category else 'Uncategorized'))
-			f.write('  supports:\n')
+			warlock += '- guid: %s\n' % script.guid
+			warlock += '  title: %s\n' % script.warlock_title
+			warlock += '  source: %s\n' % source_type
+			warlock += '  repo: %s\n' % source_repo
+			warlock += '  installer: dist/%s\n' % script.file[4:]
+			warlock += '  author: %s\n' % script.get_full_author()
+			warlock += '  category: %s\n' % (script.category if script.category else 'Uncategorized')
+			warlock += '  supports:\n'
 			for support in script.supports_detailed:
-				f.write('    - "%s"\n' % support[1])
-			f.write('  syntax:\n')
+				warlock += '    - "%s"\n' % support[1]
+			warlock += '  syntax:\n'
 			for syntax in script.syntax:
-				f.write('    - "%s"\n' % syntax)
-			f.write('  image: %s\n' % (script.warlock_image if script.warlock_image else ''))
-			f.write('  icon: %s\n' % (script.warlock_icon if script.warlock_icon else ''))
-			f.write('  thumbnail: %s\n' % (script.warlock_thumbnail if script.warlock_thumbnail else ''))
-			f.write('\n')
+				warlock += '    - "%s"\n' % syntax
+			warlock += '  image: %s\n' % (script.warlock_image if script.warlock_image else '')
+			warlock += '  icon: %s\n' % (script.warlock_icon if script.warlock_icon else '')
+			warlock += '  thumbnail: %s\n' % (script.warlock_thumbnail if script.warlock_thumbnail else '')
+			warlock += '\n'
+	write_if_changed('dist/warlock.yaml', warlock)
+
+
+def update_docs(scripts: list):
+	"""
+	Generate the project docs, or with --incremental, only if their inputs changed since the last build
+	:param scripts:
+	:return:
+	"""
+	if build_cache is None:
+		generate_docs(scripts)
+		return
+
+	docs_key = get_docs_key(scripts)
+	if (
+		build_cache.docs != docs_key or
+		not os.path.exists('dist/community_scripts.json') or
+		not os.path.exists('dist/warlock.yaml')
+	):
+		generate_docs(scripts)
+		build_cache.docs = docs_key
+
+
+def get_dependents(files: list) -> dict:
+	"""
+	Get the dependency graph of the scripts inverted; which scripts each file is built into
+	:param files:
+	:return: {dependency: set of source files}
+	"""
+	dependents = {}
+	for file in files:
+		for dependency in get_dependencies(file):
+			dependents.setdefault(dependency, set()).add(file)
+	return dependents
+
+
+def watch(scripts: list):
+	"""
+	Rebuild the outputs affected by each change to src/, scripts/, or scriptlets/ until interrupted
+	:param scripts:
+	:return:
+	"""
+	try:
+		watcher = FileWatcher([d for d in ('src', 'scripts', 'scriptlets') if os.path.isdir(d)])
+	except OSError as e:
+		print('ERROR - unable to watch for changes: %s' % e)
+		sys.exit(1)
+
+	compiled = {script.file: script for script in scripts}
+	dependents = get_dependents(list(compiled.keys()))
+	print('Watching src/, scripts/, and scriptlets/ for changes, (Ctrl+C to stop)')
+
+	try:
+		while True:
+			changed = watcher.read()
+			# Editors may write and rename several files for one save, collect them all before building
+			more = watcher.read(0.02)
+			while len(more) > 0:
+				changed |= more
+				more = watcher.read(0.02)
+
+			start = time.perf_counter()
+			build_cache.refresh()
+			affected = set()
+			for path in changed:
+				path = os.path.relpath(path)
+				if os.path.basename(path).startswith('.') or path.endswith('~'):
+					# Editor swap files and scriptlet ETags
+					continue
+				if path.startswith('src' + os.sep) and os.path.basename(path) == 'README.md':
+					if os.path.exists(path):
+						copy_readme(path)
+				elif path.startswith('src' + os.sep) and os.path.splitext(path)[1] in ('.sh', '.py', '.ps1'):
+					affected.add(path)
+				affected |= dependents.get(path, set())
+
+			for file in sorted(affected):
+				if os.path.exists(file):
+					script = new_script(file)
+					compile_script(script, args.zipapp)
+					compiled[file] = script
+				elif file in compiled:
+					del compiled[file]
+			if len(affected) == 0:
+				continue
+
+			build_cache.remove_stale(list(compiled.keys()))
+			dependents = get_dependents(list(compiled.keys()))
+			update_docs(list(compiled.values()))
+			build_cache.save()
+			print('Rebuilt %s in %.0f ms' % (', '.join(sorted(affected)), (time.perf_counter() - start) * 1000))
+	except KeyboardInterrupt:
+		pass
+	finally:
+		watcher.close()
+
+
+# Parse and compile any script files
+for file in src_files:
+	script = new_script(file)
+	compile_script(script, args.zipapp)
+	# Add to stack to update project docs
+	scripts.append(script)
+
+# Locate and copy any README files
+for file in glob('src/**/README.md', recursive=True):
+	copy_readme(file)
+
+update_docs(scripts)
+
+if build_cache is not None:
+	build_cache.remove_stale(src_files)
+	build_cache.save()
 
+if args.watch:
+	watch(scripts)
@@ -3218,6 +3218,8 @@ function uninstall_application() {
 
 	echo "Removing application data"
 	[ -e "$GAME_DIR/AppFiles" ] && rm -r "$GAME_DIR/AppFiles"
+	[ -e "$GAME_DIR/AppFiles.blue" ] && rm -r "$GAME_DIR/AppFiles.blue"
+	[ -e "$GAME_DIR/AppFiles.green" ] && rm -r "$GAME_DIR/AppFiles.green"
 
 	echo "Removing management system"
 	[ -h "$GAME_DIR/admins.txt" ] && unlink "$GAME_DIR/admins.txt"
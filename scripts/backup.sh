@@ -11,10 +11,66 @@ GAME_DIR="$GAME_DIR"
 SAVE_DIR="$GAME_DIR/AppFiles/ShooterGame/Saved"
 # compile:escape
 
+# Compression backend, (gzip or zstd), level and thread count; zstd uses every core by default.
+COMPRESSION="gzip"
+LEVEL=""
+THREADS=0
+BENCHMARK=0
+SOURCE=""
+
+while [ $# -gt 0 ]; do
+	case "$1" in
+		--compression) COMPRESSION="$2"; shift 2;;
+		--level) LEVEL="$2"; shift 2;;
+		--threads) THREADS="$2"; shift 2;;
+		--benchmark) BENCHMARK=1; shift;;
+		--source) SOURCE="$2"; shift 2;;
+		*)
+			echo "Usage: $0 [--compression gzip|zstd] [--level N] [--threads N] [--benchmark] [--source SNAPSHOT_DIR]" >&2
+			exit 1;;
+	esac
+done
+
+if [ "$COMPRESSION" == "zstd" ] && ! which zstd &>/dev/null; then
+	echo "WARNING - zstd is not installed, falling back to gzip (apt install zstd)"
+	COMPRESSION="gzip"
+fi
+
+FILES="clusters Config/WindowsServer .services SavedArks"
+TAR_EXCLUDES=(--exclude='*_WP_0*.ark' --exclude='*_WP_1*.ark' --exclude='*.profilebak' --exclude='*.tribebak')
+
+# Benchmark each compression backend against the current save set without creating a backup
+if [ $BENCHMARK -eq 1 ]; then
+	TMP="$(mktemp -d)"
+	tar -cf "$TMP/saves.tar" -C $SAVE_DIR "${TAR_EXCLUDES[@]}" clusters Config/WindowsServer SavedArks
+	RAW=$(stat -c %s "$TMP/saves.tar")
+	echo "Sample save set: $((RAW / 1048576)) MB"
+	printf "%-20s %10s %8s %10s\n" "Backend" "Size (MB)" "Ratio" "MB/s"
+	for BACKEND in "gzip -6" "zstd -3 -T1" "zstd -3 -T$THREADS" "zstd -9 -T$THREADS"; do
+		if ! which ${BACKEND%% *} &>/dev/null; then
+			continue
+		fi
+		START=$(date +%s.%N)
+		$BACKEND -c < "$TMP/saves.tar" > "$TMP/saves.out"
+		END=$(date +%s.%N)
+		SIZE=$(stat -c %s "$TMP/saves.out")
+		awk -v b="$BACKEND" -v raw=$RAW -v size=$SIZE -v s=$START -v e=$END \
+			'BEGIN { t = e - s; if (t <= 0) t = 0.001; printf "%-20s %10.1f %8.2f %10.1f\n", b, size / 1048576, raw / (size ? size : 1), raw / 1048576 / t }'
+	done
+	rm -fr "$TMP"
+	exit 0
+fi
+
+# Archive a snapshot taken by "manage.py --backup --live" instead of the live save directory.
+# The snapshot is consistent, so running maps are fine, and it is removed once archived.
+if [ -n "$SOURCE" ]; then
+	SAVE_DIR="$SOURCE"
+fi
+
 # Check if any maps are running; do not update an actively running server.
 RUNNING=0
 for MAP in $GAME_MAPS; do
-	if [ "$(systemctl is-active $MAP)" == "active" ]; then
+	if [ -z "$SOURCE" ] && [ "$(systemctl is-active $MAP)" == "active" ]; then
 		echo "WARNING - $MAP is still running"
 		RUNNING=1
 	fi
@@ -35,20 +91,28 @@ fi
 # Copy service files from systemd
 cp /etc/systemd/system/ark-*.service.d $SAVE_DIR/.services -r
 
-FILES="clusters Config/WindowsServer .services SavedArks"
-TGZ="$GAME_DIR/backups/ArkSurvivalAscended-$(date +%Y-%m-%d_%H-%M).tgz"
+if [ "$COMPRESSION" == "zstd" ]; then
+	TGZ="$GAME_DIR/backups/ArkSurvivalAscended-$(date +%Y-%m-%d_%H-%M).tar.zst"
+	COMPRESSOR="zstd -q -T$THREADS -${LEVEL:-3}"
+else
+	TGZ="$GAME_DIR/backups/ArkSurvivalAscended-$(date +%Y-%m-%d_%H-%M).tgz"
+	COMPRESSOR="gzip -${LEVEL:-6}"
+fi
 
-tar -czf $TGZ \
+tar -cf $TGZ \
+	--use-compress-program="$COMPRESSOR" \
 	-C $SAVE_DIR  \
-	--exclude='*_WP_0*.ark' \
-	--exclude='*_WP_1*.ark' \
-	--exclude='*.profilebak' \
-	--exclude='*.tribebak' \
+	"${TAR_EXCLUDES[@]}" \
 	$FILES
 
 if [ $? -eq 0 ]; then
 	echo "Created backup $TGZ"
+	# Record the archive and its contents in the backup catalog
+	$GAME_DIR/manage.py --catalog-add "$TGZ"
 fi
 
 # Cleanup
-rm -fr "$SAVE_DIR/.services"
\ No newline at end of file
+rm -fr "$SAVE_DIR/.services"
+if [ -n "$SOURCE" ]; then
+	rm -fr "$SOURCE"
+fi
\ No newline at end of file
@@ -3,7 +3,7 @@ import argparse
 import os
 import shutil
 import sys
-from time import sleep, time
+from time import localtime, monotonic, sleep, strftime, time
 from typing import Union
 
 here = os.path.dirname(os.path.realpath(__file__))
@@ -23,14 +23,29 @@ sys.path.insert(
 
 import subprocess
 import readline
+import queue
 import re
+import select
+import threading
 from rcon.source import Client
 from rcon import SessionTimeout
 from rcon.exceptions import WrongPassword
 import configparser
 from urllib import request
 from urllib import error as urlerror
+from urllib.parse import quote, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
+import datetime
+import fcntl
+import hashlib
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import hmac
+import http.client
+import sqlite3
+import tarfile
 
 
 # Require sudo / root to run this script
@@ -39,6 +54,41 @@ if os.geteuid() != 0:
 	sys.exit(1)
 
 
+def format_memory(kb: int) -> str:
+	"""
+	Format a memory size in KB for display
+	:param kb:
+	:return:
+	"""
+	if kb >= 1024 * 1024:
+		return '%.2f GB' % (kb / (1024 * 1024))
+	else:
+		return '%.0f MB' % (kb // 1024)
+
+
+def get_meminfo() -> dict:
+	"""
+	Get the system memory counters from /proc/meminfo, in KB
+	:return:
+	"""
+	meminfo = {}
+	with open('/proc/meminfo', 'r') as f:
+		for line in f:
+			key, val = line.split(':', 1)
+			meminfo[key] = int(val.split()[0])
+	return meminfo
+
+
+def format_duration(seconds: float) -> str:
+	"""
+	Format a number of seconds as m:ss for display
+	:param seconds:
+	:return:
+	"""
+	seconds = int(seconds)
+	return '%s:%02d' % (seconds // 60, seconds % 60)
+
+
 def rlinput(prompt, prefill=''):
 	"""
 	Use Readline to read input with a pre-filled value that can be edited by the user
@@ -320,11 +370,12 @@ class Services:
 		# Reload the service
 		subprocess.run(['systemctl', 'daemon-reload'])
 
-	def _rcon_cmd(self, cmd) -> Union[None,str]:
+	def _rcon_cmd(self, cmd, timeout: int = 2) -> Union[None,str]:
 		"""
 		Execute a raw command with RCON and return the result
 
 		:param cmd:
+		:param timeout: Seconds to wait for the server to respond
 		:return: None if RCON not available, or the result of the command
 		"""
 		if not self.is_running():
@@ -338,7 +389,7 @@ class Services:
 		try:
 			port = int(self.get_option('RCONPort', only_override=True))
 			pswd = self.get_option('ServerAdminPassword')
-			with Client('127.0.0.1', port, passwd=pswd, timeout=2) as client:
+			with Client('127.0.0.1', port, passwd=pswd, timeout=timeout) as client:
 				return client.run(cmd).strip()
 		except:
 			return None
@@ -357,12 +408,51 @@ class Services:
 		else:
 			return len(ret.split('\n'))
 
-	def rcon_save_world(self):
+	def rcon_save_world(self, timeout: int = 60) -> bool:
 		"""
-		Issue a Save command on the server
-		:return:
+		Issue a Save command on the server and wait for the save to complete
+
+		The server only answers SaveWorld once the world has been written,
+		so a "World Saved" response is confirmation enough.
+		If the response is lost, (or RCON times out on a large save), this map's own world file is watched instead;
+		ShooterGame.log is shared by every map, so a save line there could belong to any of them.
+
+		:param timeout: Seconds to wait for the save to be confirmed
+		:return: True if the save was confirmed
+		"""
+		start = time()
+		ret = self._rcon_cmd('SaveWorld', timeout=timeout)
+		if ret is not None and 'World Saved' in ret:
+			saved = True
+		else:
+			saved = self._wait_for_world_file(start, max(timeout - (time() - start), 1))
+
+		if saved:
+			service_stats.record(self, 'save_seconds', round(time() - start, 1))
+		return saved
+
+	def _wait_for_world_file(self, since: float, timeout: float) -> bool:
+		"""
+		Wait for this map's world file to be written after a given time and then left alone
+
+		:param since: Time the save was requested
+		:param timeout: Seconds to wait
+		:return: True if the world file was rewritten and has not changed for a second
 		"""
-		self._rcon_cmd('SaveWorld')
+		path = self.get_saved_location()
+		end = time() + timeout
+		last = None
+		while time() < end:
+			written = None
+			if os.path.isdir(path):
+				for entry in os.scandir(path):
+					if entry.name.endswith('.ark') and entry.stat().st_mtime >= since:
+						written = (entry.name, entry.stat().st_mtime, entry.stat().st_size)
+			if written is not None and written == last:
+				return True
+			last = written
+			sleep(1)
+		return False
 
 	def rcon_message(self, message: str):
 		"""
@@ -520,13 +610,7 @@ class Services:
 		], stdout=subprocess.PIPE).stdout.decode().strip()
 
 		if mem.isdigit():
-			mem = int(mem)
-			if mem >= 1024 * 1024:
-				mem_gb = mem / (1024 * 1024)
-				return '%.2f GB' % mem_gb
-			else:
-				mem_mb = mem // 1024
-				return '%.0f MB' % mem_mb
+			return format_memory(int(mem))
 		else:
 			return 'N/A'
 
@@ -550,6 +634,43 @@ class Services:
 		else:
 			return 'N/A'
 
+	def get_cgroup_stat(self, stat: str) -> Union[None, str]:
+		"""
+		Read a value from the systemd cgroup of this service, or None if not available
+
+		These cover every process of the service and can be read without spawning ps.
+
+		:param stat: cgroup file to read, eg: memory.current
+		:return:
+		"""
+		path = os.path.join('/sys/fs/cgroup/system.slice', self.name + '.service', stat)
+		try:
+			with open(path, 'r') as f:
+				return f.read()
+		except OSError:
+			return None
+
+	def get_cgroup_memory(self) -> Union[None, int]:
+		"""
+		Get the anonymous memory of this service in bytes, or None if not available
+
+		Uses anon + shmem from memory.stat rather than memory.current or memory.peak,
+		as those also count the page cache of the game files, which every map shares.
+
+		:return:
+		"""
+		stat = self.get_cgroup_stat('memory.stat')
+		if stat is None:
+			return None
+		values = {}
+		for line in stat.splitlines():
+			key, _, value = line.partition(' ')
+			if key in ('anon', 'shmem'):
+				values[key] = int(value)
+		if 'anon' not in values:
+			return None
+		return values['anon'] + values.get('shmem', 0)
+
 	def get_saved_location(self) -> str:
 		if self.map == 'BobsMissions_WP':
 			map = 'BobsMissions'
@@ -666,6 +787,419 @@ class Services:
 		self.options = options
 
 
+class GameLog:
+	"""
+	Incremental reader for the game log, ShooterGame.log
+
+	Only lines written after the reader was created are returned,
+	so a reader should be created before issuing the command to watch for.
+	"""
+
+	ROSTER_MARKERS = ('joined this ARK', 'left this ARK')
+	"""
+	Log lines written by the server when a player joins or leaves the map
+	"""
+
+	READY_MARKERS = ('has completed startup and is now advertising for join',)
+	"""
+	Log lines written by the server once it has finished loading and accepts connections,
+	(as 'Server: "<session name>" has completed startup ...')
+	"""
+
+	def __init__(self):
+		self.path = os.path.join(here, 'AppFiles', 'ShooterGame', 'Saved', 'Logs', 'ShooterGame.log')
+		self.offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+		self._partial = b''
+
+	def read_lines(self) -> list:
+		"""
+		Get any complete lines written to the log since the last read
+		:return:
+		"""
+		if not os.path.exists(self.path):
+			return []
+
+		if os.path.getsize(self.path) < self.offset:
+			# The game truncates the log on startup, start again from the top.
+			self.offset = 0
+			self._partial = b''
+
+		with open(self.path, 'rb') as f:
+			f.seek(self.offset)
+			data = f.read()
+		self.offset += len(data)
+
+		lines = (self._partial + data).split(b'\n')
+		# The last entry is either empty or a line which is still being written.
+		self._partial = lines.pop()
+		return [line.decode('utf-8', errors='replace').rstrip('\r') for line in lines]
+
+	@staticmethod
+	def is_ready_line(line: str, session: str) -> bool:
+		"""
+		Check if a log line says the map with the given session name is ready
+
+		Every map writes to the same log, so the line has to name the map.
+
+		:param line:
+		:param session: Session name of the map
+		:return:
+		"""
+		return '"%s"' % session in line and any(m in line for m in GameLog.READY_MARKERS)
+
+	def wait_for(self, markers: tuple, timeout: float) -> Union[None, str]:
+		"""
+		Wait for a line containing any of the markers to be written to the log
+
+		:param markers: Substrings to look for
+		:param timeout: Seconds to wait
+		:return: The matching line, or None if the timeout was reached
+		"""
+		end = time() + timeout
+		while time() < end:
+			for line in self.read_lines():
+				if any(m in line for m in markers):
+					return line
+			sleep(0.25)
+		return None
+
+
+class ProcessWatch:
+	"""
+	Waits on a process to exit without polling systemd
+
+	Uses a pidfd where the kernel supports it, so an exit is seen the moment it happens.
+	"""
+
+	def __init__(self, pid: int):
+		self.pid = pid
+		self.fd = None
+		self.poller = None
+		if pid != 0 and hasattr(os, 'pidfd_open'):
+			try:
+				self.fd = os.pidfd_open(pid)
+				self.poller = select.poll()
+				self.poller.register(self.fd, select.POLLIN)
+			except OSError:
+				self.fd = None
+				self.poller = None
+
+	def wait(self, timeout: float) -> bool:
+		"""
+		Wait for the process to exit
+
+		:param timeout: Seconds to wait
+		:return: True if the process has exited
+		"""
+		if self.pid == 0:
+			return True
+		if self.poller is not None:
+			return len(self.poller.poll(timeout * 1000)) > 0
+
+		sleep(timeout)
+		return not os.path.exists('/proc/%s' % self.pid)
+
+	def close(self):
+		if self.fd is not None:
+			os.close(self.fd)
+			self.fd = None
+
+
+class ServiceStats:
+	"""
+	Timings of the last start and save of each map, kept in .service-stats.json
+
+	Recorded by whichever manage.py process starts or saves a map, and read by the metrics exporter.
+	"""
+
+	def __init__(self):
+		self.path = os.path.join(here, '.service-stats.json')
+		self.stats = {}
+		self.mtime = 0
+		self.lock = threading.Lock()
+		self.load()
+
+	def load(self):
+		"""
+		Reload the stats if another process has written them since the last read
+		:return:
+		"""
+		try:
+			mtime = os.path.getmtime(self.path)
+			if mtime != self.mtime:
+				with open(self.path, 'r') as f:
+					self.stats = json.load(f)
+				self.mtime = mtime
+		except (OSError, ValueError):
+			pass
+
+	def record(self, service, key: str, value: float):
+		"""
+		Record a stat for a service, eg: ready_seconds or save_seconds
+		:param service: Services
+		:param key:
+		:param value:
+		:return:
+		"""
+		with self.lock:
+			self.load()
+			self.stats.setdefault(service.name, {})[key] = value
+			with open(self.path + '.tmp', 'w') as f:
+				json.dump(self.stats, f)
+			os.replace(self.path + '.tmp', self.path)
+
+	def get(self, service, key: str) -> Union[None, float]:
+		return self.stats.get(service.name, {}).get(key)
+
+
+class MetricsExporter:
+	"""
+	Prometheus exporter for every map
+
+	A single background loop samples each map every MetricsInterval seconds, (default 15),
+	from its systemd cgroup, RCON, and the save files, and renders the metrics page once per sample.
+	Scrapes only return the last rendered page, so they never touch systemctl or RCON.
+	"""
+
+	METRICS = (
+		('ark_up', 'gauge', 'Whether the map service is running'),
+		('ark_players', 'gauge', 'Players currently connected'),
+		('ark_max_players', 'gauge', 'Maximum players allowed on the map'),
+		('ark_memory_bytes', 'gauge', 'Memory used by the map service cgroup, excluding page cache (anon + shmem)'),
+		('ark_cpu_seconds_total', 'counter', 'CPU time used by the map service cgroup'),
+		('ark_cpu_usage_ratio', 'gauge', 'CPU cores used by the map over the last sample interval'),
+		('ark_io_read_bytes_total', 'counter', 'Bytes read from disk by the map service cgroup'),
+		('ark_io_write_bytes_total', 'counter', 'Bytes written to disk by the map service cgroup'),
+		('ark_ready_seconds', 'gauge', 'Seconds the map took to become ready on its last start'),
+		('ark_save_size_bytes', 'gauge', 'Size of the map save file'),
+		('ark_last_save_duration_seconds', 'gauge', 'Seconds the last confirmed world save took'),
+	)
+
+	def __init__(self, services, interval: float):
+		self.services = services
+		self.interval = interval
+		self.page = b''
+		self._cpu = {}
+
+	def _sample_service(self, service) -> dict:
+		"""
+		Collect the current values for a single map
+		:param service: Services
+		:return: {metric: value}, (metrics without a value are omitted)
+		"""
+		procs = service.get_cgroup_stat('cgroup.procs')
+		up = procs is not None and procs.strip() != ''
+		values = {
+			'ark_up': 1 if up else 0,
+			'ark_max_players': int(service.get_option('MaxPlayers') or 70),
+		}
+
+		map_path = os.path.join(service.get_saved_location(), service.map + '.ark')
+		if os.path.exists(map_path):
+			values['ark_save_size_bytes'] = os.path.getsize(map_path)
+		for metric, key in (('ark_ready_seconds', 'ready_seconds'), ('ark_last_save_duration_seconds', 'save_seconds')):
+			if service_stats.get(service, key) is not None:
+				values[metric] = service_stats.get(service, key)
+
+		if not up:
+			self._cpu.pop(service.name, None)
+			return values
+
+		if service.is_rcon_available():
+			players = service.rcon_get_number_players()
+			if players is not None:
+				values['ark_players'] = players
+
+		# The same reading memory admission uses, so the two agree
+		memory = service.get_cgroup_memory()
+		if memory is not None:
+			values['ark_memory_bytes'] = memory
+
+		cpu = service.get_cgroup_stat('cpu.stat')
+		if cpu is not None:
+			usage = int(cpu.split('usage_usec', 1)[1].split()[0]) / 1000000
+			values['ark_cpu_seconds_total'] = usage
+			now = time()
+			if service.name in self._cpu:
+				last_usage, last_time = self._cpu[service.name]
+				values['ark_cpu_usage_ratio'] = round(max(usage - last_usage, 0) / max(now - last_time, 0.001), 3)
+			self._cpu[service.name] = (usage, now)
+
+		io = service.get_cgroup_stat('io.stat')
+		if io is not None:
+			read = write = 0
+			for field in io.split():
+				if field.startswith('rbytes='):
+					read += int(field[7:])
+				elif field.startswith('wbytes='):
+					write += int(field[7:])
+			values['ark_io_read_bytes_total'] = read
+			values['ark_io_write_bytes_total'] = write
+
+		return values
+
+	def sample(self):
+		"""
+		Sample every map and render the metrics page
+		:return:
+		"""
+		start = time()
+		service_stats.load()
+		samples = []
+		for service in self.services:
+			try:
+				samples.append((service, self._sample_service(service)))
+			except Exception as e:
+				print('⚠️  Unable to sample %s: %s' % (service.name, e), file=sys.stderr)
+
+		lines = []
+		for metric, metric_type, help_text in self.METRICS:
+			lines.append('# HELP %s %s' % (metric, help_text))
+			lines.append('# TYPE %s %s' % (metric, metric_type))
+			for service, values in samples:
+				if metric in values:
+					lines.append('%s{service="%s",map="%s"} %s' % (metric, service.name, service.map, values[metric]))
+		lines.append('# HELP ark_exporter_sample_seconds Seconds the last sample of all maps took')
+		lines.append('# TYPE ark_exporter_sample_seconds gauge')
+		lines.append('ark_exporter_sample_seconds %s' % round(time() - start, 3))
+		lines.append('# HELP ark_exporter_last_sample_timestamp_seconds Time of the last sample')
+		lines.append('# TYPE ark_exporter_last_sample_timestamp_seconds gauge')
+		lines.append('ark_exporter_last_sample_timestamp_seconds %s' % round(time(), 3))
+		# Swap in the new page in one assignment, scrapes in progress keep the previous one
+		self.page = ('\n'.join(lines) + '\n').encode('utf-8')
+
+	def _sample_loop(self):
+		while True:
+			next_sample = time() + self.interval
+			self.sample()
+			sleep(max(next_sample - time(), 0))
+
+	def serve(self, address: str, port: int):
+		"""
+		Start sampling and serve /metrics until interrupted
+		:param address:
+		:param port:
+		:return:
+		"""
+		exporter = self
+		self.sample()
+		threading.Thread(target=self._sample_loop, daemon=True).start()
+
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path.split('?', 1)[0] != '/metrics':
+					self.send_error(404)
+					return
+				page = exporter.page
+				self.send_response(200)
+				self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+				self.send_header('Content-Length', str(len(page)))
+				self.end_headers()
+				self.wfile.write(page)
+
+			def log_message(self, format, *args):
+				pass
+
+		print('Serving metrics on http://%s:%s/metrics' % (address, port))
+		ThreadingHTTPServer((address, port), Handler).serve_forever()
+
+
+class MemoryAdmission:
+	"""
+	Admission control for starting maps, based on the memory each map has used before
+
+	The memory of each map, (excluding page cache), is recorded once it is ready and again before it is stopped,
+	and a map is only started when its expected peak fits in the memory the host has left.
+	"""
+
+	def __init__(self):
+		# Earlier versions kept memory.peak in .memory-history.json, which included page cache
+		self.path = os.path.join(here, '.memory-usage.json')
+		self.history = {}
+		self.lock = threading.Lock()
+		if os.path.exists(self.path):
+			try:
+				with open(self.path, 'r') as f:
+					self.history = json.load(f)
+			except (OSError, ValueError):
+				self.history = {}
+
+	def record_peak(self, service):
+		"""
+		Record the memory of a running service from its cgroup
+
+		Only anonymous memory is recorded, (see Services.get_cgroup_memory);
+		the page cache of the game files is shared between maps and is reclaimed when memory runs low,
+		so counting it would refuse starts which would fit.
+		This is sampled once the map is ready and again before it is stopped.
+
+		:param service: Services
+		:return:
+		"""
+		peak = service.get_cgroup_memory()
+		if peak is None:
+			return
+
+		with self.lock:
+			peaks = self.history.get(service.name, [])
+			peaks.append(int(peak))
+			self.history[service.name] = peaks[-10:]
+			with open(self.path, 'w') as f:
+				json.dump(self.history, f)
+
+	def predict(self, service) -> int:
+		"""
+		Get the expected peak memory of a service in bytes
+
+		Uses the highest of the last recorded peaks plus 10%,
+		or the DefaultMapMemory setting (in GB, default 12) for maps without any history.
+
+		:param service: Services
+		:return:
+		"""
+		peaks = self.history.get(service.name, [])
+		if len(peaks) == 0:
+			return int(float(config['Manager'].get('DefaultMapMemory', '12') or '12') * 1024 * 1024 * 1024)
+		return int(max(peaks) * 1.1)
+
+	def check(self, service, starting: list) -> tuple:
+		"""
+		Check if there is enough memory available to start a service
+
+		Maps which are still loading have not reached their peak yet,
+		so the rest of their expected growth is held back from what is available.
+
+		:param service: Services
+		:param starting: Services[] currently starting
+		:return: ('start' | 'wait' | 'refuse', reason)
+		"""
+		meminfo = get_meminfo()
+		reserved = 0
+		for s in starting:
+			reserved += max(self.predict(s) - (s.get_cgroup_memory() or 0), 0)
+		free_ram = meminfo.get('MemAvailable', 0) * 1024 - reserved
+		free_swap = meminfo.get('SwapFree', 0) * 1024
+		needed = self.predict(service)
+
+		def fmt(b):
+			return format_memory(max(b, 0) // 1024)
+
+		if needed <= free_ram:
+			return 'start', ''
+		elif needed <= free_ram + free_swap:
+			return 'start', '%s needs about %s but only %s of RAM is free, it will use swap' % (
+				service.session, fmt(needed), fmt(free_ram)
+			)
+		elif len(starting) > 0:
+			return 'wait', '%s needs about %s but only %s is free, waiting for %s to finish loading' % (
+				service.session, fmt(needed), fmt(free_ram + free_swap), ', '.join([s.session for s in starting])
+			)
+		else:
+			return 'refuse', '%s needs about %s but only %s of RAM and %s of swap is available' % (
+				service.session, fmt(needed), fmt(free_ram), fmt(free_swap)
+			)
+
+
 class Table:
 	"""
 	Displays a table of data
@@ -813,34 +1347,6 @@ class ModLibrary(object):
 		return None
 
 
-def _safe_stop_inner(services, time_message):
-	"""
-
-	:param services: Services[]
-	:param time_message: str
-	:return:
-	"""
-	players_connected = False
-	for s in services:
-		if s.is_running():
-			players = s.rcon_get_number_players()
-			if players is None:
-				print('Unable to get player count for %s, RCON is probably not available' % s.session)
-				s.stop()
-			elif players > 0:
-				print('%s has %s players connected, sending warning' % (s.session, players))
-				s.rcon_message(time_message)
-				players_connected = True
-			else:
-				# RCON enabled, but no players connected.  GREAT!
-				print('Saving %s' % s.session)
-				s.rcon_save_world()
-				sleep(10)
-				print('Shutting down %s' % s.session)
-				s.stop()
-	return players_connected
-
-
 def print_error_log(num_lines = 20):
 	"""
 	Print the last lines of the error log
@@ -851,64 +1357,112 @@ def print_error_log(num_lines = 20):
 	subprocess.call(['tail', '-n', str(num_lines), log_file], stdout=sys.stdout)
 
 
+SHUTDOWN_SCHEDULE = (
+	('shutdown_5min', 60),
+	('shutdown_4min', 60),
+	('shutdown_3min', 60),
+	('shutdown_2min', 60),
+	('shutdown_1min', 30),
+	('shutdown_30sec', 30),
+	('shutdown_now', 0),
+)
+"""
+Warnings sent to players during a shutdown, along with the seconds to wait before the next warning
+"""
+
+
+def _wait_for_empty_map(service, timeout: float) -> bool:
+	"""
+	Wait until every player has left the map or the timeout is reached
+
+	The player count is re-checked as soon as a player joins or leaves according to the game log,
+	along with a periodic check in case the log misses an event.
+
+	:param service: Services
+	:param timeout: Seconds to wait
+	:return: True if the map emptied, (or RCON stopped responding), before the timeout
+	"""
+	log = GameLog()
+	end = time() + timeout
+	next_check = time() + 10
+	while time() < end:
+		roster_changed = any(
+			any(marker in line for marker in GameLog.ROSTER_MARKERS)
+			for line in log.read_lines()
+		)
+		if roster_changed or time() >= next_check:
+			players = service.rcon_get_number_players()
+			if players is None or players == 0:
+				return True
+			next_check = time() + 10
+		sleep(0.25)
+	return False
+
+
+def _safe_stop_service(service):
+	"""
+	Run the shutdown countdown, save, and stop for a single service
+	:param service: Services
+	:return:
+	"""
+	for message, wait in SHUTDOWN_SCHEDULE:
+		if not service.is_running():
+			return
+
+		players = service.rcon_get_number_players()
+		if players is None:
+			print('Unable to get player count for %s, RCON is probably not available' % service.session)
+			print('Shutting down %s' % service.session)
+			service.stop()
+			return
+		elif players == 0:
+			# RCON enabled, but no players connected.  GREAT!
+			break
+
+		print('%s has %s players connected, sending warning' % (service.session, players))
+		service.rcon_message(Messages.get(message))
+		if _wait_for_empty_map(service, wait):
+			print('All players have left %s, skipping the rest of the countdown' % service.session)
+
+	if service.is_running():
+		memory_admission.record_peak(service)
+		print('Saving %s' % service.session)
+		if service.rcon_save_world():
+			print('Save confirmed for %s' % service.session)
+		else:
+			print('⚠️  Unable to confirm save for %s' % service.session)
+		print('Shutting down %s' % service.session)
+		service.stop()
+
+
 def safe_stop(services):
 	"""
 	Safely stop all requested service files
+
+	Each map runs its own countdown, save, and stop at the same time,
+	so the whole set stops in the time of the slowest map.
+
 	:param services: Services[]
 	:return:
 	"""
 
-	maps = []
+	running = []
 	for s in services:
 		if s.is_running():
-			maps.append(s.session)
-	if len(maps) > 1:
-		discord_alert('maps_stopping', [', '.join(maps)])
-	elif len(maps) == 1:
-		discord_alert('map_stopping', [maps[0]])
-
-	players_connected = _safe_stop_inner(services, Messages.get('shutdown_5min'))
-
-	if players_connected:
-		print('Waiting a minute until the next warning (5 minutes remaining)')
-		sleep(60)
-		players_connected = _safe_stop_inner(services, Messages.get('shutdown_4min'))
-
-	if players_connected:
-		print('Waiting a minute until the next warning (4 minutes remaining)')
-		sleep(60)
-		players_connected = _safe_stop_inner(services, Messages.get('shutdown_3min'))
-
-	if players_connected:
-		print('Waiting a minute until the next warning (3 minutes remaining)')
-		sleep(60)
-		players_connected = _safe_stop_inner(services, Messages.get('shutdown_2min'))
-
-	if players_connected:
-		print('Waiting a minute until the next warning (2 minutes remaining)')
-		sleep(60)
-		players_connected = _safe_stop_inner(services, Messages.get('shutdown_1min'))
-
-	if players_connected:
-		print('Waiting 30 seconds until the next warning (1 minute remaining)')
-		sleep(30)
-		players_connected = _safe_stop_inner(services, Messages.get('shutdown_30sec'))
-
-	if players_connected:
-		print('Last warning')
-		sleep(30)
-		_safe_stop_inner(services, Messages.get('shutdown_now'))
+			running.append(s)
+	if len(running) > 1:
+		discord_alert('maps_stopping', [', '.join([s.session for s in running])])
+	elif len(running) == 1:
+		discord_alert('map_stopping', [running[0].session])
 
-	for s in services:
-		if s.is_running():
-			players = s.rcon_get_number_players()
-			if players is not None:
-				# RCON enabled, we can request a manual save
-				print('Saving %s' % s.session)
-				s.rcon_save_world()
-				sleep(10)
-			print('Shutting down %s' % s.session)
-			s.stop()
+	threads = []
+	for s in running:
+		thread = threading.Thread(target=_safe_stop_service, args=(s,), name=s.name)
+		thread.start()
+		threads.append(thread)
+
+	for thread in threads:
+		thread.join()
 
 
 def safe_restart(services):
@@ -929,95 +1483,235 @@ def safe_restart(services):
 	safe_start(running_services, True)
 
 
-def safe_start(services, ignore_enabled = False):
+STARTUP_TIMEOUT = 600
+"""
+Seconds to wait for a map to become ready after starting it
+"""
+
+
+def _print_start_failure(service):
 	"""
-	Start all enabled services that are not currently running
-	:param services: Services[]
-	:param ignore_enabled: bool Set to True to ignore the enabled flag
+	Report why a service exited during startup
+	:param service: Services
 	:return:
 	"""
-	for s in services:
-		if not s.is_enabled() and not ignore_enabled:
-			print('Skipping disabled map %s' % s.session)
-		elif s.is_running():
-			print('%s already running' % s.session)
-		else:
-			start_timer = time()
-			print('Starting %s, please wait, may take a minute...' % s.session)
-			print('loading................')
-			s.start()
-			check_counter = 0
-			ready = False
-			while check_counter < 600:
-				check_counter += 1
-				# Watch the exit status of the service,
-				# if this changes to something other than 0, it indicates a game crash.
-				exec_status = int(subprocess.run([
-					'systemctl', 'show', '-p', 'ExecMainStatus', s.name
-				], stdout=subprocess.PIPE).stdout.decode().strip()[15:])
-
-				if exec_status == 1:
-					print_error_log()
-					print('❗⛔❗ WARNING - Service has exited with status 1')
-					print('This may indicate corrupt files, please check logs and verify files with Steam.')
-					return
-				elif exec_status == 15:
-					print_error_log()
-					print('❗⛔❗ WARNING - Service has exited with status 15')
-					print('This may indicate that your server ran out of memory.')
-					return
-				elif exec_status != 0:
-					print_error_log()
-					print('❗⛔❗ WARNING - Service has exited with status %s' % exec_status)
-					return
+	# Watch the exit status of the service,
+	# if this is something other than 0, it indicates a game crash.
+	exec_status = int(subprocess.run([
+		'systemctl', 'show', '-p', 'ExecMainStatus', service.name
+	], stdout=subprocess.PIPE).stdout.decode().strip()[15:] or 0)
+
+	print_error_log()
+	if exec_status == 1:
+		print('❗⛔❗ WARNING - Service has exited with status 1')
+		print('This may indicate corrupt files, please check logs and verify files with Steam.')
+	elif exec_status == 15:
+		print('❗⛔❗ WARNING - Service has exited with status 15')
+		print('This may indicate that your server ran out of memory.')
+	elif exec_status != 0:
+		print('❗⛔❗ WARNING - Service has exited with status %s' % exec_status)
+	else:
+		print('❗⛔❗ WARNING - Process has crashed!')
 
-				if s.get_pid() == 0:
-					print_error_log()
-					print('❗⛔❗ WARNING - Process has crashed!')
-					return
 
-				status_rcon = 'waiting'
-				if check_counter >= 120:
-					# After a bit of time, start checking if RCON is available.
-					# That is the indication that the server is ready.
-					if s.is_rcon_available():
-						players_connected = s.rcon_get_number_players()
-						if players_connected is None:
-							status_rcon = '❌'
-						else:
-							status_rcon = '✅'
-							ready = True
-					else:
-						# RCON is not enabled so we do not know when it's really available.
+def _start_service(service, show_progress: bool = True) -> Union[None, float]:
+	"""
+	Start a single service and wait for it to become ready
+
+	Rather than polling systemctl and ps, this waits on the main process of the service, (so a crash is
+	seen immediately), and tails the game log for the server-ready line naming this map.
+	The log is shared by every map, so only ready lines written after the start which carry
+	this map's session name are accepted.
+	RCON is only probed once the log says the server is up, or periodically after two minutes
+	in case the ready line never shows up.  Maps without RCON are only ready once their own line is seen.
+
+	:param service: Services
+	:param show_progress: Set to False to skip the live status line, (useful when starting maps in parallel)
+	:return: Seconds taken to become ready, or None if the service did not start
+	"""
+	log = GameLog()
+	start_timer = time()
+	service.start()
+	process = ProcessWatch(service.get_pid())
+	next_probe = start_timer + 120
+	next_status = start_timer
+	status_rcon = 'waiting'
+	log_ready = False
+	cpu_usec = None
+	cpu_sampled = None
+
+	try:
+		while time() - start_timer < STARTUP_TIMEOUT:
+			if process.wait(0.25):
+				_print_start_failure(service)
+				return None
+
+			if any(GameLog.is_ready_line(line, service.session) for line in log.read_lines()):
+				log_ready = True
+				next_probe = time()
+
+			if time() >= next_probe:
+				if not service.is_rcon_available():
+					if log_ready:
+						# RCON is not enabled so we cannot confirm beyond what the log says.
 						status_rcon = '???'
-						ready = True
+						break
+					# Without RCON only this map's own ready line counts, keep waiting for it
+					next_probe = time() + 10
+				elif service.rcon_get_number_players() is None:
+					status_rcon = '❌'
+					next_probe = time() + (2 if log_ready else 10)
+				else:
+					status_rcon = '✅'
+					break
 
+			if show_progress and time() >= next_status:
 				# Clear the last line status output and provide a new dynamic update
-				seconds_elapsed = round(time() - start_timer)
-				since_minutes = str(seconds_elapsed // 60)
-				since_seconds = seconds_elapsed % 60
-				if since_seconds < 10:
-					since_seconds = '0' + str(since_seconds)
-				else:
-					since_seconds = str(since_seconds)
+				mem = service.get_cgroup_memory()
+				cpu = service.get_cgroup_stat('cpu.stat')
+				cpu_percent = 'N/A'
+				if cpu is not None:
+					usage = int(cpu.split()[1])
+					now = monotonic()
+					# Samples are not exactly a second apart, (RCON probes can hold up the loop)
+					if cpu_usec is not None and now > cpu_sampled:
+						cpu_percent = '%.0f%%' % ((usage - cpu_usec) / ((now - cpu_sampled) * 10000))
+					cpu_usec = usage
+					cpu_sampled = now
 				print(
 					'\033[1A\033[K Time: %s, CPU: %s, Memory: %s, RCON: %s' % (
-						since_minutes + ':' + since_seconds,
-						s.get_cpu_usage(),
-						s.get_memory_usage(),
+						format_duration(time() - start_timer),
+						cpu_percent,
+						format_memory(mem // 1024) if mem is not None else 'N/A',
 						status_rcon
 					)
 				)
+				next_status += 1
+		else:
+			print_error_log()
+			print('❗⛔❗ WARNING - Service did not become ready in time, please check logs!')
+			return None
+	finally:
+		process.close()
+
+	ready_time = time() - start_timer
+	memory_admission.record_peak(service)
+	service_stats.record(service, 'ready_seconds', round(ready_time, 1))
+	print('%s is ready after %s' % (service.session, format_duration(ready_time)))
+	discord_alert('map_started', [service.session])
+	return ready_time
 
-				if ready:
-					discord_alert('map_started', [s.session])
-					break
 
-				sleep(0.5)
+def _get_start_order(services) -> list:
+	"""
+	Sort services so the maps listed in the StartPriority setting start first
+
+	Maps not listed keep their existing order after the prioritised ones.
+
+	:param services: Services[]
+	:return: Services[]
+	"""
+	priority = [p.strip() for p in config['Manager'].get('StartPriority', '').split(',') if p.strip() != '']
+	return sorted(services, key=lambda s: priority.index(s.name) if s.name in priority else len(priority))
+
+
+def safe_start(services, ignore_enabled = False, concurrency: Union[None, int] = None, check_memory: bool = True):
+	"""
+	Start all enabled services that are not currently running
+
+	Up to `concurrency` maps are started at the same time, (default from the StartConcurrency setting, or 1),
+	and the next map starts as soon as one of them is ready.
+
+	Each map is only started once its expected memory use fits in what the host has available.
+	Starts are delayed while other maps are still loading, and refused if the map cannot fit at all.
+
+	:param services: Services[]
+	:param ignore_enabled: bool Set to True to ignore the enabled flag
+	:param concurrency: Number of maps to start at the same time
+	:param check_memory: Set to False to skip the memory admission check
+	:return:
+	"""
+	if concurrency is None:
+		concurrency = int(config['Manager'].get('StartConcurrency', '1') or '1')
+	concurrency = max(concurrency, 1)
+
+	pending = queue.Queue()
+	for s in _get_start_order(services):
+		if not s.is_enabled() and not ignore_enabled:
+			print('Skipping disabled map %s' % s.session)
+		elif s.is_running():
+			print('%s already running' % s.session)
+		else:
+			pending.put(s)
+
+	results = []
+	refused = []
+	starting = []
+	starting_lock = threading.Lock()
+	crashed = threading.Event()
+
+	def admit(s) -> bool:
+		announced = None
+		while True:
+			with starting_lock:
+				decision, reason = memory_admission.check(s, starting)
+				if decision == 'start':
+					starting.append(s)
+
+			if decision == 'start':
+				if reason:
+					print('⚠️  %s' % reason)
+				return True
+			elif decision == 'refuse':
+				print('❗⛔❗ Not starting %s' % reason)
+				return False
+			elif reason != announced:
+				print(reason)
+				announced = reason
+			sleep(5)
+
+	def start_worker():
+		while not crashed.is_set():
+			try:
+				s = pending.get_nowait()
+			except queue.Empty:
+				return
 
-			if not ready:
-				print_error_log()
-				print('❗⛔❗ WARNING - Service did not become ready in time, please check logs!')
+			if check_memory and not admit(s):
+				refused.append(s)
+				continue
+
+			print('Starting %s, please wait, may take a minute...' % s.session)
+			if concurrency == 1:
+				print('loading................')
+			ready_time = _start_service(s, show_progress=concurrency == 1)
+			with starting_lock:
+				if s in starting:
+					starting.remove(s)
+			results.append((s, ready_time))
+			if ready_time is None and not s.is_running():
+				# Do not keep piling maps onto a server which just crashed one.
+				crashed.set()
+
+	start_timer = time()
+	workers = []
+	for i in range(min(concurrency, pending.qsize())):
+		worker = threading.Thread(target=start_worker, name='start-%s' % i)
+		worker.start()
+		workers.append(worker)
+	for worker in workers:
+		worker.join()
+
+	if len(results) + len(refused) > 1 or not pending.empty():
+		print('')
+		print('Startup summary:')
+		for s, ready_time in results:
+			print(' - %s: %s' % (s.session, format_duration(ready_time) if ready_time is not None else 'FAILED'))
+		for s in refused:
+			print(' - %s: not enough memory' % s.session)
+		while not pending.empty():
+			print(' - %s: skipped' % pending.get_nowait().session)
+		print('All maps processed in %s' % format_duration(time() - start_timer))
 
 
 def save_config():
@@ -1421,34 +2115,714 @@ def menu_messages():
 			save_config()
 
 
+FICLONE = 0x40049409
+"""
+ioctl to share the extents of one file with another, (a reflink copy), on filesystems which support it
+"""
+
+
+def _snapshot_file(src: str, dest: str):
+	"""
+	Copy a single save file into a snapshot
+
+	SQLite saves, (the current save format), are copied with the SQLite online backup API so the copy
+	is consistent even if the game writes to it meanwhile.  Other files are reflinked where the filesystem
+	supports it, which is instant and takes no extra space, or copied otherwise.
+
+	:param src:
+	:param dest:
+	:return:
+	"""
+	with open(src, 'rb') as f:
+		is_sqlite = f.read(16) == b'SQLite format 3\x00'
+
+	if is_sqlite:
+		source_db = sqlite3.connect('file:%s?mode=ro' % src, uri=True)
+		dest_db = sqlite3.connect(dest)
+		try:
+			source_db.backup(dest_db)
+		finally:
+			dest_db.close()
+			source_db.close()
+	else:
+		with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
+			try:
+				fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+			except OSError:
+				shutil.copyfileobj(fsrc, fdest, 1024 * 1024)
+	shutil.copystat(src, dest)
+
+
+def snapshot_saves(services) -> Union[None, str]:
+	"""
+	Capture a consistent copy of the save data while the maps keep running
+
+	Every running map is told to save over RCON, (all at the same time), and once each save is confirmed
+	the same files backup.sh archives are copied into a snapshot directory under backups/.
+
+	:param services: Services[]
+	:return: Path of the snapshot directory, or None if a save could not be confirmed
+	"""
+	running = [s for s in services if s.is_running()]
+	saved = {}
+
+	def _save(service):
+		saved[service.name] = service.rcon_save_world()
+
+	threads = []
+	for s in running:
+		print('Saving world on %s' % s.session)
+		thread = threading.Thread(target=_save, args=(s,), name=s.name)
+		thread.start()
+		threads.append(thread)
+	for thread in threads:
+		thread.join()
+
+	failed = [s.session for s in running if not saved.get(s.name)]
+	if len(failed) > 0:
+		print('❗⛔❗ Unable to confirm the world save on %s, backup aborted' % ', '.join(failed))
+		return None
+
+	save_dir = os.path.join(here, 'AppFiles', 'ShooterGame', 'Saved')
+	# Unique per run, so two live backups started close together never share a snapshot
+	os.makedirs(os.path.join(here, 'backups'), exist_ok=True)
+	snapshot = tempfile.mkdtemp(prefix='.snapshot-%s-' % strftime('%Y-%m-%d_%H-%M-%S'), dir=os.path.join(here, 'backups'))
+	skip_suffixes = ('.profilebak', '.tribebak', '-journal', '-wal', '-shm')
+	start = time()
+	for path in ('clusters', os.path.join('Config', 'WindowsServer'), 'SavedArks'):
+		for root, dirs, files in os.walk(os.path.join(save_dir, path)):
+			dest_dir = os.path.join(snapshot, os.path.relpath(root, save_dir))
+			os.makedirs(dest_dir, exist_ok=True)
+			for file in files:
+				if file.endswith(skip_suffixes) or (file.endswith('.ark') and ('_WP_0' in file or '_WP_1' in file)):
+					continue
+				_snapshot_file(os.path.join(root, file), os.path.join(dest_dir, file))
+
+	print('Captured snapshot of the save data in %s seconds' % round(time() - start, 1))
+	return snapshot
+
+
+class BackupCatalog:
+	"""
+	Index of the backup archives and their contents, kept in backups/catalog.json
+
+	backup.sh adds each archive as it is written, (see --catalog-add), so listing backups,
+	reporting disk usage, and pruning old backups never need to open an archive.
+	The size and hash of every file within each archive are kept in backups/.manifests/.
+	"""
+
+	EXTENSIONS = ('.tgz', '.tar.zst', '.tzst')
+
+	def __init__(self):
+		self.path = os.path.join(here, 'backups')
+		self.catalog_file = os.path.join(self.path, 'catalog.json')
+		self.manifest_path = os.path.join(self.path, '.manifests')
+		self.archives = {}
+		"""
+		Archive filename => created, size, sha256, and maps, ({map: bytes})
+		"""
+
+		if os.path.exists(self.catalog_file):
+			with open(self.catalog_file, 'r') as f:
+				self.archives = json.load(f).get('archives', {})
+
+	def save(self):
+		os.makedirs(self.path, exist_ok=True)
+		with open(self.catalog_file + '.tmp', 'w') as f:
+			json.dump({'archives': self.archives}, f, indent=1)
+		os.replace(self.catalog_file + '.tmp', self.catalog_file)
+
+	def sync(self):
+		"""
+		Drop entries for deleted archives and add basic entries for archives made before the catalog existed
+
+		Only the directory listing is read, not the archives themselves.
+
+		:return:
+		"""
+		changed = False
+		present = []
+		if os.path.exists(self.path):
+			present = [f for f in os.listdir(self.path) if f.endswith(self.EXTENSIONS)]
+		for name in list(self.archives.keys()):
+			if name not in present:
+				del self.archives[name]
+				changed = True
+		for name in present:
+			if name not in self.archives:
+				stat = os.stat(os.path.join(self.path, name))
+				self.archives[name] = {'created': stat.st_mtime, 'size': stat.st_size, 'sha256': None, 'maps': {}}
+				changed = True
+		if changed:
+			self.save()
+
+	def add(self, archive: str) -> dict:
+		"""
+		Record a newly written archive, along with the per-file manifest of what it contains
+
+		The archive is read once: its checksum and the hash of every file within it are computed
+		while it is streamed through the decompressor, so the manifest describes exactly what was archived.
+
+		:param archive: Path of the archive
+		:return: Catalog entry
+		"""
+		files = {}
+		maps = {}
+		archive_hash = hashlib.sha256()
+		with open(archive, 'rb') as raw:
+			reader = _HashingReader(raw, archive_hash)
+			proc = None
+			feeder = None
+			if archive.endswith(('.zst', '.tzst')):
+				proc = subprocess.Popen(['zstd', '-dcq'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+				def _feed():
+					try:
+						for block in iter(lambda: reader.read(1024 * 1024), b''):
+							proc.stdin.write(block)
+					except BrokenPipeError:
+						pass
+					finally:
+						proc.stdin.close()
+
+				feeder = threading.Thread(target=_feed)
+				feeder.start()
+				tar = tarfile.open(fileobj=proc.stdout, mode='r|')
+			else:
+				tar = tarfile.open(fileobj=reader, mode='r|gz')
+
+			with tar:
+				for member in tar:
+					if not member.isfile():
+						continue
+					file_hash = hashlib.sha256()
+					with tar.extractfile(member) as f:
+						for block in iter(lambda: f.read(1024 * 1024), b''):
+							file_hash.update(block)
+					rel_path = os.path.normpath(member.name)
+					files[rel_path] = {'size': member.size, 'sha256': file_hash.hexdigest()}
+					parts = rel_path.split(os.sep)
+					if parts[0] == 'SavedArks' and len(parts) > 2:
+						maps[parts[1]] = maps.get(parts[1], 0) + member.size
+
+			if feeder is not None:
+				proc.stdout.close()
+				feeder.join()
+				proc.wait()
+			# The tar reader stops at the end-of-archive marker, hash whatever padding follows it
+			for block in iter(lambda: reader.read(1024 * 1024), b''):
+				pass
+
+		name = os.path.basename(archive)
+		os.makedirs(self.manifest_path, exist_ok=True)
+		with open(os.path.join(self.manifest_path, name + '.json'), 'w') as f:
+			json.dump({'archive': name, 'files': files}, f)
+
+		self.archives[name] = {
+			'created': time(),
+			'size': os.path.getsize(archive),
+			'sha256': archive_hash.hexdigest(),
+			'maps': maps,
+		}
+		self.save()
+		return self.archives[name]
+
+	def get_archives(self) -> list:
+		"""
+		Get all archives, newest first
+
+		:return: [(filename, entry), ...]
+		"""
+		return sorted(self.archives.items(), key=lambda a: a[1]['created'], reverse=True)
+
+	def get_manifest(self, name: str) -> Union[None, dict]:
+		"""
+		Get the size and hash of each file within an archive, as recorded when it was created
+
+		:param name: Archive filename
+		:return: {path: {size, sha256}}, or None for archives made before the catalog existed
+		"""
+		manifest_file = os.path.join(self.manifest_path, name + '.json')
+		if not os.path.exists(manifest_file):
+			return None
+		with open(manifest_file, 'r') as f:
+			return json.load(f)['files']
+
+	def get_total_size(self) -> int:
+		return sum(entry['size'] for entry in self.archives.values())
+
+	def get_retained(self, last: int, daily: int, weekly: int, monthly: int) -> list:
+		"""
+		Select the archives to keep under a grandfather-father-son policy
+
+		The newest `last` archives are kept, plus the newest archive of each of the
+		most recent `daily` days, `weekly` weeks, and `monthly` months which have a backup.
+
+		:return: Archive filenames to keep
+		"""
+		archives = self.get_archives()
+		keep = set([name for name, entry in archives[:last]])
+		for count, period in ((daily, '%Y-%m-%d'), (weekly, '%G-%V'), (monthly, '%Y-%m')):
+			periods = []
+			for name, entry in archives:
+				key = strftime(period, localtime(entry['created']))
+				if key in periods:
+					continue
+				if len(periods) >= count:
+					break
+				periods.append(key)
+				keep.add(name)
+		return [name for name, entry in archives if name in keep]
+
+	def prune(self, dry_run: bool = False) -> list:
+		"""
+		Delete the archives not retained by the BackupKeepLast, BackupKeepDaily, BackupKeepWeekly,
+		and BackupKeepMonthly settings, (default 5, 7, 4, and 12)
+
+		:param dry_run: Only report which archives would be deleted
+		:return: Deleted archive filenames
+		"""
+		keep = self.get_retained(
+			int(config['Manager'].get('BackupKeepLast', '5') or '5'),
+			int(config['Manager'].get('BackupKeepDaily', '7') or '7'),
+			int(config['Manager'].get('BackupKeepWeekly', '4') or '4'),
+			int(config['Manager'].get('BackupKeepMonthly', '12') or '12')
+		)
+		removed = [name for name, entry in self.get_archives() if name not in keep]
+		if dry_run:
+			return removed
+
+		for name in removed:
+			os.remove(os.path.join(self.path, name))
+			manifest_file = os.path.join(self.manifest_path, name + '.json')
+			if os.path.exists(manifest_file):
+				os.remove(manifest_file)
+			del self.archives[name]
+		self.save()
+		return removed
+
+
+def verify_backup(catalog: BackupCatalog, name: str) -> Union[None, bool]:
+	"""
+	Check that a backup restores to exactly the files recorded when it was made
+
+	The archive is extracted into a scratch directory next to the backups and every file
+	is hashed in parallel, (one process per core), then compared against the archive manifest.
+	The result is recorded in the catalog.
+
+	:param catalog:
+	:param name: Archive filename
+	:return: True if every file matches, False on any mismatch, None if the archive has no manifest to check against
+	"""
+	manifest = catalog.get_manifest(name)
+	if manifest is None:
+		print('⚠️  %s is unverified, it has no manifest, (created before the backup catalog)' % name)
+		return None
+
+	archive = os.path.join(catalog.path, name)
+	if name.endswith(('.zst', '.tzst')):
+		decompressor = 'zstd -d -T0'
+	else:
+		decompressor = 'gzip -d'
+
+	start = time()
+	scratch = tempfile.mkdtemp(prefix='.verify-', dir=catalog.path)
+	try:
+		ret = subprocess.run(
+			['tar', '-xf', archive, '--use-compress-program=%s' % decompressor, '-C', scratch],
+			stdout=subprocess.DEVNULL,
+			stderr=subprocess.PIPE
+		)
+		problems = []
+		if catalog.archives[name].get('sha256') and _hash_file(archive) != catalog.archives[name]['sha256']:
+			problems.append('archive checksum differs from when it was created')
+		if ret.returncode != 0:
+			problems.append('archive could not be extracted: %s' % ret.stderr.decode('utf-8', 'replace').strip())
+
+		extracted = []
+		for root, dirs, files in os.walk(scratch):
+			for file in files:
+				extracted.append(os.path.relpath(os.path.join(root, file), scratch))
+
+		to_hash = [path for path in extracted if path in manifest]
+		# Fork explicitly so the workers do not re-run this script on start
+		with ProcessPoolExecutor(mp_context=multiprocessing.get_context('fork')) as pool:
+			hashes = dict(zip(to_hash, pool.map(_hash_file, [os.path.join(scratch, p) for p in to_hash], chunksize=4)))
+
+		for path, expected in sorted(manifest.items()):
+			if path not in hashes:
+				problems.append('%s: missing from archive' % path)
+			elif os.path.getsize(os.path.join(scratch, path)) != expected['size']:
+				problems.append('%s: size %s, expected %s' % (path, os.path.getsize(os.path.join(scratch, path)), expected['size']))
+			elif hashes[path] != expected['sha256']:
+				problems.append('%s: contents differ' % path)
+		for path in sorted(set(extracted) - set(manifest.keys())):
+			problems.append('%s: not in manifest' % path)
+	finally:
+		shutil.rmtree(scratch)
+
+	catalog.archives[name]['verified'] = time()
+	catalog.archives[name]['verified_ok'] = len(problems) == 0
+	catalog.save()
+
+	if len(problems) == 0:
+		print('%s verified, %s files in %s seconds' % (name, len(manifest), round(time() - start, 1)))
+		return True
+
+	print('❗⛔❗ %s failed verification:' % name)
+	for problem in problems:
+		print('  %s' % problem)
+	return False
+
+
+class _HashingReader:
+	"""
+	File wrapper which hashes everything read through it
+	"""
+
+	def __init__(self, f, file_hash):
+		self.f = f
+		self.hash = file_hash
+
+	def read(self, size: int = -1) -> bytes:
+		data = self.f.read(size)
+		self.hash.update(data)
+		return data
+
+
+def _hash_file(path: str) -> str:
+	"""
+	Get the SHA-256 of a file, read in 1MB blocks
+
+	:param path:
+	:return:
+	"""
+	file_hash = hashlib.sha256()
+	with open(path, 'rb') as f:
+		for block in iter(lambda: f.read(1024 * 1024), b''):
+			file_hash.update(block)
+	return file_hash.hexdigest()
+
+
+class RateLimiter:
+	"""
+	Token bucket shared between threads to cap the combined transfer rate
+	"""
+
+	def __init__(self, bytes_per_second: int):
+		self.rate = bytes_per_second
+		self.allowance = bytes_per_second
+		self.last = time()
+		self.lock = threading.Lock()
+
+	def consume(self, size: int):
+		"""
+		Block until `size` bytes may be sent
+
+		:param size:
+		:return:
+		"""
+		if self.rate <= 0:
+			return
+		with self.lock:
+			now = time()
+			self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate) - size
+			self.last = now
+			wait = -self.allowance / self.rate if self.allowance < 0 else 0
+		if wait > 0:
+			sleep(wait)
+
+
+class S3Uploader:
+	"""
+	Upload backups to an S3-compatible object store, (AWS, MinIO, Backblaze B2, Wasabi, etc)
+
+	Archives are sent as multipart uploads with several parts in flight at once.
+	Completed parts are checkpointed to backups/.uploads/ so an interrupted upload resumes where it left off,
+	and an optional bandwidth limit keeps uploads from starving game traffic.
+
+	Configured in the [S3] section of .settings.ini.
+	"""
+
+	def __init__(self):
+		settings = config['S3']
+		self.endpoint = urlparse(settings.get('endpoint', '') or 'https://s3.amazonaws.com')
+		self.bucket = settings.get('bucket', '')
+		self.region = settings.get('region', '') or 'us-east-1'
+		self.access_key = settings.get('access_key', '')
+		self.secret_key = settings.get('secret_key', '')
+		self.prefix = settings.get('prefix', '')
+		self.concurrency = int(settings.get('concurrency', '4') or '4')
+		self.part_size = max(int(float(settings.get('part_size', '64') or '64') * 1024 * 1024), 5 * 1024 * 1024)
+		self.limiter = RateLimiter(int(float(settings.get('bandwidth_limit', '0') or '0') * 1024 * 1024))
+		self.checkpoint_path = os.path.join(here, 'backups', '.uploads')
+		self._local = threading.local()
+
+	def _get_connection(self, reset: bool = False):
+		"""
+		Get the persistent connection for the current thread
+
+		:param reset: Discard the current connection, (after an error)
+		:return:
+		"""
+		conn = getattr(self._local, 'conn', None)
+		if conn is not None and reset:
+			conn.close()
+			conn = None
+		if conn is None:
+			if self.endpoint.scheme == 'http':
+				conn = http.client.HTTPConnection(self.endpoint.netloc, timeout=60)
+			else:
+				conn = http.client.HTTPSConnection(self.endpoint.netloc, timeout=60)
+			self._local.conn = conn
+		return conn
+
+	def _sign(self, method: str, path: str, query: dict, payload_hash: str, now: datetime.datetime = None) -> dict:
+		"""
+		Build the AWS Signature Version 4 headers for a request
+
+		:param method:
+		:param path: URI encoded path, (including the bucket)
+		:param query:
+		:param payload_hash: SHA-256 of the request body
+		:param now: Time to sign the request for, (UTC), defaults to the current time
+		:return: Headers
+		"""
+		if now is None:
+			now = datetime.datetime.now(datetime.timezone.utc)
+		amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+		scope = '%s/%s/s3/aws4_request' % (now.strftime('%Y%m%d'), self.region)
+		headers = {
+			'host': self.endpoint.netloc,
+			'x-amz-content-sha256': payload_hash,
+			'x-amz-date': amz_date,
+		}
+		canonical_query = '&'.join(
+			'%s=%s' % (quote(k, safe='-_.~'), quote(str(v), safe='-_.~')) for k, v in sorted(query.items())
+		)
+		signed_headers = ';'.join(sorted(headers.keys()))
+		canonical_request = '\n'.join([
+			method,
+			path,
+			canonical_query,
+			''.join('%s:%s\n' % (k, headers[k]) for k in sorted(headers.keys())),
+			signed_headers,
+			payload_hash
+		])
+		string_to_sign = '\n'.join([
+			'AWS4-HMAC-SHA256',
+			amz_date,
+			scope,
+			hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+		])
+		key = ('AWS4' + self.secret_key).encode('utf-8')
+		for part in (now.strftime('%Y%m%d'), self.region, 's3', 'aws4_request'):
+			key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+		signature = hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+		headers['authorization'] = 'AWS4-HMAC-SHA256 Credential=%s/%s, SignedHeaders=%s, Signature=%s' % (
+			self.access_key, scope, signed_headers, signature
+		)
+		return headers
+
+	def _request(self, method: str, key: str, query: dict, body: bytes = b'', limit: bool = False):
+		"""
+		Send a signed request, retrying up to 3 times on connection errors and server errors
+
+		:param method:
+		:param key: Object key
+		:param query:
+		:param body:
+		:param limit: Apply the bandwidth limit to the request body
+		:return: (status, headers, response body)
+		"""
+		path = '/%s/%s' % (quote(self.bucket, safe=''), quote(key, safe='/-_.~'))
+		headers = self._sign(method, path, query, hashlib.sha256(body).hexdigest())
+		headers['content-length'] = str(len(body))
+		url = path
+		if len(query) > 0:
+			url += '?' + '&'.join('%s=%s' % (quote(k, safe='-_.~'), quote(str(v), safe='-_.~')) for k, v in query.items())
+
+		def _body():
+			view = memoryview(body)
+			for offset in range(0, len(body), 256 * 1024):
+				piece = view[offset:offset + 256 * 1024]
+				self.limiter.consume(len(piece))
+				yield piece
+
+		for attempt in range(3):
+			try:
+				conn = self._get_connection(reset=attempt > 0)
+				conn.request(method, url, body=_body() if limit and len(body) > 0 else body, headers=headers)
+				response = conn.getresponse()
+				data = response.read()
+				if response.status >= 500 and attempt < 2:
+					sleep(2 ** attempt)
+					continue
+				return response.status, response, data
+			except (OSError, http.client.HTTPException):
+				if attempt == 2:
+					raise
+				sleep(2 ** attempt)
+
+	def upload(self, archive: str) -> bool:
+		"""
+		Upload an archive, resuming a previous interrupted upload of the same file
+
+		:param archive: Path of the archive
+		:return:
+		"""
+		name = os.path.basename(archive)
+		key = self.prefix.strip('/') + '/' + name if self.prefix.strip('/') else name
+		stat = os.stat(archive)
+		checkpoint_file = os.path.join(self.checkpoint_path, name + '.json')
+
+		checkpoint = None
+		if os.path.exists(checkpoint_file):
+			with open(checkpoint_file, 'r') as f:
+				checkpoint = json.load(f)
+			if checkpoint['size'] != stat.st_size or checkpoint['mtime'] != stat.st_mtime or checkpoint['key'] != key:
+				checkpoint = None
+			else:
+				print('Resuming upload of %s, %s parts already sent' % (name, len(checkpoint['parts'])))
+
+		if checkpoint is None:
+			status, response, data = self._request('POST', key, {'uploads': ''})
+			if status != 200:
+				print('❗⛔❗ Unable to start upload of %s: %s %s' % (name, status, data.decode('utf-8', 'replace')))
+				return False
+			upload_id = re.search(r'<UploadId>(.+?)</UploadId>', data.decode('utf-8')).group(1)
+			checkpoint = {
+				'key': key,
+				'upload_id': upload_id,
+				'size': stat.st_size,
+				'mtime': stat.st_mtime,
+				'part_size': self.part_size,
+				'parts': {}
+			}
+			os.makedirs(self.checkpoint_path, exist_ok=True)
+			with open(checkpoint_file, 'w') as f:
+				json.dump(checkpoint, f)
+
+		part_size = checkpoint['part_size']
+		part_count = max(1, -(-stat.st_size // part_size))
+		pending = queue.Queue()
+		for number in range(1, part_count + 1):
+			if str(number) not in checkpoint['parts']:
+				pending.put(number)
+
+		lock = threading.Lock()
+		errors = []
+		sent = []
+		start = time()
+
+		def _worker():
+			with open(archive, 'rb') as f:
+				while len(errors) == 0:
+					try:
+						number = pending.get_nowait()
+					except queue.Empty:
+						return
+					f.seek((number - 1) * part_size)
+					body = f.read(part_size)
+					try:
+						status, response, data = self._request(
+							'PUT', key, {'partNumber': number, 'uploadId': checkpoint['upload_id']}, body, limit=True
+						)
+					except (OSError, http.client.HTTPException) as e:
+						status, response, data = 0, None, str(e).encode('utf-8')
+					if status != 200:
+						errors.append('part %s: %s %s' % (number, status, data.decode('utf-8', 'replace')))
+						return
+					with lock:
+						checkpoint['parts'][str(number)] = response.getheader('ETag')
+						sent.append(len(body))
+						with open(checkpoint_file, 'w') as cf:
+							json.dump(checkpoint, cf)
+						print('Uploaded part %s/%s of %s' % (len(checkpoint['parts']), part_count, name))
+
+		threads = [threading.Thread(target=_worker) for i in range(min(self.concurrency, pending.qsize()))]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+
+		if len(errors) > 0:
+			if 'NoSuchUpload' in errors[0]:
+				# The store discarded the upload, (expired or aborted), so start over next time
+				os.remove(checkpoint_file)
+			print('❗⛔❗ Upload of %s interrupted, run again to resume: %s' % (name, errors[0]))
+			return False
+
+		body = '<CompleteMultipartUpload>%s</CompleteMultipartUpload>' % ''.join(
+			'<Part><PartNumber>%s</PartNumber><ETag>%s</ETag></Part>' % (n, checkpoint['parts'][str(n)])
+			for n in range(1, part_count + 1)
+		)
+		status, response, data = self._request('POST', key, {'uploadId': checkpoint['upload_id']}, body.encode('utf-8'))
+		if status != 200 or b'<Error>' in data:
+			print('❗⛔❗ Unable to complete upload of %s: %s %s' % (name, status, data.decode('utf-8', 'replace')))
+			return False
+
+		os.remove(checkpoint_file)
+		elapsed = max(time() - start, 0.001)
+		print('Uploaded %s to %s/%s (%s MB/s)' % (name, self.bucket, key, round(sum(sent) / 1048576 / elapsed, 1)))
+		return True
+
+
+def get_backup_command() -> list:
+	"""
+	Get the backup.sh command line for the BackupCompression, BackupLevel, and BackupThreads settings
+
+	BackupCompression is either gzip, (default), or zstd, which compresses with every core unless BackupThreads is set.
+
+	:return:
+	"""
+	cmd = [os.path.join(here, 'backup.sh'), '--compression', config['Manager'].get('BackupCompression', 'gzip') or 'gzip']
+	if config['Manager'].get('BackupLevel', ''):
+		cmd += ['--level', config['Manager']['BackupLevel']]
+	if config['Manager'].get('BackupThreads', ''):
+		cmd += ['--threads', config['Manager']['BackupThreads']]
+	return cmd
+
+
 def menu_backup_restore():
 	while True:
 		header('Backups and Restore')
 		print('')
-		backups = []
-		if os.path.exists(os.path.join(here, 'backups')):
-			for f in os.listdir(os.path.join(here, 'backups')):
-				if f.endswith('.tgz'):
-					backups.append(f)
+		catalog = BackupCatalog()
+		catalog.sync()
+		backups = [name for name, entry in catalog.get_archives()]
 		print('Existing Backups:')
 		counter = 0
-		for b in backups:
+		for name, entry in catalog.get_archives():
 			counter += 1
-			backup_size = os.path.getsize(os.path.join(here, 'backups', b))
-			backup_size_mb = round(backup_size / (1024 * 1024))
-			print('%s - %s (%s MB)' % (counter, b, backup_size_mb))
+			backup_size_mb = round(entry['size'] / (1024 * 1024))
+			maps = ', '.join(sorted(entry['maps'].keys())) or 'unknown maps'
+			print('%s - %s (%s MB) %s' % (counter, name, backup_size_mb, maps))
 		if len(backups) == 0:
 			print('No backups found')
+		else:
+			print('Total: %s MB' % round(catalog.get_total_size() / (1024 * 1024)))
 
 		print('')
 		if len(backups) > 0:
 			print('Enter 1-%s to restore a backup' % len(backups))
-		print('[N]ew Backup | [B]ack')
+		print('[N]ew Backup | [P]rune Old Backups | [B]ack')
 		opt = input(': ').lower()
 
 		if opt == 'n':
 			print('Creating new backup... please wait a moment')
-			subprocess.run([os.path.join(here, 'backup.sh')], stderr=sys.stderr, stdout=sys.stdout)
+			subprocess.run(get_backup_command(), stderr=sys.stderr, stdout=sys.stdout)
+		elif opt == 'p':
+			removed = catalog.prune(dry_run=True)
+			if len(removed) == 0:
+				print('No backups to prune')
+				continue
+			print('The following backups will be deleted:')
+			for name in removed:
+				print('  %s' % name)
+			print('Continue? [y/N]')
+			if input(': ').lower() == 'y':
+				catalog.prune()
 		elif opt == 'b':
 			return
 		elif opt.isdigit() and 1 <= int(opt) <= len(backups):
@@ -1576,6 +2950,11 @@ if 'Messages' not in config.sections():
 	config['Messages'] = {}
 if 'Manager' not in config.sections():
 	config['Manager'] = {}
+if 'S3' not in config.sections():
+	config['S3'] = {}
+
+memory_admission = MemoryAdmission()
+service_stats = ServiceStats()
 
 shared_settings = None
 shared_path = os.path.join(here, 'AppFiles', 'ShooterGame', 'Saved', 'Config', 'WindowsServer', 'GameUserSettings.ini')
@@ -1619,6 +2998,17 @@ parser.add_argument(
 	help='Restart the game server',
 	action='store_true'
 )
+parser.add_argument(
+	'--ignore-memory',
+	help='Start maps even if the server does not appear to have enough memory for them',
+	action='store_true'
+)
+parser.add_argument(
+	'--concurrency',
+	help='Number of maps to start at the same time (default: StartConcurrency setting or 1)',
+	type=int,
+	default=None
+)
 #parser.add_argument(
 #	'--monitor',
 #	help='Monitor the game server status in real time',
@@ -1629,6 +3019,11 @@ parser.add_argument(
 	help='Backup the game server files',
 	action='store_true'
 )
+parser.add_argument(
+	'--live',
+	help='With --backup, snapshot the save data of running maps instead of stopping them, and archive in the background',
+	action='store_true'
+)
 #parser.add_argument(
 #	'--restore',
 #	help='Restore the game server files from a backup archive',
@@ -1640,6 +3035,44 @@ parser.add_argument(
 #	help='Check for game updates via SteamCMD and report the status',
 #	action='store_true'
 #)
+parser.add_argument(
+	'--list-backups',
+	help='List the backup archives from the backup catalog',
+	action='store_true'
+)
+parser.add_argument(
+	'--prune-backups',
+	help='Delete old backups according to the BackupKeep* retention settings',
+	action='store_true'
+)
+parser.add_argument(
+	'--upload-backup',
+	help='Upload a backup archive to the S3 store configured in .settings.ini (default: the newest backup)',
+	type=str,
+	nargs='?',
+	const='',
+	default=None
+)
+parser.add_argument(
+	'--verify-backups',
+	help='Extract backups into a scratch directory and check every file against its manifest (default: all backups)',
+	type=str,
+	nargs='?',
+	const='',
+	default=None
+)
+parser.add_argument(
+	'--catalog-add',
+	help=argparse.SUPPRESS,
+	type=str,
+	metavar='ARCHIVE',
+	default=None
+)
+parser.add_argument(
+	'--metrics',
+	help='Run the Prometheus metrics exporter (MetricsAddress, MetricsPort, and MetricsInterval settings)',
+	action='store_true'
+)
 parser.add_argument(
 	'--get-services',
 	help='List the available service instances for this game',
@@ -1667,18 +3100,96 @@ if args.service != 'ALL':
 
 if args.stop:
 	safe_stop(services)
+elif args.backup and args.live:
+	snapshot = snapshot_saves(services)
+	if snapshot is None:
+		sys.exit(1)
+	# Archive from the snapshot in the background; backup.sh removes the snapshot once done.
+	log_file = os.path.join(here, 'backups', '.last-snapshot.log')
+	with open(log_file, 'w') as log:
+		subprocess.Popen(
+			get_backup_command() + ['--source', snapshot],
+			stdin=subprocess.DEVNULL,
+			stdout=log,
+			stderr=subprocess.STDOUT,
+			start_new_session=True
+		)
+	print('Archiving the snapshot in the background, see %s' % log_file)
 elif args.backup:
 	# Stop all services prior to backup
 	safe_stop(services)
 	# Run the backup procedure
-	subprocess.run([os.path.join(here, 'backup.sh')], stderr=sys.stderr, stdout=sys.stdout)
+	subprocess.run(get_backup_command(), stderr=sys.stderr, stdout=sys.stdout)
 	# Start all enabled service
-	safe_start(services)
+	safe_start(services, concurrency=args.concurrency, check_memory=not args.ignore_memory)
 elif args.start:
-	safe_start(services)
+	safe_start(services, concurrency=args.concurrency, check_memory=not args.ignore_memory)
 elif args.restart:
 	safe_stop(services)
-	safe_start(services)
+	safe_start(services, concurrency=args.concurrency, check_memory=not args.ignore_memory)
+elif args.catalog_add:
+	BackupCatalog().add(args.catalog_add)
+	if config['S3'].get('enabled', '0') == '1':
+		# backup.sh runs with the maps stopped, so upload in the background instead of holding up their restart
+		log_file = os.path.join(here, 'backups', '.last-upload.log')
+		with open(log_file, 'w') as log:
+			subprocess.Popen(
+				[os.path.join(here, 'manage.py'), '--upload-backup', args.catalog_add],
+				stdin=subprocess.DEVNULL,
+				stdout=log,
+				stderr=subprocess.STDOUT,
+				start_new_session=True
+			)
+		print('Uploading %s in the background, see %s' % (os.path.basename(args.catalog_add), log_file))
+elif args.verify_backups is not None:
+	catalog = BackupCatalog()
+	catalog.sync()
+	if args.verify_backups:
+		names = [os.path.basename(args.verify_backups)]
+	else:
+		names = [name for name, entry in catalog.get_archives()]
+	results = []
+	for name in names:
+		if name in catalog.archives:
+			results.append(verify_backup(catalog, name))
+		else:
+			print('❗⛔❗ %s is not a backup in %s' % (name, catalog.path))
+			results.append(False)
+	if False in results:
+		sys.exit(1)
+	elif None in results:
+		# Nothing failed, but not everything could be checked either
+		print('%s of %s backups unverified' % (results.count(None), len(results)))
+		sys.exit(2)
+	sys.exit(0)
+elif args.upload_backup is not None:
+	archive = args.upload_backup
+	if archive == '':
+		catalog = BackupCatalog()
+		catalog.sync()
+		if len(catalog.archives) == 0:
+			print('No backups found', file=sys.stderr)
+			sys.exit(1)
+		archive = catalog.get_archives()[0][0]
+	if not os.path.exists(archive):
+		archive = os.path.join(here, 'backups', archive)
+	sys.exit(0 if S3Uploader().upload(archive) else 1)
+elif args.list_backups:
+	catalog = BackupCatalog()
+	catalog.sync()
+	for name, entry in catalog.get_archives():
+		print('%s  %s  %s MB  %s' % (
+			strftime('%Y-%m-%d %H:%M', localtime(entry['created'])),
+			name,
+			round(entry['size'] / (1024 * 1024)),
+			', '.join(sorted(entry['maps'].keys()))
+		))
+	print('Total: %s MB' % round(catalog.get_total_size() / (1024 * 1024)))
+elif args.prune_backups:
+	catalog = BackupCatalog()
+	catalog.sync()
+	for name in catalog.prune():
+		print('Deleted %s' % name)
 elif args.is_running:
 	exit_code = 1
 	for s in services:
@@ -1686,6 +3197,12 @@ elif args.is_running:
 			print('%s is running' % s.session)
 			exit_code = 0
 	sys.exit(exit_code)
+elif args.metrics:
+	exporter = MetricsExporter(services, float(config['Manager'].get('MetricsInterval', '15') or '15'))
+	exporter.serve(
+		config['Manager'].get('MetricsAddress', '127.0.0.1') or '127.0.0.1',
+		int(config['Manager'].get('MetricsPort', '9456') or '9456')
+	)
 elif args.get_services:
 	stats = {}
 	for s in services:
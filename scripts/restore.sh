@@ -28,18 +28,29 @@ done
 
 if [ -z "$1" ]; then
 	echo "ERROR - no source file specified"
-	echo "Usage: $0 <source.tgz>"
+	echo "Usage: $0 <source.tgz|source.tar.zst>"
 	exit 1
 fi
 
 if [ ! -e "$1" ]; then
 	echo "ERROR - cannot read source $1"
-	echo "Usage: $0 <source.tgz>"
+	echo "Usage: $0 <source.tgz|source.tar.zst>"
 	exit 1
 fi
 
+# Archives are zstd or gzip compressed, (older backups are all .tgz)
+if [ "${1%.zst}" != "$1" ] || [ "${1%.tzst}" != "$1" ]; then
+	if ! which zstd &>/dev/null; then
+		echo "ERROR - zstd is required to extract $1 (apt install zstd)"
+		exit 1
+	fi
+	DECOMPRESSOR="zstd -d -T0"
+else
+	DECOMPRESSOR="gzip -d"
+fi
+
 echo "Extracting $1"
-tar -xzf "$1" -C $SAVE_DIR
+tar -xf "$1" --use-compress-program="$DECOMPRESSOR" -C $SAVE_DIR
 if [ $? -ne 0 ]; then
 	echo "ERROR - failed to extract $1"
 	exit 1
@@ -32,16 +32,9 @@ python3 -m venv .venv
 source .venv/bin/activate
 pip install --force-reinstall warlock-manager@git+https://github.com/BitsNBytes25/Warlock-Manager.git@${WARLOCK_MANAGER}
 
-# Install newest version of scripts compiler
-if which curl; then
-	curl -sL https://raw.githubusercontent.com/eVAL-Agency/ScriptsCollection/refs/heads/main/compile.py -o compile.py
-elif which wget; then
-	wget https://raw.githubusercontent.com/eVAL-Agency/ScriptsCollection/refs/heads/main/compile.py -O compile.py
-else
-	echo "Neither curl nor wget is installed. Please install one of them to download the scripts compiler."
-	exit 1
-fi
-chmod +x compile.py
+# compile.py is kept in this repository, (it carries changes not in the upstream ScriptsCollection copy),
+# so it is no longer downloaded here; that would silently overwrite it with the upstream version.
+chmod +x "$HERE/compile.py"
 
 # Ensure compile.sources will install the bootstrap files from the appropriate branch.
 if [ -e "$HERE/compile.sources" ]; then
@@ -58,6 +51,10 @@ warlock=github:BitsNBytes25/Warlock-Manager:${WARLOCK_MANAGER}
 EOF
 fi
 
+if [ ! -e "$HERE/compile.lock" ]; then
+	echo "NOTICE - no compile.lock yet; run ./compile.py --lock to pin the scriptlets for reproducible, offline builds."
+fi
+
 if [ "$WARLOCK_NOTICE" -eq 1 ]; then
 	echo "NOTICE - using ${WARLOCK_MANAGER} branch for local checkout which may differ from PyPI package!"
 	echo "         This development branch may contain fixes not present in the release."
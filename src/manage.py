@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
+import argparse
 import datetime
+import hashlib
 import json
 import os
+import sys
 
 # To allow running as a standalone script without installing the package, include the venv path for imports.
 # This will set the include path for this path to .venv to allow packages installed therein to be utilized.
@@ -10,15 +13,29 @@ import os
 # otherwise the imports will fail when running as a standalone script.
 # import:org_python/venv_path_include.py
 
+import pwd
 import shutil
+import signal
+import socket
+import subprocess
+import time
+import traceback
+import urllib.error
+import urllib.request
 import zipfile
+import zlib
+from typing import TYPE_CHECKING
 
 from SystemdUnitParser import SystemdUnitParser
+# warlock_manager itself loads the stdlib modules above, SystemdUnitParser, and the firewall, download, and ip
+# helpers on every start, so only tarfile, proton, and cli_formatter are worth importing where they are used,
+# (see tests/test_startup.py).
+
 # Import the appropriate type of handler for the game installer.
 # Common options are:
 # from warlock_manager.apps.base_app import BaseApp
-from warlock_manager.apps.steam_app import SteamApp
-from warlock_manager.libs.cmd import Cmd
+from warlock_manager.apps.steam_app import SteamApp, guess_steamcmd_path
+from warlock_manager.libs.cmd import Cmd, PtyCmd
 
 # Import the appropriate type of handler for the game services.
 # Common options are:
@@ -32,7 +49,7 @@ from warlock_manager.services.rcon_service import RCONService
 # from warlock_manager.config.cli_config import CLIConfig
 from warlock_manager.config.ini_config import INIConfig
 # from warlock_manager.config.json_config import JSONConfig
-from warlock_manager.config.properties_config import PropertiesConfig
+# from warlock_manager.config.properties_config import PropertiesConfig
 from warlock_manager.config.unreal_config import UnrealConfig
 
 # Load the application runner responsible for interfacing with CLI arguments
@@ -44,23 +61,27 @@ from warlock_manager.libs.firewall import Firewall
 
 # Utilities provided by Warlock that are common to many applications
 from warlock_manager.libs import utils
-from warlock_manager.libs.proton import get_proton_paths
 from warlock_manager.libs.download import download_json, download_file
 from warlock_manager.libs.logger import logger
 from warlock_manager.libs.ip import get_local_ips, get_wan_ip
 from warlock_manager.libs.utils import random_passphrase
 
-# Useful in some games
-from warlock_manager.formatters.cli_formatter import cli_formatter
-
 # Select the baseline for mod support
 # from warlock_manager.mods.base_mod import BaseMod
 from warlock_manager.mods.warlock_nexus_mod import WarlockNexusMod
 
+if TYPE_CHECKING:
+	from warlock_manager.mods.base_mod import BaseMod
+
 
 class GameMod(WarlockNexusMod):
 	_library = None
 
+	installed_file_id = None
+	"""
+	CurseForge file ID of the installed release of this mod, (only set for mods in the game library)
+	"""
+
 	@classmethod
 	def get_mod(cls, source: 'GameService', provider: str | None, mod_id: str | int) -> 'GameMod | None':
 		"""
@@ -92,7 +113,7 @@ class GameMod(WarlockNexusMod):
 			cls._library = []
 
 			# Pull mod data from the JSON library file
-			lib_file = os.path.join(utils.get_base_directory(), 'AppFiles', 'ShooterGame', 'Binaries', 'Win64', 'ShooterGame', 'ModsUserData', '83374', 'library.json')
+			lib_file = cls.get_library_path()
 			if os.path.exists(lib_file):
 				with open(lib_file, 'r', encoding='utf-8-sig') as f:
 					mod_lib = json.load(f)
@@ -107,11 +128,487 @@ class GameMod(WarlockNexusMod):
 						if len(mod_data['details']['authors']) > 0:
 							mod.author = mod_data['details']['authors'][0]['name']
 						mod.icon = mod_data['details']['logo']['thumbnailUrl']
+						if mod_data.get('installedFile'):
+							mod.installed_file_id = mod_data['installedFile'].get('iD')
 
 						cls._library.append(mod)
 
 		return cls._library
 
+	@classmethod
+	def get_library_path(cls) -> str:
+		"""
+		Get the path of the library file the game keeps of its installed mods
+
+		:return:
+		"""
+		return os.path.join(utils.get_base_directory(), 'AppFiles', 'ShooterGame', 'Binaries', 'Win64', 'ShooterGame', 'ModsUserData', '83374', 'library.json')
+
+	@classmethod
+	def refresh_library(cls):
+		"""
+		Force the library to be read from disk again on next access
+
+		:return:
+		"""
+		cls._library = None
+
+	@classmethod
+	def get_latest_file_ids(cls, api_key: str, mod_ids: list[str]) -> dict:
+		"""
+		Get the file ID of the current release of several mods from CurseForge, in a single request
+
+		:param api_key: CurseForge API key
+		:param mod_ids: Mod IDs
+		:return: {mod ID: file ID}, mods CurseForge did not return, (or all of them if it could not be reached), are left out
+		"""
+		if len(mod_ids) == 0:
+			return {}
+
+		req = urllib.request.Request(
+			'https://api.curseforge.com/v1/mods',
+			data=json.dumps({'modIds': [int(mod_id) for mod_id in mod_ids]}).encode('utf-8'),
+			headers={'Accept': 'application/json', 'Content-Type': 'application/json', 'x-api-key': api_key},
+			method='POST'
+		)
+		try:
+			with urllib.request.urlopen(req, timeout=30) as response:
+				data = json.loads(response.read().decode('utf-8'))['data']
+			return {str(mod['id']): mod['mainFileId'] for mod in data}
+		except (urllib.error.URLError, ValueError, KeyError, TypeError) as e:
+			logger.warning('Unable to check CurseForge for mods %s: %s' % (', '.join(mod_ids), e))
+			return {}
+
+
+class ModIndex:
+	"""
+	Reverse index of which services use each mod
+
+	Built from GameService.get_enabled_mod_ids() on first use and kept up to date
+	whenever the Mods option of a service changes.
+	"""
+
+	def __init__(self, game: 'GameApp'):
+		self.game = game
+		self._mods = None
+		"""
+		Dictionary of mod ID to the set of service names which use it
+		"""
+		self._services = {}
+		"""
+		Dictionary of service name to service
+		"""
+
+	def _build(self):
+		if self._mods is not None:
+			return
+
+		self._mods = {}
+		self._services = {}
+		for svc in self.game.get_services():
+			self._services[svc.service] = svc
+			for mod_id in svc.get_enabled_mod_ids():
+				self._mods.setdefault(mod_id, set()).add(svc.service)
+
+	def invalidate(self):
+		"""
+		Drop the index so it is rebuilt on next use, (eg: when services are added or removed)
+
+		:return:
+		"""
+		self._mods = None
+		self._services = {}
+
+	def update(self, svc: 'GameService', previous: list[str], current: list[str]):
+		"""
+		Update the index after the enabled mods of a service have changed
+
+		:param svc:
+		:param previous: Mod IDs enabled before the change
+		:param current:  Mod IDs enabled after the change
+		:return:
+		"""
+		if self._mods is None:
+			# Not built yet, it will pick up the change when it is.
+			return
+
+		self._services[svc.service] = svc
+		for mod_id in set(previous) - set(current):
+			users = self._mods.get(mod_id)
+			if users is not None:
+				users.discard(svc.service)
+				if len(users) == 0:
+					del self._mods[mod_id]
+		for mod_id in set(current) - set(previous):
+			self._mods.setdefault(mod_id, set()).add(svc.service)
+
+	def get_mod_ids(self) -> list[str]:
+		"""
+		Get every mod ID enabled on at least one service
+
+		:return:
+		"""
+		self._build()
+		return list(self._mods.keys())
+
+	def get_services(self, mod_id: str | int) -> list['GameService']:
+		"""
+		Get the services which use a given mod
+
+		:param mod_id:
+		:return:
+		"""
+		self._build()
+		return [self._services[name] for name in sorted(self._mods.get(str(mod_id), ()))]
+
+	def get_unused_mods(self) -> list['GameMod']:
+		"""
+		Get the mods installed in the game library which no service uses
+
+		:return:
+		"""
+		self._build()
+		return [mod for mod in GameMod.get_library_mods() if str(mod.id) not in self._mods]
+
+	def get_services_to_restart(self, mod_ids: list[str]) -> list['GameService']:
+		"""
+		Get the running services which need a restart to pick up updates to the given mods
+
+		:param mod_ids:
+		:return:
+		"""
+		self._build()
+		names = set()
+		for mod_id in mod_ids:
+			names |= self._mods.get(str(mod_id), set())
+		return [self._services[name] for name in sorted(names) if not self._services[name].is_stopped()]
+
+
+class ChunkedBackup:
+	"""
+	Deduplicating, incremental backups of the save files
+
+	Files are split into content-defined chunks which are stored once each, (compressed and named by their hash),
+	in a local chunk store.  Each backup writes only the chunks not already in the store plus a manifest
+	listing the chunks of every file, so hourly snapshots of large saves where little changed stay small and quick.
+	"""
+
+	chunk_min = 16 * 1024
+	chunk_max = 1024 * 1024
+	chunk_window = 8
+	"""
+	Chunk boundaries are placed after a run of chunk_window bytes which all fall in the
+	boundary byte set, (about a quarter of all byte values), giving chunks of around 128KB on average
+	"""
+
+	read_size = 8 * 1024 * 1024
+
+	def __init__(self, game: 'GameApp'):
+		self.game = game
+		self.path = os.path.join(utils.get_base_directory(), 'backups', 'incremental')
+		self.chunk_path = os.path.join(self.path, 'chunks')
+		self.manifest_path = os.path.join(self.path, 'manifests')
+
+		# Map every byte to '1' or '0' so boundaries can be located with bytes.find.
+		# The all-zero and all-one bytes are never boundary bytes so runs of padding do not produce tiny chunks.
+		table = bytearray(b'0' * 256)
+		for b in range(256):
+			if b not in (0x00, 0xFF) and (b * 167 + 13) % 256 < 64:
+				table[b] = ord('1')
+		self._table = bytes(table)
+		self._pattern = b'1' * self.chunk_window
+
+	def iter_chunks(self, fh):
+		"""
+		Split a file into content-defined chunks
+
+		A boundary depends only on the few bytes before it, so data inserted or removed in one part
+		of a file does not change the chunks in the rest of the file.
+
+		:param fh: File handle opened in binary mode
+		:return: Generator of chunk bytes
+		"""
+		buf = b''
+		eof = False
+		while not eof:
+			block = fh.read(self.read_size)
+			eof = len(block) == 0
+			buf += block
+			marks = buf.translate(self._table)
+			pos = 0
+			while pos < len(buf):
+				found = marks.find(self._pattern, pos + self.chunk_min - self.chunk_window, pos + self.chunk_max)
+				if found != -1:
+					end = found + self.chunk_window
+				elif eof or len(buf) - pos >= self.chunk_max:
+					end = min(pos + self.chunk_max, len(buf))
+				else:
+					# Not enough data read yet to locate the next boundary
+					break
+				yield buf[pos:end]
+				pos = end
+			buf = buf[pos:]
+
+	def _get_chunk_file(self, digest: str) -> str:
+		return os.path.join(self.chunk_path, digest[0:2], digest)
+
+	def _write_chunk(self, data: bytes) -> tuple[str, bool]:
+		"""
+		Store a chunk unless it is already present
+
+		:param data:
+		:return: Chunk hash, and True if the chunk was new
+		"""
+		digest = hashlib.sha256(data).hexdigest()
+		chunk_file = self._get_chunk_file(digest)
+		if os.path.exists(chunk_file):
+			return digest, False
+
+		os.makedirs(os.path.dirname(chunk_file), exist_ok=True)
+		tmp_file = '%s.tmp' % chunk_file
+		with open(tmp_file, 'wb') as f:
+			f.write(zlib.compress(data, 6))
+		os.replace(tmp_file, chunk_file)
+		return digest, True
+
+	def _read_chunk(self, digest: str) -> bytes:
+		with open(self._get_chunk_file(digest), 'rb') as f:
+			data = zlib.decompress(f.read())
+		if hashlib.sha256(data).hexdigest() != digest:
+			raise GameAPIException('Chunk %s is corrupt' % digest)
+		return data
+
+	def get_save_directory(self) -> str:
+		"""
+		Get the save directory shared by all maps
+
+		:return:
+		"""
+		for svc in self.game.get_services():
+			return svc.get_save_directory()
+		raise GameAPIException('No maps are installed')
+
+	def get_save_files(self) -> list[str]:
+		"""
+		Get every save file of every service, relative to the save directory
+
+		:return:
+		"""
+		save_dir = self.get_save_directory()
+		files = set()
+		for svc in self.game.get_services():
+			for path in svc.get_save_files():
+				full_path = os.path.join(save_dir, path)
+				if os.path.isdir(full_path):
+					for root, dirs, filenames in os.walk(full_path):
+						for filename in filenames:
+							files.add(os.path.relpath(os.path.join(root, filename), save_dir))
+				elif os.path.isfile(full_path):
+					files.add(path)
+		return sorted(files)
+
+	def get_manifests(self) -> list[str]:
+		"""
+		Get the names of all backups, oldest first
+
+		:return:
+		"""
+		if not os.path.exists(self.manifest_path):
+			return []
+		return sorted([f[:-5] for f in os.listdir(self.manifest_path) if f.endswith('.json')])
+
+	def load_manifest(self, name: str) -> dict:
+		with open(os.path.join(self.manifest_path, '%s.json' % name), 'r') as f:
+			return json.load(f)
+
+	def _lock(self):
+		"""
+		Lock the store against other backups and prunes
+
+		:return: File holding the lock, closing it releases the lock
+		"""
+		import fcntl
+
+		os.makedirs(self.path, exist_ok=True)
+		fh = open(os.path.join(self.path, '.lock'), 'w')
+		fcntl.flock(fh, fcntl.LOCK_EX)
+		return fh
+
+	def prune(self, keep: int) -> int:
+		"""
+		Remove all but the newest backups, and every chunk which no remaining backup uses
+
+		:param keep: Number of backups to keep, (at least 1)
+		:return: Number of backups removed
+		"""
+		if keep < 1:
+			raise GameAPIException('At least one backup must be kept')
+
+		with self._lock():
+			names = self.get_manifests()
+			expired = names[:-keep]
+
+			# Read every remaining manifest before removing anything, so a damaged one never costs its chunks
+			used = set()
+			for name in names[-keep:]:
+				for entry in self.load_manifest(name)['files']:
+					used.update(entry['chunks'])
+
+			for name in expired:
+				os.remove(os.path.join(self.manifest_path, '%s.json' % name))
+
+			removed = 0
+			freed = 0
+			for root, dirs, files in os.walk(self.chunk_path):
+				for file in files:
+					# Also clears out .tmp files left by an interrupted backup
+					if file not in used:
+						freed += os.path.getsize(os.path.join(root, file))
+						os.remove(os.path.join(root, file))
+						removed += 1
+
+		logger.info(
+			'Removed %s backups and %s unused chunks, (%s MB), kept %s backups' % (
+				len(expired), removed, round(freed / 1048576, 1), len(names) - len(expired)
+			)
+		)
+		return len(expired)
+
+	def backup(self) -> str:
+		"""
+		Create a new backup of the save files
+
+		Files whose size and modification time match the previous backup are not read again.
+
+		:return: Name of the new backup
+		"""
+		# Held until the manifest is written, so a prune never removes the new chunks before they are listed
+		with self._lock():
+			save_dir = self.get_save_directory()
+			names = self.get_manifests()
+			previous = {}
+			if len(names) > 0:
+				for entry in self.load_manifest(names[-1])['files']:
+					previous[entry['path']] = entry
+
+			name = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+			manifest = {'created': name, 'files': []}
+			new_chunks = 0
+			new_bytes = 0
+			total_bytes = 0
+			for path in self.get_save_files():
+				full_path = os.path.join(save_dir, path)
+				stat = os.stat(full_path)
+				total_bytes += stat.st_size
+				prev = previous.get(path)
+				if (
+					prev is not None and
+					prev['size'] == stat.st_size and
+					prev['mtime_ns'] == stat.st_mtime_ns and
+					all(os.path.exists(self._get_chunk_file(digest)) for digest in prev['chunks'])
+				):
+					manifest['files'].append(prev)
+					continue
+
+				file_hash = hashlib.sha256()
+				chunks = []
+				with open(full_path, 'rb') as f:
+					for data in self.iter_chunks(f):
+						file_hash.update(data)
+						digest, is_new = self._write_chunk(data)
+						chunks.append(digest)
+						if is_new:
+							new_chunks += 1
+							new_bytes += len(data)
+
+				manifest['files'].append({
+					'path': path,
+					'size': stat.st_size,
+					'mtime_ns': stat.st_mtime_ns,
+					'mode': stat.st_mode & 0o7777,
+					'sha256': file_hash.hexdigest(),
+					'chunks': chunks,
+				})
+
+			os.makedirs(self.manifest_path, exist_ok=True)
+			manifest_file = os.path.join(self.manifest_path, '%s.json' % name)
+			with open('%s.tmp' % manifest_file, 'w') as f:
+				json.dump(manifest, f)
+			os.replace('%s.tmp' % manifest_file, manifest_file)
+			utils.ensure_file_ownership(self.path)
+
+		logger.info(
+			'Created backup %s: %s files, %s MB, %s new chunks, (%s MB)' % (
+				name,
+				len(manifest['files']),
+				round(total_bytes / 1048576, 1),
+				new_chunks,
+				round(new_bytes / 1048576, 1)
+			)
+		)
+		return name
+
+	def restore(self, name: str) -> bool:
+		"""
+		Restore the save files from a backup
+
+		Each file is rebuilt next to its destination and only replaces it once its hash
+		matches the manifest, so the restored files are identical to the originals.
+		Save files which are not in the backup are removed afterwards.
+
+		:param name: Backup name, as returned by get_manifests()
+		:return:
+		"""
+		running = [svc.service for svc in self.game.get_services() if not svc.is_stopped()]
+		if len(running) > 0:
+			logger.error('Stop all maps before restoring, still running: %s' % ', '.join(running))
+			return False
+
+		save_dir = self.get_save_directory()
+		manifest = self.load_manifest(name)
+
+		# Rebuild and verify every file before replacing any, so a damaged backup leaves the saves untouched.
+		restored = []
+		for entry in manifest['files']:
+			dest = os.path.join(save_dir, entry['path'])
+			os.makedirs(os.path.dirname(dest), exist_ok=True)
+			tmp_file = '%s.restore' % dest
+			restored.append((tmp_file, dest))
+			file_hash = hashlib.sha256()
+			try:
+				with open(tmp_file, 'wb') as f:
+					for digest in entry['chunks']:
+						data = self._read_chunk(digest)
+						file_hash.update(data)
+						f.write(data)
+				error = None if file_hash.hexdigest() == entry['sha256'] else 'file hash does not match'
+			except (GameAPIException, OSError, zlib.error) as e:
+				error = str(e)
+
+			if error is not None:
+				logger.error('Unable to restore %s, (%s), leaving the current saves in place' % (entry['path'], error))
+				for tmp_file, dest in restored:
+					if os.path.exists(tmp_file):
+						os.remove(tmp_file)
+				return False
+			os.chmod(tmp_file, entry['mode'])
+			os.utime(tmp_file, ns=(entry['mtime_ns'], entry['mtime_ns']))
+
+		for tmp_file, dest in restored:
+			os.replace(tmp_file, dest)
+
+		# Saves created after the backup, (eg: a new tribe or player file), would otherwise survive the restore
+		keep = set(entry['path'] for entry in manifest['files'])
+		removed = 0
+		for path in self.get_save_files():
+			if path not in keep:
+				os.remove(os.path.join(save_dir, path))
+				removed += 1
+
+		utils.ensure_file_ownership(save_dir)
+		logger.info('Restored %s files from backup %s, removed %s not in the backup' % (len(manifest['files']), name, removed))
+		return True
+
 
 class GameAPIException(Exception):
 	pass
@@ -133,6 +630,20 @@ class GameApp(SteamApp):
 		self.service_handler = GameService
 		self.mod_handler = GameMod
 
+		self.mod_index = ModIndex(self)
+		"""
+		Reverse index of which services use each mod
+		"""
+
+		self.staged_shared_paths = (
+			'ShooterGame/Saved',
+			'ShooterGame/Binaries/Win64/ShooterGame/ModsUserData',
+		)
+		"""
+		Paths within AppFiles which hold player and mod data; these are moved between trees on a staged cutover
+		rather than copied or updated.
+		"""
+
 		self.configs = {
 			'game': UnrealConfig(
 				'game',
@@ -212,6 +723,7 @@ class GameApp(SteamApp):
 		:return:
 		"""
 		if option == 'Default Proton Path':
+			from warlock_manager.libs.proton import get_proton_paths
 			return get_proton_paths()
 		elif option == 'ASA API Loader':
 			return self.get_asa_api_loader_versions()
@@ -274,10 +786,11 @@ class GameApp(SteamApp):
 			return release['tag_name']
 		return None
 
-	def download_asa_api_loader(self):
+	def download_asa_api_loader(self, app_dir: str | None = None):
 		"""
 		Download and install ASA API Loader
 
+		:param app_dir: AppFiles tree to install into, defaults to the live tree
 		:return:
 		"""
 
@@ -291,7 +804,7 @@ class GameApp(SteamApp):
 
 		url = f"https://github.com/ArkServerApi/AsaApi/releases/download/{version}/AsaApi_{version}.zip"
 		zip = os.path.join(utils.get_base_directory(), 'Packages', f"AsaApi_{version}.zip")
-		target_path = os.path.join(utils.get_base_directory(), 'AppFiles/ShooterGame/Binaries/Win64/')
+		target_path = os.path.join(app_dir or os.path.join(utils.get_base_directory(), 'AppFiles'), 'ShooterGame/Binaries/Win64/')
 		download_file(url, zip)
 		with zipfile.ZipFile(zip, 'r') as zip_ref:
 			zip_ref.extractall(target_path)
@@ -323,17 +836,22 @@ class GameApp(SteamApp):
 			return proton_path
 		else:
 			# It's not set yet!  Just return the first one found.
+			from warlock_manager.libs.proton import get_proton_paths
 			paths = get_proton_paths()
 			return paths[0] if len(paths) > 0 else None
 
-	def post_update(self) -> bool:
+	def post_update(self, app_dir: str | None = None) -> bool:
 		"""
 		Perform any post-update actions needed for this game
 
 		Called immediately after an update is performed but before services are restarted.
 
+		:param app_dir: AppFiles tree to fix up, defaults to the live tree
 		:return:
 		"""
+		if app_dir is None:
+			app_dir = os.path.join(utils.get_base_directory(), 'AppFiles')
+
 		# Version 74.24 released on Nov 4th 2025 with the comment "Fixed a crash" introduces a serious bug
 		# that causes the game to segfault when attempting to load the Steam API.
 		# Being Wildcard, they don't actually provide any reason as to why they're using the Steam API for an Epic game,
@@ -343,7 +861,7 @@ class GameApp(SteamApp):
 		# Initializing Steam Subsystem for server validation.
 		# Steam Subsystem initialized: FAILED
 		#
-		check_path = os.path.join(utils.get_base_directory(), 'AppFiles/ShooterGame/Binaries/Win64/steamclient64.dll')
+		check_path = os.path.join(app_dir, 'ShooterGame/Binaries/Win64/steamclient64.dll')
 		if os.path.exists(check_path):
 			print('Removing broken Steam library to fix build 74.24 crash...')
 			os.remove(check_path)
@@ -356,7 +874,7 @@ class GameApp(SteamApp):
 		print('Installing Microsoft XAudio2 Redist DLL to fix build 77.34 crash...')
 		xaudio_src = 'https://www.nuget.org/api/v2/package/Microsoft.XAudio2.Redist/1.2.11'
 		xaudio_dest = os.path.join(utils.get_base_directory(), 'Packages/Microsoft.XAudio2.Redist.zip')
-		dll_dest = os.path.join(utils.get_base_directory(), 'AppFiles/ShooterGame/Binaries/Win64/xaudio2_9.dll')
+		dll_dest = os.path.join(app_dir, 'ShooterGame/Binaries/Win64/xaudio2_9.dll')
 		if not os.path.exists(os.path.dirname(dll_dest)):
 			logger.error('Binary directory does not exist: %s - Unable to install Microsoft XAudio2 Redist DLL' % dll_dest)
 			return False
@@ -374,6 +892,429 @@ class GameApp(SteamApp):
 
 		return True
 
+	def get_all_enabled_mod_ids(self) -> list[str]:
+		"""
+		Get the union of the mod IDs enabled across every service which is enabled for auto-start
+
+		Maps the operator disabled are left out, so they are never started just to download their mods.
+
+		:return:
+		"""
+		mod_ids = set()
+		for svc in self.get_services():
+			if svc.is_enabled():
+				mod_ids.update(svc.get_enabled_mod_ids())
+		return sorted(mod_ids)
+
+	def get_mods_to_prefetch(self) -> dict:
+		"""
+		Get the mods used by any service enabled for auto-start which are missing from the shared mod library or out of date
+
+		Mods are only checked against CurseForge when a CurseForge API key is configured,
+		otherwise only missing mods are returned.
+
+		:return: {mod ID: latest file ID, or None if unknown}
+		"""
+		GameMod.refresh_library()
+		installed = {str(mod.id): mod for mod in GameMod.get_library_mods()}
+		api_key = self.get_option_value('CurseForge API Key')
+
+		mod_ids = self.get_all_enabled_mod_ids()
+		latest_ids = GameMod.get_latest_file_ids(api_key, mod_ids) if api_key else {}
+
+		needed = {}
+		for mod_id in mod_ids:
+			latest = latest_ids.get(mod_id)
+			if mod_id not in installed:
+				needed[mod_id] = latest
+			elif latest is not None and installed[mod_id].installed_file_id != latest:
+				needed[mod_id] = latest
+		return needed
+
+	def get_mod_updates(self) -> dict:
+		"""
+		Get the mods in use whose installed release differs from the current release on CurseForge
+
+		Requires the CurseForge API Key option to be set.
+
+		:return: {mod ID: latest file ID}
+		"""
+		api_key = self.get_option_value('CurseForge API Key')
+		if not api_key:
+			logger.warning('A CurseForge API Key is required to check for mod updates')
+			return {}
+
+		GameMod.refresh_library()
+		mods = [
+			mod for mod in GameMod.get_library_mods()
+			if mod.installed_file_id is not None and len(self.mod_index.get_services(str(mod.id))) > 0
+		]
+		latest_ids = GameMod.get_latest_file_ids(api_key, [str(mod.id) for mod in mods])
+
+		updates = {}
+		for mod in mods:
+			mod_id = str(mod.id)
+			latest = latest_ids.get(mod_id)
+			if latest is not None and latest != mod.installed_file_id:
+				logger.info('Mod %s (%s) has an update: %s -> %s' % (mod_id, mod.name, mod.installed_file_id, latest))
+				updates[mod_id] = latest
+		return updates
+
+	def restart_for_mod_updates(self, dry_run: bool = False) -> bool:
+		"""
+		Restart only the running maps which use a mod that has been updated
+
+		The updated mods are downloaded first with prefetch_mods(), using a stopped map while the affected ones
+		keep running, then the affected maps are restarted once.  Maps which do not use the updated mods keep running.
+		Mods only used by running maps are downloaded by those maps when they start again.
+
+		:param dry_run: Set to True to only report which maps would be restarted
+		:return:
+		"""
+		updates = self.get_mod_updates()
+		if len(updates) == 0:
+			logger.info('All mods in use are up to date')
+			return True
+
+		services = self.mod_index.get_services_to_restart(list(updates.keys()))
+		if len(services) == 0:
+			logger.info('No running maps use the updated mods, they will be updated on next start')
+			return True
+
+		logger.info('Maps to restart for mod updates: %s' % ', '.join([svc.service for svc in services]))
+		if dry_run:
+			return True
+
+		# Download before stopping anything, so players only see one restart of each affected map
+		if not self.prefetch_mods():
+			logger.warning('Unable to prefetch mods, each map will download the updates when it starts again')
+
+		try:
+			return self.stop_services(services)
+		finally:
+			for svc in services:
+				logger.info('Starting %s' % svc.service)
+				svc.start()
+
+	def prefetch_mods(self, timeout: int = 900) -> bool:
+		"""
+		Make sure every mod used by the enabled services is present and current in the shared mod library
+
+		The game only downloads mods while a map starts, so each missing mod is fetched once by starting
+		a single stopped map which uses it, (picking the maps covering the most mods first),
+		and stopping it again as soon as the library lists the mods.
+		This keeps several maps starting together from each downloading the same mods.
+		Only maps enabled for auto-start are considered, both for the mods to fetch and the maps to start.
+
+		:param timeout: Seconds to wait for a map to download its mods
+		:return:
+		"""
+		needed = self.get_mods_to_prefetch()
+		if len(needed) == 0:
+			logger.info('All enabled mods are installed and up to date')
+			return True
+
+		remaining = set(needed.keys())
+		while len(remaining) > 0:
+			candidates = {}
+			for mod_id in remaining:
+				for svc in self.mod_index.get_services(mod_id):
+					if svc.is_enabled() and svc.is_stopped():
+						candidates[svc.service] = svc
+			candidates = list(candidates.values())
+			if len(candidates) == 0:
+				logger.warning(
+					'Mods %s are only used by running maps and will be updated when those maps restart' %
+					', '.join(sorted(remaining))
+				)
+				return True
+
+			svc = max(candidates, key=lambda s: len(remaining & set(s.get_enabled_mod_ids())))
+			mod_ids = remaining & set(svc.get_enabled_mod_ids())
+			logger.info('Downloading mods %s by starting %s' % (', '.join(sorted(mod_ids)), svc.service))
+			svc.start()
+
+			lib_file = GameMod.get_library_path()
+			lib_mtime = None
+			ready = False
+			# is_stopped() is cached for a few seconds, so only treat the map as exited once it was seen running
+			seen_running = False
+			end = time.time() + timeout
+			while time.time() < end and not ready:
+				time.sleep(2)
+				if svc.is_running():
+					seen_running = True
+				elif seen_running and svc.is_stopped():
+					logger.error('%s stopped before its mods were downloaded' % svc.service)
+					return False
+
+				mtime = os.path.getmtime(lib_file) if os.path.exists(lib_file) else None
+				if mtime is None or mtime == lib_mtime:
+					continue
+				lib_mtime = mtime
+
+				GameMod.refresh_library()
+				installed = {str(mod.id): mod for mod in GameMod.get_library_mods()}
+				ready = all(
+					mod_id in installed and (needed[mod_id] is None or installed[mod_id].installed_file_id == needed[mod_id])
+					for mod_id in mod_ids
+				)
+
+			# Wait for the map to exit before starting the next one or handing the library back to the caller
+			if not self.stop_services([svc]):
+				return False
+			if not ready:
+				logger.error('Timed out waiting for %s to download mods %s' % (svc.service, ', '.join(sorted(mod_ids))))
+				return False
+			remaining -= mod_ids
+
+		logger.info('All enabled mods are installed and up to date')
+		return True
+
+	def start_all(self):
+		"""
+		Start all services that are enabled for auto-start,
+		downloading the mods they need beforehand so each mod is only downloaded once, (see prefetch_mods)
+
+		:return:
+		"""
+		if not self.prefetch_mods():
+			logger.warning('Unable to prefetch mods, each map will download its own missing mods on start')
+		super().start_all()
+
+	def stop_services(self, services: list['GameService'], timeout: int = 600) -> bool:
+		"""
+		Stop services and wait until systemd reports every one of them as stopped
+
+		BaseService.stop() only queues 'systemctl stop' in the background and returns at once,
+		while ExecStop is still warning players and saving the world, (up to several minutes with players online).
+		Anything which touches the game files or saves must wait for this before continuing.
+
+		:param services:
+		:param timeout: Seconds to wait for all of them to stop
+		:return: True if every service stopped within the timeout
+		"""
+		if os.geteuid() != 0:
+			logger.error('Unable to stop game services unless run with sudo')
+			return False
+
+		for svc in services:
+			if not svc.is_stopped():
+				logger.info('Stopping %s' % svc.service)
+				svc.stop()
+
+		pending = list(services)
+		end = time.time() + timeout
+		while True:
+			pending = [svc for svc in pending if not svc.is_stopped()]
+			if len(pending) == 0:
+				return True
+			if time.time() >= end:
+				logger.error('Timed out waiting for %s to stop' % ', '.join([svc.service for svc in pending]))
+				return False
+			time.sleep(5)
+
+	def get_app_slots(self) -> tuple[str, str]:
+		"""
+		Get the active and standby AppFiles trees used for staged updates
+
+		Until the first cutover, AppFiles is a regular directory and is treated as the blue slot.
+
+		:return: (active slot path, standby slot path)
+		"""
+		base_dir = utils.get_base_directory()
+		app_dir = os.path.join(base_dir, 'AppFiles')
+		if os.path.islink(app_dir):
+			active = os.path.realpath(app_dir)
+		else:
+			active = os.path.join(base_dir, 'AppFiles.blue')
+
+		if active.endswith('.blue'):
+			standby = os.path.join(base_dir, 'AppFiles.green')
+		else:
+			standby = os.path.join(base_dir, 'AppFiles.blue')
+		return active, standby
+
+	def steamcmd_update(self, install_dir: str) -> bool:
+		"""
+		Run SteamCMD to install or update the game into a specific directory
+
+		Uses the same login and Steam Branch / Steam Branch Password arguments as SteamApp.update(),
+		which always installs into the live AppFiles.
+
+		:param install_dir:
+		:return:
+		"""
+		cmd = PtyCmd([guess_steamcmd_path(), '+force_install_dir', install_dir])
+
+		if self.has_option('Steam Username'):
+			if not self.get_option_value('Steam Username'):
+				logger.error('Steam Username is required for this application!')
+				return False
+			cmd.extend(['+login', self.get_option_value('Steam Username')])
+		else:
+			cmd.extend(['+login', 'anonymous'])
+
+		cmd.extend(['+app_update', self.steam_id])
+
+		if self.has_option('Steam Branch'):
+			branch = self.get_option_value('Steam Branch')
+			branch_password = self.get_option_value('Steam Branch Password')
+			if branch != 'public':
+				cmd.extend(['-beta', branch])
+				if branch_password != '':
+					cmd.extend(['-betapassword', branch_password])
+
+		cmd.append('validate')
+		cmd.append('+quit')
+		# SteamCMD should always run as the game user, as that user owns the game files.
+		cmd.sudo(utils.get_app_uid())
+
+		logger.info('Running SteamCMD update into %s' % install_dir)
+		cmd.run()
+		return cmd.success
+
+	def stage_update(self) -> bool:
+		"""
+		Install the game update into the standby AppFiles tree while the maps keep running
+
+		The standby tree is either the previous tree kept from the last cutover, (so Steam only has to patch it),
+		or a fresh copy of the live tree minus the player and mod data.
+
+		:return:
+		"""
+		live_dir = os.path.realpath(os.path.join(utils.get_base_directory(), 'AppFiles'))
+		active_slot, standby_slot = self.get_app_slots()
+		marker = os.path.join(standby_slot, '.staged-update')
+
+		if not os.path.exists(standby_slot):
+			logger.info('Seeding %s from the live game files, this may take a few minutes' % standby_slot)
+			skip = [os.path.join(live_dir, p) for p in self.staged_shared_paths]
+			shutil.copytree(
+				live_dir,
+				standby_slot,
+				symlinks=True,
+				ignore=lambda src, names: [n for n in names if os.path.join(src, n) in skip]
+			)
+		# The standby tree no longer holds the previous game files from here on, (so it can't be rolled back to),
+		# and it is not ready for a cutover until the update below completes.
+		with open(marker, 'w') as f:
+			f.write('staging')
+		utils.ensure_file_ownership(standby_slot)
+
+		if not self.steamcmd_update(standby_slot):
+			logger.error('SteamCMD failed to update the staged game files in %s' % standby_slot)
+			return False
+
+		if not self.post_update(standby_slot):
+			logger.error('Post-update fixes failed on the staged game files in %s' % standby_slot)
+			return False
+
+		version = self.get_option_value('ASA API Loader')
+		if version != 'None' and any(svc.get_option_value('Mod Loader') == 'ASA API Loader' for svc in self.get_services()):
+			self.download_asa_api_loader(standby_slot)
+
+		with open(marker, 'w') as f:
+			f.write(datetime.datetime.now().isoformat())
+		utils.ensure_file_ownership(standby_slot)
+
+		logger.info('Update staged in %s, run cutover to switch the maps over to it' % standby_slot)
+		return True
+
+	def cutover(self, rollback: bool = False) -> bool:
+		"""
+		Switch the live AppFiles symlink over to the standby tree
+
+		Running maps are stopped, (waiting until they have fully exited), player and mod data is moved into
+		the standby tree, the symlink is swapped atomically, and the maps which were running are started again.
+		The previous tree is left in place so it can be swapped back with a rollback.
+
+		:param rollback: Set to True to switch back to the previous tree instead of a staged update
+		:return:
+		"""
+		app_dir = os.path.join(utils.get_base_directory(), 'AppFiles')
+		active_slot, standby_slot = self.get_app_slots()
+		marker = os.path.join(standby_slot, '.staged-update')
+
+		staged = None
+		if os.path.exists(marker):
+			with open(marker, 'r') as f:
+				staged = f.read().strip()
+
+		if rollback:
+			if not os.path.islink(app_dir) or not os.path.exists(os.path.join(standby_slot, 'ShooterGame', 'Binaries')):
+				logger.error('No previous cutover, so there are no previous game files to roll back to')
+				return False
+			if staged is not None:
+				logger.error('%s holds a staged update, not the previous game files, refusing to roll back' % standby_slot)
+				return False
+		elif staged is None:
+			logger.error('No staged update is ready in %s, run stage-update first' % standby_slot)
+			return False
+		elif staged == 'staging':
+			logger.error('The staged update in %s did not complete, run stage-update again' % standby_slot)
+			return False
+
+		for path in self.staged_shared_paths:
+			if os.path.exists(os.path.join(standby_slot, path)):
+				logger.error('%s already exists in %s, refusing to overwrite it' % (path, standby_slot))
+				return False
+
+		running = [svc for svc in self.get_services() if not svc.is_stopped()]
+		renamed = []
+		swapped = False
+		try:
+			if not self.stop_services(running):
+				logger.error('Cutover aborted, the game files were not changed')
+				return False
+
+			if not os.path.islink(app_dir):
+				# First cutover on this install; the current directory becomes the blue slot.
+				os.rename(app_dir, active_slot)
+				renamed.append((app_dir, active_slot))
+
+			for path in self.staged_shared_paths:
+				src = os.path.join(active_slot, path)
+				if os.path.exists(src):
+					os.makedirs(os.path.dirname(os.path.join(standby_slot, path)), exist_ok=True)
+					os.rename(src, os.path.join(standby_slot, path))
+					renamed.append((src, os.path.join(standby_slot, path)))
+
+			# Build the new link alongside and rename it over the old one so AppFiles is never missing.
+			swap_link = app_dir + '.swap'
+			if os.path.lexists(swap_link):
+				os.remove(swap_link)
+			os.symlink(os.path.basename(standby_slot), swap_link)
+			user = pwd.getpwuid(utils.get_app_uid())
+			os.lchown(swap_link, user.pw_uid, user.pw_gid)
+			os.replace(swap_link, app_dir)
+			swapped = True
+
+			if os.path.exists(marker):
+				os.remove(marker)
+			logger.info('AppFiles now points to %s, previous files kept in %s' % (standby_slot, active_slot))
+			return True
+		except BaseException:
+			if not swapped:
+				logger.error('Cutover failed, moving the game files back')
+				for src, dest in reversed(renamed):
+					try:
+						os.rename(dest, src)
+					except OSError as e:
+						logger.error('Unable to move %s back to %s: %s' % (dest, src, e))
+			raise
+		finally:
+			# Only start the maps against a complete game install, (the new tree, or the old one moved back)
+			if os.path.isdir(os.path.join(app_dir, 'ShooterGame', 'Binaries')):
+				for svc in running:
+					logger.info('Starting %s' % svc.service)
+					svc.start()
+			elif len(running) > 0:
+				logger.error(
+					'AppFiles is not a complete game install, not starting %s' %
+					', '.join([svc.service for svc in running])
+				)
+
 
 class GameService(RCONService):
 	"""
@@ -439,6 +1380,7 @@ class GameService(RCONService):
 		self.build_systemd_config()
 		self.reload()
 		self.bulk = False
+		self.game.mod_index.invalidate()
 
 	def run_migrations(self):
 		"""
@@ -490,6 +1432,8 @@ class GameService(RCONService):
 			logger.error('Unable to determine Proton path for %s' % self.service)
 			return '/bin/false'
 
+		from warlock_manager.formatters.cli_formatter import cli_formatter
+
 		binary = self.get_binary()
 		map_name = self.get_option_value('Map Name')
 		options = cli_formatter(self.configs['service'], 'option', prefix='', sep='=', joiner='?')
@@ -537,6 +1481,7 @@ class GameService(RCONService):
 		:return:
 		"""
 		if option == 'Proton Path':
+			from warlock_manager.libs.proton import get_proton_paths
 			return get_proton_paths()
 		elif option == 'Multi Home':
 			return [''] + get_local_ips()
@@ -566,6 +1511,9 @@ class GameService(RCONService):
 				self.game.ensure_asa_api_loader()
 			success = True
 			rebuild_env = True
+		elif option == 'Mods':
+			self.game.mod_index.update(self, self.split_mod_ids(previous_value), self.split_mod_ids(new_value))
+			success = True
 
 		if rebuild_env:
 			self.build_environment_file()
@@ -633,9 +1581,12 @@ class GameService(RCONService):
 		"""
 		return os.path.join(utils.get_base_directory(), 'AppFiles', 'ShooterGame', 'Saved')
 
-	def get_save_files(self):
-		ret = ['clusters']
+	def get_map_save_path(self) -> str:
+		"""
+		Get the directory holding the saves of this map, relative to the save directory
 
+		:return:
+		"""
 		alt_save_dir = self.get_option_value('Alt Save Directory')
 		map_name = self.get_option_value('Map Name')
 
@@ -643,27 +1594,169 @@ class GameService(RCONService):
 			map_name = 'BobsMissions'
 
 		if alt_save_dir:
-			base_path = os.path.join(alt_save_dir, map_name)
-			check_path = os.path.join(self.get_save_directory(), alt_save_dir, map_name)
-			logger.debug('Using alternate save directory: %s' % check_path)
+			return os.path.join(alt_save_dir, map_name)
 		else:
-			base_path = os.path.join('SavedArks', map_name)
-			check_path = os.path.join(self.get_save_directory(), 'SavedArks', map_name)
-			logger.debug('Using default save directory: %s' % check_path)
+			return os.path.join('SavedArks', map_name)
+
+	@staticmethod
+	def is_save_file(filename: str) -> bool:
+		"""
+		Check if a file in a map save directory is save data, (and not one of the backups the game keeps)
+
+		:param filename:
+		:return:
+		"""
+		if filename.endswith('bak'):
+			# Skip backups
+			return False
+		if '_WP_0' in filename or '_WP_1' in filename:
+			# More backups to skip
+			return False
+		return True
+
+	def get_save_files(self):
+		ret = ['clusters']
+
+		base_path = self.get_map_save_path()
+		check_path = os.path.join(self.get_save_directory(), base_path)
+		logger.debug('Using save directory: %s' % check_path)
 
 		if os.path.exists(check_path):
 			for file in os.listdir(check_path):
-				if file.endswith('bak'):
-					# Skip backups
-					continue
-				if '_WP_0' in file or '_WP_1' in file:
-					# More backups to skip
-					continue
-				ret.append(os.path.join(base_path, file))
+				if self.is_save_file(file):
+					ret.append(os.path.join(base_path, file))
 		else:
 			logger.debug('Save directory does not exist: %s' % check_path)
 		return ret
 
+	def restore_saves(self, archive: str, include_clusters: bool = False) -> bool:
+		"""
+		Restore only the saves of this map from a backup archive
+
+		The archive is streamed, (gzip or zstd compressed tarballs from backup.sh or `manage.py backup`),
+		and only the files in this map's save directory are extracted, so other maps can keep running.
+		Save files which are not in the archive are removed so the map matches the backup exactly.
+		The map is stopped for the restore if running, and started again afterwards.
+
+		:param archive: Path of the backup archive
+		:param include_clusters: Also restore the cluster data shared by all maps, (requires all other maps stopped)
+		:return:
+		"""
+		prefixes = [self.get_map_save_path().rstrip('/') + '/']
+		if include_clusters:
+			running = [svc.service for svc in self.game.get_services() if svc.service != self.service and not svc.is_stopped()]
+			if len(running) > 0:
+				logger.error('Unable to restore cluster data while other maps are running: %s' % ', '.join(running))
+				return False
+			prefixes.append('clusters/')
+
+		was_running = not self.is_stopped()
+		if was_running and not self.game.stop_services([self]):
+			logger.error('%s did not stop, not restoring' % self.service)
+			return False
+
+		try:
+			return self._extract_saves(archive, prefixes)
+		finally:
+			if was_running:
+				logger.info('Starting %s' % self.service)
+				self.start()
+
+	def _extract_saves(self, archive: str, prefixes: list[str]) -> bool:
+		"""
+		Extract the save files under the given prefixes from a backup archive, (see restore_saves)
+
+		Both the save-directory layout of backup.sh and the "save/" layout of `manage.py backup` are accepted.
+		Files are staged first and only replace the live saves once the whole archive was read,
+		so a truncated or corrupt backup leaves the current saves untouched.
+
+		:param archive:
+		:param prefixes: Paths relative to the save directory, with a trailing slash
+		:return:
+		"""
+		import tempfile
+
+		save_dir = self.get_save_directory()
+		os.makedirs(save_dir, exist_ok=True)
+		staging = tempfile.mkdtemp(prefix='.restore-%s-' % self.service, dir=save_dir)
+		try:
+			restored = self._stage_saves(archive, prefixes, staging)
+			if restored is None:
+				return False
+			if len(restored) == 0:
+				logger.error('%s has no saves for %s, (looked for %s)' % (archive, self.service, ', '.join(prefixes)))
+				return False
+
+			for name in restored:
+				dest = os.path.join(save_dir, name)
+				os.makedirs(os.path.dirname(dest), exist_ok=True)
+				os.replace(os.path.join(staging, name), dest)
+
+			removed = 0
+			for prefix in prefixes:
+				for root, dirs, files in os.walk(os.path.join(save_dir, prefix)):
+					for file in files:
+						name = os.path.relpath(os.path.join(root, file), save_dir)
+						if self.is_save_file(file) and name not in restored:
+							os.remove(os.path.join(root, file))
+							removed += 1
+		finally:
+			shutil.rmtree(staging, ignore_errors=True)
+
+		utils.ensure_file_ownership(save_dir)
+		logger.info('Restored %s files for %s from %s, removed %s not in the backup' % (len(restored), self.service, archive, removed))
+		return True
+
+	def _stage_saves(self, archive: str, prefixes: list[str], staging: str) -> set[str] | None:
+		"""
+		Read the whole archive, writing the save files under the given prefixes into the staging directory
+
+		:param archive:
+		:param prefixes:
+		:param staging:
+		:return: Names of the staged files relative to the save directory, or None if the archive could not be read
+		"""
+		import tarfile
+
+		proc = None
+		restored = set()
+		try:
+			if archive.endswith('.zst') or archive.endswith('.tzst'):
+				proc = subprocess.Popen(['zstd', '-dc', archive], stdout=subprocess.PIPE)
+				tar = tarfile.open(fileobj=proc.stdout, mode='r|')
+			else:
+				tar = tarfile.open(archive, mode='r|*')
+
+			with tar:
+				for member in tar:
+					name = member.name[2:] if member.name.startswith('./') else member.name
+					if name.startswith('save/'):
+						# Archive written by `manage.py backup`
+						name = name[5:]
+					if not member.isfile() or not any(name.startswith(p) for p in prefixes):
+						continue
+					if os.path.isabs(name) or '..' in name.split('/') or not self.is_save_file(os.path.basename(name)):
+						continue
+
+					dest = os.path.join(staging, name)
+					os.makedirs(os.path.dirname(dest), exist_ok=True)
+					with tar.extractfile(member) as src, open(dest, 'wb') as f:
+						shutil.copyfileobj(src, f, 1024 * 1024)
+					os.chmod(dest, member.mode & 0o777)
+					os.utime(dest, (member.mtime, member.mtime))
+					restored.add(name)
+		except (OSError, EOFError, tarfile.TarError, zlib.error) as e:
+			logger.error('Unable to read %s, no saves were changed: %s' % (archive, e))
+			return None
+		finally:
+			if proc is not None:
+				proc.stdout.close()
+				if proc.wait() != 0 and proc.returncode != -signal.SIGPIPE:
+					logger.error('Unable to decompress %s, no saves were changed' % archive)
+					restored = None
+
+		return restored
+
 	def save_world(self):
 		"""
 		Issue a Save command on the server
@@ -756,13 +1849,20 @@ class GameService(RCONService):
 		Pulled directly from the option Mods
 		:return:
 		"""
-		enabled_mod_ids = self.get_option_value('Mods')
-		if enabled_mod_ids is None or enabled_mod_ids == '':
+		return self.split_mod_ids(self.get_option_value('Mods'))
+
+	@staticmethod
+	def split_mod_ids(value: str | None) -> list[str]:
+		"""
+		Split a Mods option value into its list of mod IDs
+
+		:param value:
+		:return:
+		"""
+		if value is None or value == '':
 			return []
 
-		enabled_mod_ids = enabled_mod_ids.split(',')
-		enabled_mod_ids = [m.strip() for m in enabled_mod_ids if m.strip() != '']
-		return enabled_mod_ids
+		return [m.strip() for m in str(value).split(',') if m.strip() != '']
 
 	def get_enabled_mods(self) -> list['GameMod']:
 		"""
@@ -848,6 +1948,481 @@ class GameService(RCONService):
 		"""
 		return self.get_option_value('Session Name')
 
+
+class ManagerDaemon:
+	"""
+	Resident manager which keeps the game and its services loaded between commands
+
+	Commands are received over a Unix socket along with the caller's stdin, stdout, stderr, and environment,
+	and each one runs in a forked copy of the loaded manager, so output, prompts, Ctrl-C, and exit codes
+	behave exactly as if manage.py had been run directly.
+	Only callers running as the same user as the daemon are accepted; anyone else runs the command locally.
+	The game is reloaded whenever any of its configuration files change.
+	"""
+
+	forward_signals = (signal.SIGINT, signal.SIGTERM, signal.SIGHUP)
+	"""
+	Signals the client passes on to the command, (the daemon is not in the caller's process group)
+	"""
+
+	def __init__(self):
+		self.game = None
+		self.mtimes = None
+
+	@staticmethod
+	def get_socket_path() -> str:
+		return os.path.join(utils.get_base_directory(), '.manage.sock')
+
+	def _get_config_mtimes(self) -> dict:
+		"""
+		Get the modification time of every file the game and service configuration is loaded from
+
+		:return:
+		"""
+		base_dir = utils.get_base_directory()
+		directories = [
+			base_dir,
+			os.path.join(base_dir, 'services'),
+			os.path.join(base_dir, 'AppFiles', 'ShooterGame', 'Saved', 'Config', 'WindowsServer'),
+			'/etc/systemd/system',
+		]
+		mtimes = {}
+		for directory in directories:
+			if not os.path.isdir(directory):
+				continue
+			for entry in os.scandir(directory):
+				if directory == '/etc/systemd/system' and not entry.name.startswith('ark-'):
+					continue
+				if entry.is_dir() and entry.name.endswith('.service.d'):
+					for override in os.scandir(entry.path):
+						mtimes[override.path] = override.stat().st_mtime_ns
+				elif entry.is_file() and entry.name.endswith(('.ini', '.json', '.yaml', '.conf', '.service')):
+					mtimes[entry.path] = entry.stat().st_mtime_ns
+		return mtimes
+
+	def _get_game(self) -> GameApp:
+		"""
+		Get the loaded game, reloading it if any configuration file has changed since it was loaded
+
+		:return:
+		"""
+		mtimes = self._get_config_mtimes()
+		if self.game is None or mtimes != self.mtimes:
+			if self.game is not None:
+				logger.info('Configuration changed, reloading')
+			self.game = GameApp()
+			self.mtimes = mtimes
+		return self.game
+
+	def serve(self):
+		"""
+		Listen for commands until stopped
+
+		:return:
+		"""
+		path = self.get_socket_path()
+		if os.path.exists(path):
+			os.remove(path)
+		server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		# Create the socket owner-only from the start, rather than fixing the mode after bind
+		umask = os.umask(0o177)
+		try:
+			server.bind(path)
+		finally:
+			os.umask(umask)
+		server.listen(16)
+		# Forked commands are reaped automatically, and stopping the daemon removes the socket
+		signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+		signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+		self._get_game()
+		logger.info('Listening on %s' % path)
+
+		try:
+			while True:
+				conn, addr = server.accept()
+				fds = []
+				try:
+					uid = self._get_peer_uid(conn)
+					if uid != os.geteuid():
+						raise PermissionError('caller uid %s does not match the daemon uid %s' % (uid, os.geteuid()))
+					msg, fds, flags, addr = socket.recv_fds(conn, 65536, 3)
+					# The request, (with the caller's environment), is newline terminated and may span several reads
+					while not msg.endswith(b'\n'):
+						data = conn.recv(65536)
+						if not data:
+							raise ValueError('incomplete request')
+						msg += data
+					request = json.loads(msg.decode('utf-8'))
+					game = self._get_game()
+				except (OSError, ValueError) as e:
+					logger.error('Invalid request: %s' % e)
+					for fd in fds:
+						os.close(fd)
+					conn.close()
+					continue
+
+				if os.fork() == 0:
+					server.close()
+					self._run_request(conn, game, request, fds)
+				for fd in fds:
+					os.close(fd)
+				conn.close()
+		finally:
+			server.close()
+			os.remove(path)
+
+	@staticmethod
+	def _get_peer_uid(conn: socket.socket) -> int:
+		"""
+		Get the uid of the process on the other end of a Unix socket, (as checked by the kernel)
+
+		:param conn:
+		:return:
+		"""
+		import struct
+
+		creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+		pid, uid, gid = struct.unpack('3i', creds)
+		return uid
+
+	@staticmethod
+	def _watch_client(conn: socket.socket):
+		"""
+		Raise the signals forwarded by the client in this process, and stop if the client goes away
+
+		:param conn:
+		:return:
+		"""
+		buffer = b''
+		while True:
+			try:
+				data = conn.recv(64)
+			except OSError:
+				data = b''
+			if not data:
+				# Client was killed without a chance to forward anything; nobody is left to read the output
+				os.kill(os.getpid(), signal.SIGHUP)
+				return
+			buffer += data
+			while b'\n' in buffer:
+				line, buffer = buffer.split(b'\n', 1)
+				if line.strip().isdigit():
+					os.kill(os.getpid(), int(line))
+
+	@staticmethod
+	def _run_request(conn: socket.socket, game: GameApp, request: dict, fds: list[int]):
+		"""
+		Run a command in a forked child on the caller's stdin, stdout, stderr, and environment,
+		then send back its exit code
+
+		:param conn:
+		:param game:
+		:param request: {argv, cwd, env}
+		:param fds: Caller's stdin, stdout, and stderr
+		:return: Never returns
+		"""
+		import threading
+
+		signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+		signal.signal(signal.SIGTERM, signal.SIG_DFL)
+		signal.signal(signal.SIGHUP, signal.SIG_DFL)
+		signal.signal(signal.SIGINT, signal.default_int_handler)
+		exit_code = 1
+		try:
+			for target, fd in enumerate(fds):
+				os.dup2(fd, target)
+				os.close(fd)
+			os.chdir(request['cwd'])
+			os.environ.clear()
+			os.environ.update(request.get('env', {}))
+			threading.Thread(target=ManagerDaemon._watch_client, args=(conn,), daemon=True).start()
+			exit_code = run_command(game, request['argv'])
+		except KeyboardInterrupt:
+			exit_code = 130
+		except Exception:
+			traceback.print_exc()
+		finally:
+			sys.stdout.flush()
+			sys.stderr.flush()
+			conn.sendall(str(exit_code).encode('utf-8'))
+			os._exit(0)
+
+	@classmethod
+	def run_client(cls, argv: list[str]) -> int | None:
+		"""
+		Run a command through the daemon, if one is running
+
+		:param argv: CLI arguments, (without the script name)
+		:return: Exit code, or None if no daemon is available and the command should run locally
+		"""
+		path = cls.get_socket_path()
+		try:
+			if os.stat(path).st_uid != os.geteuid():
+				# The daemon runs as another user, (eg: root calling a steam-owned daemon), so it cannot act for us
+				return None
+		except OSError:
+			return None
+
+		client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			client.connect(path)
+			request = json.dumps({'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ)}).encode('utf-8')
+			socket.send_fds(client, [request + b'\n'], [0, 1, 2])
+		except OSError:
+			# Stale socket or the daemon refused us; run locally instead
+			client.close()
+			return None
+
+		def forward(signum, frame):
+			try:
+				client.sendall(b'%d\n' % signum)
+			except OSError:
+				pass
+
+		previous = {signum: signal.signal(signum, forward) for signum in cls.forward_signals}
+		response = b''
+		try:
+			while True:
+				data = client.recv(64)
+				if not data:
+					break
+				response += data
+		except OSError:
+			# The daemon went away mid-command
+			return 1
+		finally:
+			for signum, handler in previous.items():
+				signal.signal(signum, handler)
+			client.close()
+
+		return int(response) if response.strip().lstrip(b'-').isdigit() else 1
+
+
+def profile_startup(argv: list[str], top: int = 15, budget: float | None = None) -> int:
+	"""
+	Time a cold start of a manage.py command and report the slowest imports
+
+	The command runs in a fresh interpreter with -X importtime, (and without the daemon),
+	so the report reflects what a first call from the web interface or cron costs.
+
+	:param argv: Command to time, (without the script name)
+	:param top: Number of imports to list
+	:param budget: Seconds the command may take, the exit code is 1 if it takes longer
+	:return: Exit code
+	"""
+	env = dict(os.environ, MANAGE_NO_DAEMON='1')
+	start = time.perf_counter()
+	proc = subprocess.run(
+		[sys.executable, '-X', 'importtime', os.path.abspath(sys.argv[0])] + argv,
+		env=env,
+		stdin=subprocess.DEVNULL,
+		stdout=subprocess.DEVNULL,
+		stderr=subprocess.PIPE
+	)
+	elapsed = time.perf_counter() - start
+
+	# Lines are "import time: self [us] | cumulative | imported package", nested imports are indented
+	imports = []
+	total_us = 0
+	for line in proc.stderr.decode('utf-8', errors='replace').splitlines():
+		if not line.startswith('import time:') or 'self [us]' in line:
+			continue
+		self_us, cumulative_us, name = line[12:].split('|', 2)
+		if not name.startswith('  '):
+			total_us += int(cumulative_us)
+		imports.append((int(self_us), int(cumulative_us), name.strip()))
+
+	print('%s: %.0f ms total, %.0f ms importing %s modules' % (' '.join(argv), elapsed * 1000, total_us / 1000, len(imports)))
+	print('%10s %12s  %s' % ('self (ms)', 'cumul. (ms)', 'module'))
+	for self_us, cumulative_us, name in sorted(imports, reverse=True)[:top]:
+		print('%10.1f %12.1f  %s' % (self_us / 1000, cumulative_us / 1000, name))
+
+	if budget is not None and elapsed > budget:
+		logger.error('Startup took %.2f seconds, over the budget of %.2f seconds' % (elapsed, budget))
+		return 1
+	return 0
+
+
+def run_command(game: GameApp, argv: list[str]) -> int:
+	"""
+	Run a single manage.py command
+
+	:param game:
+	:param argv: CLI arguments, (without the script name)
+	:return: Exit code
+	"""
+	exit_code = handle_game_command(game, argv)
+	if exit_code is not None:
+		return exit_code
+
+	sys.argv = [sys.argv[0]] + argv
+	try:
+		app = app_runner(game)
+		add_game_commands(app, game)
+		app()
+	except SystemExit as e:
+		if e.code is None:
+			return 0
+		return e.code if isinstance(e.code, int) else 1
+	return 0
+
+
+def get_game_command_parser() -> tuple[argparse.ArgumentParser, argparse._SubParsersAction]:
+	"""
+	Get the parser for the ARK-specific commands which are not provided by the Warlock app runner
+
+	:return: (parser, subcommands)
+	"""
+	parser = argparse.ArgumentParser('manage.py')
+	parser.add_argument('--debug', action='store_true')
+	commands = parser.add_subparsers(dest='command')
+	commands.add_parser('daemon', help='Keep the manager loaded and answer commands over a local socket')
+	startup = commands.add_parser('startup-profile', help='Time a cold start of a command and list the slowest imports')
+	startup.add_argument('--top', type=int, default=15, help='Number of imports to list')
+	startup.add_argument('--budget', type=float, help='Fail if the command takes longer than this many seconds')
+	startup.add_argument('args', nargs=argparse.REMAINDER, help='Command to time, (default: --help)')
+	commands.add_parser('stage-update', help='Install the game update into the standby game files while maps keep running')
+	commands.add_parser('cutover', help='Restart the maps on the staged game files')
+	commands.add_parser('rollback', help='Restart the maps on the previous game files')
+	commands.add_parser('prefetch-mods', help='Download any missing or outdated mods once before starting maps')
+	mod_updates = commands.add_parser('check-mod-updates', help='Check mods in use for updates and list the maps affected')
+	mod_updates.add_argument('--restart', action='store_true', help='Restart only the running maps which use an updated mod')
+	backup_incremental = commands.add_parser(
+		'backup-incremental', help='Back up the save files into the deduplicated incremental backup store'
+	)
+	backup_incremental.add_argument('--keep', type=int, help='Afterwards, remove all but this many of the newest backups')
+	prune_incremental = commands.add_parser(
+		'prune-incremental', help='Remove old incremental backups and the chunks only they use'
+	)
+	prune_incremental.add_argument('keep', type=int, help='Number of the newest backups to keep')
+	commands.add_parser('list-incremental', help='List the incremental backups')
+	restore_incremental = commands.add_parser('restore-incremental', help='Restore the save files from an incremental backup')
+	restore_incremental.add_argument('name', help='Backup name, as shown by list-incremental')
+	restore_map = commands.add_parser('restore-map', help='Restore the saves of a single map from a backup archive')
+	restore_map.add_argument('service', help='Service name of the map, eg: ark-island')
+	restore_map.add_argument('archive', help='Backup archive, (.tgz or .tar.zst)')
+	restore_map.add_argument('--clusters', action='store_true', help='Also restore the cluster data shared by all maps')
+	mod_usage = commands.add_parser('mod-usage', help='Show which maps use each mod, and which installed mods are unused')
+	mod_usage.add_argument('mod_id', nargs='?', help='Only show the maps using this mod')
+	return parser, commands
+
+
+def add_game_commands(app, game: GameApp):
+	"""
+	List the ARK-specific commands in the app runner's --help
+
+	They are normally handled by handle_game_command() before the app runner sees the arguments,
+	these entries only hand any which do reach it back.
+
+	:param app: Typer app from app_runner()
+	:param game:
+	:return:
+	"""
+	import typer
+
+	def get_command(name: str):
+		def command(ctx: typer.Context):
+			sys.exit(handle_game_command(game, [name] + ctx.args))
+		return command
+
+	parser, commands = get_game_command_parser()
+	for action in commands._choices_actions:
+		app.command(
+			action.dest,
+			help=action.help,
+			add_help_option=False,
+			context_settings={'allow_extra_args': True, 'ignore_unknown_options': True}
+		)(get_command(action.dest))
+
+
+def handle_game_command(game: GameApp, argv: list[str]) -> int | None:
+	"""
+	Handle the ARK-specific commands which are not provided by the Warlock app runner
+
+	:param game:
+	:param argv: CLI arguments, (without the script name)
+	:return: Exit code, or None if the arguments should be handled by the app runner instead
+	"""
+	parser, commands = get_game_command_parser()
+
+	# Only the command itself decides who handles the arguments, (an option value may equal a command name)
+	positional = [arg for arg in argv if not arg.startswith('-')]
+	if len(positional) == 0 or positional[0] not in commands.choices:
+		return None
+
+	args = parser.parse_args(argv)
+	if args.command == 'daemon':
+		ManagerDaemon().serve()
+		return 0
+	elif args.command == 'startup-profile':
+		return profile_startup(args.args or ['--help'], args.top, args.budget)
+	elif args.command == 'stage-update':
+		return 0 if game.stage_update() else 1
+	elif args.command == 'cutover':
+		return 0 if game.cutover() else 1
+	elif args.command == 'rollback':
+		return 0 if game.cutover(rollback=True) else 1
+	elif args.command == 'prefetch-mods':
+		return 0 if game.prefetch_mods() else 1
+	elif args.command == 'check-mod-updates':
+		return 0 if game.restart_for_mod_updates(dry_run=not args.restart) else 1
+	elif args.command == 'backup-incremental':
+		try:
+			store = ChunkedBackup(game)
+			store.backup()
+			if args.keep is not None:
+				store.prune(args.keep)
+		except GameAPIException as e:
+			logger.error('Unable to create backup: %s' % e)
+			return 1
+		return 0
+	elif args.command == 'prune-incremental':
+		try:
+			ChunkedBackup(game).prune(args.keep)
+		except GameAPIException as e:
+			logger.error('Unable to prune backups: %s' % e)
+			return 1
+		return 0
+	elif args.command == 'list-incremental':
+		for name in ChunkedBackup(game).get_manifests():
+			print(name)
+		return 0
+	elif args.command == 'restore-incremental':
+		try:
+			return 0 if ChunkedBackup(game).restore(args.name) else 1
+		except GameAPIException as e:
+			logger.error('Unable to restore backup: %s' % e)
+			return 1
+	elif args.command == 'restore-map':
+		for svc in game.get_services():
+			if svc.service == args.service:
+				return 0 if svc.restore_saves(args.archive, args.clusters) else 1
+		logger.error('Service %s not found' % args.service)
+		return 1
+	elif args.command == 'mod-usage':
+		if args.mod_id:
+			mod_ids = [args.mod_id]
+		else:
+			mod_ids = game.mod_index.get_mod_ids()
+		for mod_id in mod_ids:
+			services = game.mod_index.get_services(mod_id)
+			print('%s: %s' % (mod_id, ', '.join([svc.service for svc in services]) or 'not used'))
+		if args.mod_id:
+			restart = game.mod_index.get_services_to_restart(mod_ids)
+			if len(restart) > 0:
+				print('Running maps to restart for an update: %s' % ', '.join([svc.service for svc in restart]))
+		else:
+			for mod in game.mod_index.get_unused_mods():
+				print('%s: installed but not used (%s)' % (mod.id, mod.name))
+		return 0
+	return None
+
+
 if __name__ == '__main__':
-	app = app_runner(GameApp())
-	app()
+	# Hand the command to the resident daemon when one is running, (set MANAGE_NO_DAEMON=1 to bypass)
+	if len(sys.argv) > 1 and sys.argv[1] != 'daemon' and not os.environ.get('MANAGE_NO_DAEMON'):
+		exit_code = ManagerDaemon.run_client(sys.argv[1:])
+		if exit_code is not None:
+			sys.exit(exit_code)
+
+	sys.exit(run_command(GameApp(), sys.argv[1:]))
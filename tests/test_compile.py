@@ -0,0 +1,387 @@
+"""
+Checks of compile.py, run as it is used: as a script in a scratch project directory
+
+Scriptlets are served from a local HTTP server, (see the url: source type in compile.sources),
+so nothing here needs network access.
+"""
+import hashlib
+import http.server
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+COMPILE = os.path.join(os.path.dirname(HERE), 'compile.py')
+
+
+class ScriptletServer(http.server.ThreadingHTTPServer):
+	"""
+	Serves files from a dict with ETags, and records every request as (client port, path, status)
+	"""
+
+	def __init__(self):
+		self.files = {}
+		self.requests = []
+		super().__init__(('127.0.0.1', 0), ScriptletHandler)
+
+	@property
+	def url(self) -> str:
+		return 'http://127.0.0.1:%s' % self.server_address[1]
+
+
+class ScriptletHandler(http.server.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def do_GET(self):
+		data = self.server.files.get(self.path)
+		if data is None:
+			status = 404
+		else:
+			etag = '"%s"' % hashlib.sha256(data).hexdigest()
+			status = 304 if self.headers.get('If-None-Match') == etag else 200
+		self.server.requests.append((self.client_address[1], self.path, status))
+
+		self.send_response(status)
+		if status == 200:
+			self.send_header('ETag', etag)
+			self.send_header('Content-Length', str(len(data)))
+			self.end_headers()
+			self.wfile.write(data)
+		else:
+			if status == 304:
+				self.send_header('ETag', etag)
+			self.send_header('Content-Length', '0')
+			self.end_headers()
+
+	def log_message(self, format, *args):
+		pass
+
+
+class CompileTestCase(unittest.TestCase):
+	"""
+	A scratch project with compile.py, and a scriptlet server for the 'a/' scriptlets
+	"""
+
+	def setUp(self):
+		self.server = ScriptletServer()
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+		self.addCleanup(self.server.server_close)
+		self.addCleanup(self.server.shutdown)
+
+		self.project = tempfile.mkdtemp(prefix='compile-test-')
+		self.addCleanup(shutil.rmtree, self.project)
+		shutil.copy(COMPILE, os.path.join(self.project, 'compile.py'))
+		self.write('compile.sources', 'a=url:%s/scriptlets\n' % self.server.url)
+
+	def write(self, path: str, content: str):
+		path = os.path.join(self.project, path)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(path, 'w') as f:
+			f.write(content)
+
+	def read(self, path: str) -> str:
+		with open(os.path.join(self.project, path), 'r') as f:
+			return f.read()
+
+	def serve(self, name: str, content: str):
+		self.server.files['/scriptlets/%s' % name] = content.encode('utf-8')
+
+	def compile(self, *args, returncode: int = 0) -> str:
+		proc = subprocess.run(
+			[sys.executable, 'compile.py'] + list(args),
+			cwd=self.project,
+			stdin=subprocess.DEVNULL,
+			stdout=subprocess.PIPE,
+			stderr=subprocess.STDOUT,
+			timeout=120
+		)
+		output = proc.stdout.decode('utf-8', errors='replace')
+		self.assertEqual(returncode, proc.returncode, output)
+		return output
+
+
+class TestFetch(CompileTestCase):
+	def setUp(self):
+		super().setUp()
+		self.serve('a/one.sh', '# scriptlet:a/two.sh\nfunction one() {\n\techo 1\n}\n')
+		self.serve('a/two.sh', '# scriptlet:a/three.sh\nfunction two() {\n\techo 2\n}\n')
+		self.serve('a/three.sh', 'function three() {\n\techo 3\n}\n')
+		for i in range(6):
+			self.serve('a/extra%s.sh' % i, 'function extra%s() {\n\techo %s\n}\n' % (i, i))
+		includes = ['# scriptlet:a/one.sh'] + ['# scriptlet:a/extra%s.sh' % i for i in range(6)]
+		self.write('src/test.sh', '#!/bin/bash\n#\n# Test\n%s\none\n' % '\n'.join(includes))
+
+	def test_fetches_the_whole_include_graph(self):
+		self.compile()
+		output = self.read('dist/test.sh')
+		for text in ('echo 1', 'echo 2', 'echo 3', 'echo 5'):
+			self.assertIn(text, output)
+		# Each scriptlet is downloaded once
+		paths = [path for port, path, status in self.server.requests]
+		self.assertEqual(sorted(set(paths)), sorted(paths))
+
+	def test_revalidates_with_etags(self):
+		self.compile()
+		self.server.requests.clear()
+		self.compile()
+		self.assertEqual(9, len(self.server.requests))
+		self.assertEqual({304}, set(status for port, path, status in self.server.requests))
+
+	def test_reuses_connections(self):
+		self.compile('--jobs', '2')
+		self.assertEqual(9, len(self.server.requests))
+		# Two workers, so never more than two connections open for the whole build
+		self.assertLessEqual(len(set(port for port, path, status in self.server.requests)), 2)
+
+
+class BuiltProjectTestCase(CompileTestCase):
+	"""
+	Two scripts, each including its own scriptlet, built once with --incremental
+	"""
+
+	def setUp(self):
+		super().setUp()
+		self.serve('a/one.sh', 'function one() {\n\techo 1\n}\n')
+		self.serve('a/two.sh', 'function two() {\n\techo 2\n}\n')
+		self.write('src/one.sh', '#!/bin/bash\n#\n# One\n# scriptlet:a/one.sh\none\n')
+		self.write('src/two.sh', '#!/bin/bash\n#\n# Two\n# scriptlet:a/two.sh\ntwo\n')
+		self.compile('--incremental')
+		# Backdate the outputs so any rewrite is visible
+		for output in ('dist/one.sh', 'dist/two.sh'):
+			os.utime(os.path.join(self.project, output), ns=(1000000000, 1000000000))
+
+	def get_mtime(self, path: str) -> int:
+		return os.stat(os.path.join(self.project, path)).st_mtime_ns
+
+
+class TestIncremental(BuiltProjectTestCase):
+	def test_unchanged_build_writes_nothing(self):
+		self.compile('--incremental')
+		self.assertEqual(1000000000, self.get_mtime('dist/one.sh'))
+		self.assertEqual(1000000000, self.get_mtime('dist/two.sh'))
+
+	def test_scriptlet_change_rebuilds_only_its_dependents(self):
+		self.serve('a/one.sh', 'function one() {\n\techo uno\n}\n')
+		self.compile('--incremental')
+		self.assertIn('echo uno', self.read('dist/one.sh'))
+		self.assertEqual(1000000000, self.get_mtime('dist/two.sh'))
+
+	def test_source_change_rebuilds_it(self):
+		self.write('src/two.sh', '#!/bin/bash\n#\n# Two\n# scriptlet:a/two.sh\ntwo\ntwo\n')
+		self.compile('--incremental')
+		self.assertTrue(self.read('dist/two.sh').endswith('two\ntwo\n'))
+		self.assertEqual(1000000000, self.get_mtime('dist/one.sh'))
+
+	def test_deleted_source_removes_its_output(self):
+		os.remove(os.path.join(self.project, 'src', 'two.sh'))
+		self.compile('--incremental')
+		self.assertFalse(os.path.exists(os.path.join(self.project, 'dist', 'two.sh')))
+		self.assertTrue(os.path.exists(os.path.join(self.project, 'dist', 'one.sh')))
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'watch mode uses inotify')
+class TestWatch(BuiltProjectTestCase):
+	def setUp(self):
+		super().setUp()
+		self.watcher = subprocess.Popen(
+			[sys.executable, 'compile.py', '--watch'],
+			cwd=self.project,
+			stdin=subprocess.DEVNULL,
+			stdout=subprocess.PIPE,
+			stderr=subprocess.STDOUT
+		)
+		self.addCleanup(self.stop_watcher)
+		# Wait for the initial build to finish and the watches to be in place
+		while b'Watching' not in self.watcher.stdout.readline():
+			self.assertIsNone(self.watcher.poll(), 'compile.py --watch exited')
+
+	def stop_watcher(self):
+		self.watcher.send_signal(signal.SIGINT)
+		try:
+			self.watcher.wait(10)
+		except subprocess.TimeoutExpired:
+			self.watcher.kill()
+			self.watcher.wait()
+		self.watcher.stdout.close()
+
+	def wait_for(self, check, timeout: float = 10) -> bool:
+		end = time.time() + timeout
+		while time.time() < end:
+			if check():
+				return True
+			time.sleep(0.05)
+		return False
+
+	def test_rebuilds_a_saved_source(self):
+		self.write('src/two.sh', '#!/bin/bash\n#\n# Two\n# scriptlet:a/two.sh\ntwo\ntwo\n')
+		self.assertTrue(self.wait_for(lambda: self.read('dist/two.sh').endswith('two\ntwo\n')))
+		self.assertEqual(1000000000, self.get_mtime('dist/one.sh'))
+
+	def test_builds_a_new_source(self):
+		self.write('src/three.sh', '#!/bin/bash\n#\n# Three\n# scriptlet:a/one.sh\none\n')
+		self.assertTrue(self.wait_for(lambda: os.path.exists(os.path.join(self.project, 'dist', 'three.sh'))))
+		self.assertTrue(self.wait_for(lambda: 'echo 1' in self.read('dist/three.sh')))
+
+	def test_deleted_source_removes_its_output(self):
+		os.remove(os.path.join(self.project, 'src', 'two.sh'))
+		self.assertTrue(self.wait_for(lambda: not os.path.exists(os.path.join(self.project, 'dist', 'two.sh'))))
+
+
+class TestLock(CompileTestCase):
+	def setUp(self):
+		super().setUp()
+		self.serve('a/one.sh', '# scriptlet:a/two.sh\nfunction one() {\n\techo 1\n}\n')
+		self.serve('a/two.sh', 'function two() {\n\techo 2\n}\n')
+		self.write('src/test.sh', '#!/bin/bash\n#\n# Test\n# scriptlet:a/one.sh\none\n')
+		self.compile('--lock')
+
+	def test_pins_and_vendors_every_scriptlet(self):
+		lock = json.loads(self.read('compile.lock'))
+		self.assertEqual(['a/one.sh', 'a/two.sh'], sorted(lock.keys()))
+		for name, entry in lock.items():
+			content = self.server.files['/scriptlets/%s' % name]
+			self.assertEqual('%s/scriptlets/%s' % (self.server.url, name), entry['source'])
+			self.assertEqual(hashlib.sha256(content).hexdigest(), entry['sha256'])
+			self.assertEqual(content.decode('utf-8'), self.read(os.path.join('vendor', 'scriptlets', name)))
+
+	def test_locked_build_is_offline(self):
+		self.server.requests.clear()
+		self.serve('a/two.sh', 'function two() {\n\techo changed upstream\n}\n')
+		self.compile()
+		self.assertEqual([], self.server.requests)
+		self.assertIn('echo 2', self.read('dist/test.sh'))
+
+	def test_modified_vendored_scriptlet_fails(self):
+		self.write('vendor/scriptlets/a/two.sh', 'function two() {\n\techo tampered\n}\n')
+		output = self.compile(returncode=1)
+		self.assertIn('ERROR - scriptlet', output)
+
+	def test_scriptlet_missing_from_lock_fails(self):
+		self.serve('a/three.sh', 'function three() {\n\techo 3\n}\n')
+		self.write('src/test.sh', '#!/bin/bash\n#\n# Test\n# scriptlet:a/one.sh\n# scriptlet:a/three.sh\none\n')
+		output = self.compile(returncode=1)
+		self.assertIn('run compile.py --lock', output)
+
+
+class TestDocs(CompileTestCase):
+	"""
+	Functions documented from local scriptlets into the README
+	"""
+
+	def setUp(self):
+		super().setUp()
+		self.write('.supplemental/README-template.md', '# Scripts\n\n%%SCRIPTLETS%%')
+		self.write('src/test.sh', '#!/bin/bash\n#\n# Test\necho test\n')
+
+	def get_functions(self) -> list:
+		return re.findall(r'^#### function ([\w.]+)', self.read('README.md'), re.MULTILINE)
+
+	def test_python_functions_and_methods(self):
+		self.write('scriptlets/lib/tools.py', '''import os
+
+
+def plain(a, b=2):
+	"""
+	Add the numbers
+
+	:param a: First
+	"""
+	def nested():
+		pass
+	return a + b
+
+
+@decorator
+async def fetch(
+	url: str,  # the address
+	timeout: float = (1.0),
+) -> bytes:
+	r\'\'\'Read the url, (def not_a_function() is only text)\'\'\'
+
+
+class Client:
+	"""
+	def not_a_method():
+	"""
+	name = 'client'
+
+	if os.name == 'nt':
+		def windows_only(self):
+			pass
+
+	def connect(self, host: str = "localhost"):
+		"""Connect, (it's quick)"""
+		pass
+
+	hosts = [
+'one',
+	]
+
+	class Inner:
+		def hidden(self):
+			pass
+
+	def close(self) -> None:
+		pass
+
+
+def undocumented():
+	value = 1
+	"""Not a docstring"""
+
+
+def annotated() -> dict[str, "a:b"]:
+	"""Returns a mapping"""
+''')
+		self.compile()
+		readme = self.read('README.md')
+		self.assertEqual(['plain', 'fetch', 'Client.connect', 'Client.close', 'undocumented', 'annotated'], self.get_functions())
+		self.assertIn('#### function plain(a, b=2):\n\nAdd the numbers\n\n:param a: First\n\n', readme)
+		self.assertIn(
+			'#### function fetch(url: str, timeout: float=1.0) -> bytes:\n\n'
+			'Read the url, (def not_a_function() is only text)\n\n',
+			readme
+		)
+		self.assertIn("#### function Client.connect(self, host: str='localhost'):\n\nConnect, (it's quick)\n\n", readme)
+		self.assertIn('#### function Client.close(self) -> None:\n\n\n\n', readme)
+		self.assertIn('#### function undocumented():\n\n\n\n', readme)
+		self.assertIn("#### function annotated() -> dict[str, 'a:b']:\n\nReturns a mapping\n\n", readme)
+
+	def test_shell_functions(self):
+		self.write('scriptlets/lib/tools.sh', (
+			'# Not part of the docs\n'
+			'\n'
+			'# Print one\n'
+			'# and more\n'
+			'function one() {\n'
+			'\techo 1\n'
+			'}\n'
+			'\n'
+			'# Print two\n'
+			'two()\n'
+			'{\n'
+			'\techo 2\n'
+			'}\n'
+			'\n'
+			'function three {\n'
+			'\techo 3\n'
+			'}\n'
+			'four() # not a function\n'
+		))
+		self.compile()
+		readme = self.read('README.md')
+		self.assertEqual(['one', 'two', 'three'], self.get_functions())
+		self.assertIn('#### function one:\n\nPrint one\nand more\n\n', readme)
+		self.assertIn('#### function two:\n\nPrint two\n\n', readme)
+
+
+if __name__ == '__main__':
+	unittest.main()
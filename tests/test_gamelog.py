@@ -0,0 +1,58 @@
+"""
+Checks of the map readiness detection from the shared game log in scripts/manage.py
+
+scripts/manage.py requires root and the game's dependencies on import,
+so only the GameLog class is loaded from its source.
+"""
+import ast
+import os
+import shutil
+import tempfile
+import unittest
+from time import sleep, time
+from typing import Union
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+MANAGE = os.path.join(os.path.dirname(HERE), 'scripts', 'manage.py')
+
+READY = '[2026.10.18-13.00.00:000][  0]Server: "%s" has completed startup and is now advertising for join.\n'
+
+
+def load_game_log(here: str):
+	with open(MANAGE, 'r') as f:
+		tree = ast.parse(f.read())
+	nodes = [node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == 'GameLog']
+	namespace = {'os': os, 'here': here, 'sleep': sleep, 'time': time, 'Union': Union}
+	exec(compile(ast.Module(body=nodes, type_ignores=[]), MANAGE, 'exec'), namespace)
+	return namespace['GameLog']
+
+
+class TestReadyLine(unittest.TestCase):
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp(prefix='gamelog-test-')
+		self.addCleanup(shutil.rmtree, self.tmp)
+		self.log_file = os.path.join(self.tmp, 'AppFiles', 'ShooterGame', 'Saved', 'Logs', 'ShooterGame.log')
+		os.makedirs(os.path.dirname(self.log_file))
+		self.game_log = load_game_log(self.tmp)
+
+	def append(self, text: str):
+		with open(self.log_file, 'a') as f:
+			f.write(text)
+
+	def test_only_the_line_naming_the_map_counts(self):
+		self.assertTrue(self.game_log.is_ready_line(READY % 'My Island', 'My Island'))
+		self.assertFalse(self.game_log.is_ready_line(READY % 'My Island Two', 'My Island'))
+		self.assertFalse(self.game_log.is_ready_line(READY % 'My Scorched', 'My Island'))
+
+	def test_only_lines_after_the_start_are_read(self):
+		self.append(READY % 'My Island')
+		log = self.game_log()
+		self.assertEqual([], log.read_lines())
+		self.append(READY % 'My Scorched')
+		lines = log.read_lines()
+		self.assertEqual(1, len(lines))
+		self.assertFalse(any(self.game_log.is_ready_line(line, 'My Island') for line in lines))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,342 @@
+"""
+Checks of the save handling in src/manage.py, run against scratch save directories
+
+Run from the project root with the development venv, (see setup-dev.sh):
+
+	.venv/bin/python -m unittest discover tests
+"""
+import datetime
+import importlib.util
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+MANAGE = os.path.join(os.path.dirname(HERE), 'src', 'manage.py')
+
+WARLOCK_MANAGER = importlib.util.find_spec('warlock_manager') is not None
+
+
+def needs_warlock_manager(test):
+	"""
+	Without warlock_manager the test is expected to fail, (and is reported as such), instead of being skipped
+	"""
+	return test if WARLOCK_MANAGER else unittest.expectedFailure(test)
+
+
+def load_manage():
+	spec = importlib.util.spec_from_file_location('manage', MANAGE)
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+
+def write_archive(path: str, files: dict):
+	with tarfile.open(path, 'w:gz') as tar:
+		for name, data in files.items():
+			info = tarfile.TarInfo(name)
+			info.size = len(data)
+			info.mtime = 1700000000
+			tar.addfile(info, io.BytesIO(data))
+
+
+class ScratchTestCase(unittest.TestCase):
+	"""
+	A scratch directory, with src/manage.py loaded by the tests themselves so a missing warlock_manager fails the test
+	"""
+
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp(prefix='manage-test-')
+		self.addCleanup(shutil.rmtree, self.tmp)
+
+	def load(self):
+		self.manage = load_manage()
+		patcher = mock.patch.object(self.manage.utils, 'ensure_file_ownership')
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def write(self, path: str, data: bytes):
+		path = os.path.join(self.tmp, path)
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+		with open(path, 'wb') as f:
+			f.write(data)
+
+	def read(self, path: str) -> bytes:
+		with open(os.path.join(self.tmp, path), 'rb') as f:
+			return f.read()
+
+	def exists(self, path: str) -> bool:
+		return os.path.exists(os.path.join(self.tmp, path))
+
+
+class TestRestoreSaves(ScratchTestCase):
+	def setUp(self):
+		super().setUp()
+		self.write('Saved/SavedArks/TheIsland_WP/TheIsland_WP.ark', b'live')
+		self.write('Saved/SavedArks/TheIsland_WP/1234.arkprofile', b'created since')
+		self.write('Saved/SavedArks/ScorchedEarth_WP/ScorchedEarth_WP.ark', b'other map')
+
+	def restore(self, files: dict, truncate: int = None) -> bool:
+		self.load()
+		archive = os.path.join(self.tmp, 'ark-island-backup.tar.gz')
+		write_archive(archive, files)
+		if truncate is not None:
+			with open(archive, 'r+b') as f:
+				f.truncate(truncate)
+		service = self.manage.GameService.__new__(self.manage.GameService)
+		service.service = 'ark-island'
+		service.get_save_directory = lambda: os.path.join(self.tmp, 'Saved')
+		return service._extract_saves(archive, ['SavedArks/TheIsland_WP/'])
+
+	@needs_warlock_manager
+	def test_restores_manage_py_backup_layout(self):
+		self.assertTrue(self.restore({
+			'./save/SavedArks/TheIsland_WP/TheIsland_WP.ark': b'backup',
+			'./save/SavedArks/ScorchedEarth_WP/ScorchedEarth_WP.ark': b'other backup',
+			'./config/GameUserSettings.ini': b'[ServerSettings]\n',
+		}))
+		self.assertEqual(b'backup', self.read('Saved/SavedArks/TheIsland_WP/TheIsland_WP.ark'))
+		self.assertFalse(self.exists('Saved/SavedArks/TheIsland_WP/1234.arkprofile'))
+		self.assertEqual(b'other map', self.read('Saved/SavedArks/ScorchedEarth_WP/ScorchedEarth_WP.ark'))
+
+	@needs_warlock_manager
+	def test_restores_backup_sh_layout(self):
+		self.assertTrue(self.restore({'SavedArks/TheIsland_WP/TheIsland_WP.ark': b'backup'}))
+		self.assertEqual(b'backup', self.read('Saved/SavedArks/TheIsland_WP/TheIsland_WP.ark'))
+
+	@needs_warlock_manager
+	def test_archive_without_the_map_changes_nothing(self):
+		with self.assertLogs('warlock', 'ERROR') as logs:
+			self.assertFalse(self.restore({'./save/SavedArks/ScorchedEarth_WP/ScorchedEarth_WP.ark': b'other backup'}))
+		self.assertIn('has no saves for ark-island', logs.output[0])
+		self.assertEqual(b'live', self.read('Saved/SavedArks/TheIsland_WP/TheIsland_WP.ark'))
+		self.assertTrue(self.exists('Saved/SavedArks/TheIsland_WP/1234.arkprofile'))
+
+	@needs_warlock_manager
+	def test_truncated_archive_changes_nothing(self):
+		files = {
+			'./save/SavedArks/TheIsland_WP/TheIsland_WP.ark': b'backup',
+			'./save/SavedArks/TheIsland_WP/TheIsland_WP.arktribe': os.urandom(256 * 1024),
+		}
+		with self.assertLogs('warlock', 'ERROR'):
+			self.assertFalse(self.restore(files, truncate=128 * 1024))
+		self.assertEqual(b'live', self.read('Saved/SavedArks/TheIsland_WP/TheIsland_WP.ark'))
+		self.assertTrue(self.exists('Saved/SavedArks/TheIsland_WP/1234.arkprofile'))
+		# Nothing staged is left behind
+		self.assertEqual(['SavedArks'], os.listdir(os.path.join(self.tmp, 'Saved')))
+
+
+class FakeService:
+	def __init__(self, name: str, enabled: bool = True, running: bool = True, mods: list = ()):
+		self.service = name
+		self.enabled = enabled
+		self.running = running
+		self.mods = list(mods)
+		self.started = 0
+
+	def is_enabled(self) -> bool:
+		return self.enabled
+
+	def is_stopped(self) -> bool:
+		return not self.running
+
+	def get_enabled_mod_ids(self) -> list:
+		return self.mods
+
+	def start(self):
+		self.started += 1
+
+
+class TestCutover(ScratchTestCase):
+	"""
+	First cutover, (AppFiles is still a directory), with a staged update in AppFiles.green
+	"""
+
+	def setUp(self):
+		super().setUp()
+		self.write('AppFiles/ShooterGame/Binaries/Win64/ArkAscendedServer.exe', b'old')
+		self.write('AppFiles/ShooterGame/Saved/SavedArks/TheIsland_WP/TheIsland_WP.ark', b'save')
+		self.write('AppFiles.green/ShooterGame/Binaries/Win64/ArkAscendedServer.exe', b'new')
+		self.write('AppFiles.green/.staged-update', b'12345')
+
+	def cutover(self, service: FakeService):
+		self.load()
+		game = self.manage.GameApp.__new__(self.manage.GameApp)
+		game.staged_shared_paths = ('ShooterGame/Saved',)
+		game.get_services = lambda: [service]
+		game.stop_services = lambda services: True
+		with (
+			mock.patch.object(self.manage.utils, 'get_base_directory', return_value=self.tmp),
+			mock.patch.object(self.manage.utils, 'get_app_uid', return_value=os.getuid()),
+		):
+			return game.cutover()
+
+	@needs_warlock_manager
+	def test_swaps_to_the_staged_tree(self):
+		service = FakeService('ark-island')
+		self.assertTrue(self.cutover(service))
+		self.assertTrue(os.path.islink(os.path.join(self.tmp, 'AppFiles')))
+		self.assertEqual(b'new', self.read('AppFiles/ShooterGame/Binaries/Win64/ArkAscendedServer.exe'))
+		self.assertEqual(b'save', self.read('AppFiles/ShooterGame/Saved/SavedArks/TheIsland_WP/TheIsland_WP.ark'))
+		self.assertEqual(1, service.started)
+
+	@needs_warlock_manager
+	def test_failed_swap_moves_everything_back(self):
+		service = FakeService('ark-island')
+		with mock.patch('os.symlink', side_effect=PermissionError('read-only')), self.assertRaises(PermissionError):
+			self.cutover(service)
+		self.assertFalse(os.path.islink(os.path.join(self.tmp, 'AppFiles')))
+		self.assertEqual(b'old', self.read('AppFiles/ShooterGame/Binaries/Win64/ArkAscendedServer.exe'))
+		self.assertEqual(b'save', self.read('AppFiles/ShooterGame/Saved/SavedArks/TheIsland_WP/TheIsland_WP.ark'))
+		self.assertFalse(self.exists('AppFiles.green/ShooterGame/Saved'))
+		self.assertFalse(self.exists('AppFiles.blue'))
+		# Started again against the old game files
+		self.assertEqual(1, service.started)
+
+	@needs_warlock_manager
+	def test_failed_rollback_does_not_start_the_maps(self):
+		service = FakeService('ark-island')
+		real_rename = os.rename
+
+		def rename(src, dest):
+			if os.path.basename(dest) == 'AppFiles':
+				raise PermissionError('busy')
+			real_rename(src, dest)
+
+		with (
+			mock.patch('os.symlink', side_effect=PermissionError('read-only')),
+			mock.patch('os.rename', rename),
+			self.assertRaises(PermissionError),
+			self.assertLogs('warlock', 'ERROR') as logs,
+		):
+			self.cutover(service)
+		self.assertEqual(0, service.started)
+		self.assertIn('not starting ark-island', logs.output[-1])
+
+
+class GameTestCase(ScratchTestCase):
+	"""
+	A GameApp with fake services, and an empty mod library
+	"""
+
+	def get_game(self, services: list):
+		self.load()
+		game = self.manage.GameApp.__new__(self.manage.GameApp)
+		game.get_services = lambda: services
+		game.get_option_value = lambda option: None
+		game.mod_index = self.manage.ModIndex(game)
+		for name in ('refresh_library', 'get_library_mods'):
+			patcher = mock.patch.object(self.manage.GameMod, name, return_value=[])
+			patcher.start()
+			self.addCleanup(patcher.stop)
+		return game
+
+
+class TestPrefetchMods(GameTestCase):
+	@needs_warlock_manager
+	def test_disabled_maps_are_left_out(self):
+		enabled = FakeService('ark-island', running=False, mods=['100'])
+		disabled = FakeService('ark-scorched', enabled=False, running=False, mods=['100', '200'])
+		game = self.get_game([enabled, disabled])
+		self.assertEqual(['100'], game.get_all_enabled_mod_ids())
+		self.assertEqual({'100': None}, game.get_mods_to_prefetch())
+
+	@needs_warlock_manager
+	def test_disabled_map_is_not_started_to_download(self):
+		running = FakeService('ark-island', mods=['100'])
+		disabled = FakeService('ark-scorched', enabled=False, running=False, mods=['100'])
+		game = self.get_game([running, disabled])
+		with self.assertLogs('warlock', 'WARNING'):
+			self.assertTrue(game.prefetch_mods())
+		self.assertEqual(0, disabled.started)
+
+
+class TestRestartForModUpdates(GameTestCase):
+	@needs_warlock_manager
+	def test_downloads_before_stopping_and_restarts_once(self):
+		affected = FakeService('ark-island', mods=['100'])
+		unaffected = FakeService('ark-scorched', mods=['200'])
+		game = self.get_game([affected, unaffected])
+		calls = []
+		game.get_mod_updates = lambda: {'100': 5}
+		game.prefetch_mods = lambda: calls.append('prefetch') or True
+		game.stop_services = lambda services: calls.append(('stop', [svc.service for svc in services])) or True
+		self.assertTrue(game.restart_for_mod_updates())
+		self.assertEqual(['prefetch', ('stop', ['ark-island'])], calls)
+		self.assertEqual(1, affected.started)
+		self.assertEqual(0, unaffected.started)
+
+
+class SaveService(FakeService):
+	def __init__(self, save_dir: str):
+		super().__init__('ark-island', running=False)
+		self.save_dir = save_dir
+
+	def get_save_directory(self) -> str:
+		return self.save_dir
+
+	def get_save_files(self) -> list:
+		return ['SavedArks']
+
+
+class TestChunkedBackupPrune(ScratchTestCase):
+	def get_store(self):
+		self.load()
+		game = mock.Mock()
+		game.get_services.return_value = [SaveService(os.path.join(self.tmp, 'Saved'))]
+		with mock.patch.object(self.manage.utils, 'get_base_directory', return_value=self.tmp):
+			store = self.manage.ChunkedBackup(game)
+		# Backups are named by the second they are made in
+		now = iter([datetime.datetime(2026, 10, 18, 13, 0, second) for second in range(60)])
+		patcher = mock.patch.object(self.manage, 'datetime')
+		patcher.start().datetime.now.side_effect = lambda: next(now)
+		self.addCleanup(patcher.stop)
+		return store
+
+	def get_chunks(self) -> set:
+		chunks = set()
+		for root, dirs, files in os.walk(os.path.join(self.tmp, 'backups', 'incremental', 'chunks')):
+			chunks.update(files)
+		return chunks
+
+	@needs_warlock_manager
+	def test_prune_keeps_chunks_still_in_use(self):
+		store = self.get_store()
+		shared = os.urandom(512 * 1024)
+		for version in range(3):
+			self.write('Saved/SavedArks/TheIsland_WP/TheIsland_WP.ark', shared + os.urandom(256 * 1024))
+			store.backup()
+		first = store.get_manifests()[0]
+		first_chunks = set(digest for entry in store.load_manifest(first)['files'] for digest in entry['chunks'])
+
+		self.assertEqual(1, store.prune(2))
+		self.assertEqual(2, len(store.get_manifests()))
+		self.assertNotIn(first, store.get_manifests())
+
+		used = set()
+		for name in store.get_manifests():
+			for entry in store.load_manifest(name)['files']:
+				used.update(entry['chunks'])
+		self.assertEqual(used, self.get_chunks())
+		# The chunks of the shared data were used by the removed backup too, and are kept
+		self.assertTrue(first_chunks & used)
+		self.assertTrue(first_chunks - used)
+
+		self.assertTrue(store.restore(store.get_manifests()[0]))
+
+	@needs_warlock_manager
+	def test_prune_keeps_at_least_one_backup(self):
+		store = self.get_store()
+		self.write('Saved/SavedArks/TheIsland_WP/TheIsland_WP.ark', b'save')
+		store.backup()
+		with self.assertRaises(self.manage.GameAPIException):
+			store.prune(0)
+		self.assertEqual(1, len(store.get_manifests()))
+
+
+if __name__ == '__main__':
+	unittest.main()
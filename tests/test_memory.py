@@ -0,0 +1,114 @@
+"""
+Checks of the per-map memory readings in scripts/manage.py, used by admission control and the metrics exporter
+
+scripts/manage.py requires root and the game's dependencies on import,
+so only the classes and methods under test are loaded from its source.
+"""
+import ast
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from typing import Union
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+MANAGE = os.path.join(os.path.dirname(HERE), 'scripts', 'manage.py')
+
+MEMORY_STAT = '''anon 6442450944
+file 21474836480
+kernel 104857600
+shmem 268435456
+file_mapped 8589934592
+'''
+"""
+memory.stat of a map with 6 GB of heap, 256 MB of shared memory, and 20 GB of the game files in page cache
+"""
+
+
+def load(namespace: dict) -> dict:
+	"""
+	Load Services.get_cgroup_memory, (as a plain function), and the MemoryAdmission and MetricsExporter classes
+	from scripts/manage.py
+
+	:param namespace: Globals for the loaded code
+	:return:
+	"""
+	with open(MANAGE, 'r') as f:
+		tree = ast.parse(f.read())
+	nodes = []
+	for node in tree.body:
+		if isinstance(node, ast.ClassDef) and node.name == 'Services':
+			nodes += [child for child in node.body if isinstance(child, ast.FunctionDef) and child.name == 'get_cgroup_memory']
+		elif isinstance(node, ast.ClassDef) and node.name in ('MemoryAdmission', 'MetricsExporter'):
+			nodes.append(node)
+	namespace.update({'json': json, 'os': os, 'threading': threading, 'time': time.time, 'Union': Union})
+	exec(compile(ast.Module(body=nodes, type_ignores=[]), MANAGE, 'exec'), namespace)
+	return namespace
+
+
+class FakeService:
+	def __init__(self, name: str, stats: dict):
+		self.name = name
+		self.map = 'TheIsland_WP'
+		self.stats = stats
+
+	def get_cgroup_stat(self, stat: str):
+		return self.stats.get(stat)
+
+	def get_option(self, option: str):
+		return None
+
+	def get_saved_location(self) -> str:
+		return '/nonexistent'
+
+	def is_rcon_available(self) -> bool:
+		return False
+
+
+class NoServiceStats:
+	def get(self, service, key: str):
+		return None
+
+
+class TestCgroupMemory(unittest.TestCase):
+	def setUp(self):
+		self.tmp = tempfile.mkdtemp(prefix='memory-test-')
+		self.addCleanup(shutil.rmtree, self.tmp)
+		self.namespace = load({'here': self.tmp, 'config': {'Manager': {}}, 'service_stats': NoServiceStats()})
+		# Bind the method to the fake service as Services would
+		FakeService.get_cgroup_memory = self.namespace['get_cgroup_memory']
+		self.addCleanup(delattr, FakeService, 'get_cgroup_memory')
+
+	def test_counts_anonymous_memory_only(self):
+		service = FakeService('ark-island', {'memory.stat': MEMORY_STAT, 'memory.current': '28000000000\n'})
+		self.assertEqual(6442450944 + 268435456, service.get_cgroup_memory())
+
+	def test_unavailable_without_memory_stat(self):
+		self.assertIsNone(FakeService('ark-island', {'memory.current': '28000000000\n'}).get_cgroup_memory())
+
+	def test_admission_records_and_predicts_without_page_cache(self):
+		service = FakeService('ark-island', {
+			'memory.stat': MEMORY_STAT,
+			'memory.peak': '30000000000\n',
+			'memory.current': '28000000000\n',
+		})
+		admission = self.namespace['MemoryAdmission']()
+		admission.record_peak(service)
+		self.assertEqual([6442450944 + 268435456], admission.history['ark-island'])
+		self.assertEqual(int((6442450944 + 268435456) * 1.1), admission.predict(service))
+
+	def test_metrics_report_the_same_memory_as_admission(self):
+		service = FakeService('ark-island', {
+			'cgroup.procs': '1234\n',
+			'memory.stat': MEMORY_STAT,
+			'memory.current': '28000000000\n',
+		})
+		values = self.namespace['MetricsExporter']([service], 15)._sample_service(service)
+		self.assertEqual(6442450944 + 268435456, values['ark_memory_bytes'])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,94 @@
+"""
+Startup regression checks for src/manage.py
+
+Run from the project root with the development venv, (see setup-dev.sh):
+
+	.venv/bin/python -m unittest discover tests
+"""
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+MANAGE = os.path.join(os.path.dirname(HERE), 'src', 'manage.py')
+
+DEFERRED = [
+	'tarfile',
+	'warlock_manager.formatters.cli_formatter',
+	'warlock_manager.libs.proton',
+	'warlock_manager.config.properties_config',
+]
+"""
+Modules src/manage.py only imports where they are used, and which nothing else loads on a plain start
+"""
+
+STARTUP_BUDGET = float(os.environ.get('MANAGE_STARTUP_BUDGET', '1.5'))
+"""
+Seconds a cold start of a read-only command may take, (set MANAGE_STARTUP_BUDGET for slower CI runners)
+"""
+
+WARLOCK_MANAGER = importlib.util.find_spec('warlock_manager') is not None
+
+
+def needs_warlock_manager(test):
+	"""
+	Without warlock_manager the test is expected to fail, (and is reported as such), instead of being skipped
+	"""
+	return test if WARLOCK_MANAGER else unittest.expectedFailure(test)
+
+LOADER = '''
+import json, os, runpy, sys
+sys.argv = [sys.argv[1], '--help']
+try:
+	runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+	pass
+with open(os.environ['MODULES_OUT'], 'w') as f:
+	json.dump(sorted(sys.modules), f)
+'''
+
+
+class TestStartup(unittest.TestCase):
+	def get_loaded_modules(self) -> set:
+		with tempfile.TemporaryDirectory() as tmp:
+			out = os.path.join(tmp, 'modules.json')
+			env = dict(os.environ, MANAGE_NO_DAEMON='1', MODULES_OUT=out)
+			subprocess.run(
+				[sys.executable, '-c', LOADER, MANAGE],
+				cwd=tmp, env=env, check=True,
+				stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+			)
+			with open(out, 'r') as f:
+				return set(json.load(f))
+
+	@needs_warlock_manager
+	def test_help_does_not_load_deferred_modules(self):
+		loaded = self.get_loaded_modules()
+		self.assertIn('warlock_manager.libs.app_runner', loaded)
+		self.assertEqual([], [name for name in DEFERRED if name in loaded])
+
+	@needs_warlock_manager
+	def test_cold_start_is_within_budget(self):
+		env = dict(os.environ, MANAGE_NO_DAEMON='1')
+		timings = []
+		for i in range(3):
+			start = time.perf_counter()
+			subprocess.run(
+				[sys.executable, MANAGE, '--help'],
+				env=env, check=True,
+				stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+			)
+			timings.append(time.perf_counter() - start)
+		self.assertLessEqual(
+			min(timings), STARTUP_BUDGET,
+			'Cold start took %.2f seconds, (run manage.py startup-profile to see the slowest imports)' % min(timings)
+		)
+
+
+if __name__ == '__main__':
+	unittest.main()